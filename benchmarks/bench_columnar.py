@@ -0,0 +1,80 @@
+#!/usr/bin/env python3
+"""
+列式解析基准：同一批合成的原始车次数据，分别用 _parse_train_list 逐条构造 TrainLeg 和用 columnar 转换成 NumPy 数组，
+比较载入、按车次类型和余票筛选、换乘配对的耗时；没有安装 NumPy 时跳过
+
+Usage:
+    bench_columnar.py [--rows=<n>] [--legs=<n>] [--runs=<n>] [--json]
+
+Options:
+    --rows=<n>      载入和筛选的车次条数 [default: 200000]
+    --legs=<n>      换乘配对时每段的车次数量 [default: 800]
+    --runs=<n>      运行次数，取中位数 [default: 3]
+    --json          以 JSON 格式输出结果
+"""
+
+import json
+import tempfile
+from datetime import date, timedelta
+
+from bench_parse import synthetic_rows
+from common import make_finder, quiet, timed
+# common 把 src 加入 sys.path 之后才能导入
+import columnar  # noqa: E402
+from standin import synthetic_train_list
+from transfer import join_transfers
+
+TRAIN_TYPES = 'gd'
+
+
+def run(rows=200000, legs=800, runs=3):
+    try:
+        columnar._require_numpy()
+    except ImportError:
+        return {'skipped': '没有安装 NumPy'}
+    train_date = str(date.today() + timedelta(days=1))
+    # synthetic_rows 的车次数据有上限，不够时按不同日期重复，与归档多天的查询结果类似
+    train_list = synthetic_rows(rows)
+    copies = -(-rows // len(train_list))
+    batches = [(str(date.today() + timedelta(days=day + 1)), train_list) for day in range(copies)]
+    with tempfile.TemporaryDirectory() as workdir:
+        finder = make_finder(workdir, 'http://127.0.0.1:9')
+        finder.stations
+
+        def parse():
+            with quiet():
+                return [leg for batch_date, batch in batches for leg in finder._parse_train_list(batch, batch_date)]
+
+        results = {}
+        parsed, legs_list = timed(parse, runs)
+        loaded, columns = timed(lambda: columnar.LeftTicketColumns.from_batches(batches), runs)
+        results['load'] = {'rows': len(columns), 'train_legs': parsed, 'columnar': loaded}
+        filtered, kept = timed(lambda: [leg for leg in legs_list if leg.train_number[0].lower() in TRAIN_TYPES], runs)
+        masked, kept_columns = timed(lambda: columns.filter(TRAIN_TYPES), runs)
+        results['filter'] = {'kept': [len(kept), len(kept_columns)], 'train_legs': filtered, 'columnar': masked}
+
+        with quiet():
+            first = sorted(finder._parse_train_list(synthetic_train_list('BJP', 'BTC', train_date, legs), train_date),
+                           key=lambda tr: tr.from_time)
+            second = finder._parse_train_list(synthetic_train_list('BTC', 'EEC', train_date, legs), train_date)
+        first_columns = columnar.LeftTicketColumns.from_list(synthetic_train_list('BJP', 'BTC', train_date, legs),
+                                                             train_date).filter()
+        second_columns = columnar.LeftTicketColumns.from_list(synthetic_train_list('BTC', 'EEC', train_date, legs),
+                                                              train_date).filter()
+        joined, pairs = timed(lambda: list(join_transfers(first, second)), runs)
+        vectorized, (first_index, _) = timed(lambda: columnar.join_transfers(first_columns, second_columns), runs)
+        results['join'] = {'pairs': [len(pairs), len(first_index)], 'train_legs': joined, 'columnar': vectorized}
+    return results
+
+
+if __name__ == '__main__':
+    from docopt import docopt
+
+    args = docopt(__doc__)
+    results = run(int(args['--rows']), int(args['--legs']), int(args['--runs']))
+    if args['--json'] or 'skipped' in results:
+        print(json.dumps({'benchmark': 'columnar', 'results': results}, ensure_ascii=False, indent=2))
+    else:
+        for name, result in results.items():
+            print('%-8s train_legs %10.2f ms   columnar %10.2f ms' % (
+                name, result['train_legs']['median_ms'], result['columnar']['median_ms']))
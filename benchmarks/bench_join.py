@@ -0,0 +1,58 @@
+#!/usr/bin/env python3
+"""
+中转配对耗时基准：按每段的车次数量，分别测量 join_transfers 本身的配对耗时，
+以及 change() 经替身服务查询、解析、配对、输出的完整耗时（行程段数据在第一次运行后命中本地缓存）
+
+Usage:
+    bench_join.py [--legs=<list>] [--runs=<n>] [--json]
+
+Options:
+    --legs=<list>   每段的车次数量，逗号分隔 [default: 50,200,800]
+    --runs=<n>      运行次数，取中位数 [default: 5]
+    --json          以 JSON 格式输出结果
+"""
+
+import json
+import tempfile
+from datetime import date, timedelta
+
+from common import make_finder, quiet, timed
+from standin import StandinServer, synthetic_train_list
+from transfer import join_transfers
+
+
+def run(leg_counts=(50, 200, 800), runs=5):
+    train_date = str(date.today() + timedelta(days=1))
+    results = {}
+    for count in leg_counts:
+        with tempfile.TemporaryDirectory() as workdir, StandinServer(trains_per_leg=count) as standin:
+            finder = make_finder(workdir, standin.base_url, '--rate=1000')
+            with quiet():
+                first = sorted(finder._parse_train_list(synthetic_train_list('BJP', 'BTC', train_date, count), train_date),
+                               key=lambda tr: tr.from_time)
+                second = finder._parse_train_list(synthetic_train_list('BTC', 'EEC', train_date, count), train_date)
+            join, pairs = timed(lambda: list(join_transfers(first, second)), runs)
+            join['pairs'] = len(pairs)
+
+            def change():
+                with quiet():
+                    finder.change('bj', 'bt', 'eeds', train_date)
+
+            # 第一次运行把两段行程写入缓存，不计入结果
+            change()
+            end_to_end, _ = timed(change, runs)
+            results[str(count)] = {'legs': [len(first), len(second)], 'join': join, 'change': end_to_end}
+    return results
+
+
+if __name__ == '__main__':
+    from docopt import docopt
+
+    args = docopt(__doc__)
+    results = run([int(count) for count in args['--legs'].split(',')], int(args['--runs']))
+    if args['--json']:
+        print(json.dumps({'benchmark': 'join', 'results': results}, ensure_ascii=False, indent=2))
+    else:
+        for count, result in results.items():
+            print('%6s trains/leg  %8d pairs   join %8.2f ms   change() %8.2f ms' % (
+                count, result['join']['pairs'], result['join']['median_ms'], result['change']['median_ms']))
@@ -0,0 +1,69 @@
+#!/usr/bin/env python3
+"""
+余票数据解析吞吐量基准：把合成的原始车次数据交给 _parse_train_list 解析，
+分别测量只解析，以及解析后再读取换乘配对会用到的时间字段两种情况
+
+Usage:
+    bench_parse.py [--rows=<n>] [--runs=<n>] [--json]
+
+Options:
+    --rows=<n>      每次解析的车次条数 [default: 20000]
+    --runs=<n>      运行次数，取中位数 [default: 5]
+    --json          以 JSON 格式输出结果
+"""
+
+import json
+import tempfile
+from datetime import date, timedelta
+
+from common import make_finder, quiet, timed
+from standin import synthetic_stations, synthetic_train_list
+
+
+def synthetic_rows(rows):
+    stations = [station[1] for station in synthetic_stations()]
+    train_list = []
+    for i in range(len(stations) - 1):
+        if len(train_list) >= rows:
+            break
+        train_list.extend(synthetic_train_list(stations[i], stations[i + 1], None, 100))
+    return train_list[:rows]
+
+
+def run(rows=20000, runs=5):
+    train_date = str(date.today() + timedelta(days=1))
+    train_list = synthetic_rows(rows)
+    with tempfile.TemporaryDirectory() as workdir:
+        finder = make_finder(workdir, 'http://127.0.0.1:9')
+        finder.stations
+
+        def parse():
+            with quiet():
+                return finder._parse_train_list(train_list, train_date)
+
+        def parse_and_touch():
+            trains = parse()
+            for train in trains:
+                train.from_time, train.dest_time
+            return trains
+
+        results = {}
+        for name, function in (('parse', parse), ('parse_and_times', parse_and_touch)):
+            result, trains = timed(function, runs)
+            result['rows'] = len(train_list)
+            result['legs'] = len(trains)
+            result['rows_per_second'] = round(len(train_list) / result['median_ms'] * 1000)
+            results[name] = result
+        return results
+
+
+if __name__ == '__main__':
+    from docopt import docopt
+
+    args = docopt(__doc__)
+    results = run(int(args['--rows']), int(args['--runs']))
+    if args['--json']:
+        print(json.dumps({'benchmark': 'parse', 'results': results}, ensure_ascii=False, indent=2))
+    else:
+        for name, result in results.items():
+            print('%-16s median %8.2f ms   %10d rows/s' % (name, result['median_ms'], result['rows_per_second']))
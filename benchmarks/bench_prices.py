@@ -0,0 +1,64 @@
+#!/usr/bin/env python3
+"""
+票价并发查询耗时基准：不使用缓存，经替身服务查询一组车次的票价，测量不同线程数下的总耗时，
+以及替身服务模拟限流（定期返回 HTML 错误页面）时重试带来的额外耗时
+
+Usage:
+    bench_prices.py [--trains=<n>] [--latency=<seconds>] [--runs=<n>] [--json]
+
+Options:
+    --trains=<n>            查询票价的车次数量 [default: 60]
+    --latency=<seconds>     替身服务每个请求的延迟（秒） [default: 0.05]
+    --runs=<n>              运行次数，取中位数 [default: 3]
+    --json                  以 JSON 格式输出结果
+"""
+
+import json
+import tempfile
+from datetime import date, timedelta
+
+from common import make_finder, quiet, timed
+from standin import StandinServer, synthetic_train_list
+
+SCENARIOS = (
+    ('serial', 1, 0),
+    ('workers_8', 8, 0),
+    ('workers_8_throttled', 8, 10),
+)
+
+
+def run(trains=60, latency=0.05, runs=3):
+    train_date = str(date.today() + timedelta(days=1))
+    results = {}
+    for name, workers, throttle_every in SCENARIOS:
+        with tempfile.TemporaryDirectory() as workdir, \
+                StandinServer(latency=latency, throttle_every=throttle_every) as standin:
+            finder = make_finder(workdir, standin.base_url, '--no-cache', '--rate=1000', '--workers=%d' % workers)
+            train_list = synthetic_train_list('BJP', 'BTC', train_date, trains)
+            request_params_list = [finder._price_request_params(train.split('|'), train_date) for train in train_list]
+            finder.transport.ensure_cookies()
+
+            def fetch_all():
+                with quiet():
+                    return finder.price_fetcher.fetch_all(request_params_list)
+
+            result, price_infos = timed(fetch_all, runs)
+            result.update(workers=workers, trains=trains, latency_s=latency, throttle_every=throttle_every,
+                          failed=sum(1 for price_info in price_infos if not price_info),
+                          requests=standin.counts.get('price', 0))
+            results[name] = result
+            finder.transport.close()
+    return results
+
+
+if __name__ == '__main__':
+    from docopt import docopt
+
+    args = docopt(__doc__)
+    results = run(int(args['--trains']), float(args['--latency']), int(args['--runs']))
+    if args['--json']:
+        print(json.dumps({'benchmark': 'prices', 'results': results}, ensure_ascii=False, indent=2))
+    else:
+        for name, result in results.items():
+            print('%-20s median %8.2f ms   %4d requests   %d failed' % (
+                name, result['median_ms'], result['requests'], result['failed']))
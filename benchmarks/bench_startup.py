@@ -0,0 +1,84 @@
+#!/usr/bin/env python3
+"""
+命令行启动耗时基准：--help、参数错误、以及完全命中本地缓存的查询
+缓存查询使用临时数据库，预先写入车站、余票和票价缓存，接口地址指向一个不可达的端口，保证整个过程没有网络请求
+
+Usage:
+    bench_startup.py [--runs=<n>] [--json]
+
+Options:
+    --runs=<n>      每个场景运行的次数，取中位数 [default: 10]
+    --json          以 JSON 格式输出结果
+"""
+
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import date, timedelta
+
+# common 会把 src 目录加入 sys.path，需要最先导入
+from common import ROOT, SRC, seed_stations
+from cache import ResponseCache
+from mysqlite import Sqlite
+from standin import synthetic_train_list
+
+
+def seed_database(path, train_date):
+    seed_stations(path)
+    db = Sqlite(path)
+    cache = ResponseCache(db)
+    train_list = synthetic_train_list('BJP', 'BTC', train_date, 40)
+    cache.set_left_tickets(train_date, 'BJP', 'BTC', train_list)
+    for train in train_list:
+        train_info = train.split('|')
+        cache.set_price({
+            'train_no': train_info[2], 'from_station_no': train_info[16], 'to_station_no': train_info[17],
+            'seat_types': train_info[35], 'train_date': train_date
+        }, {'O': '¥200.0'})
+    db.connect.close()
+
+
+def measure(command, runs):
+    timings = []
+    for _ in range(runs):
+        started = time.perf_counter()
+        subprocess.run(command, cwd=ROOT, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+        timings.append((time.perf_counter() - started) * 1000)
+    return {'median_ms': round(statistics.median(timings), 2), 'min_ms': round(min(timings), 2), 'runs': runs}
+
+
+def app_command(argv):
+    return [sys.executable, os.path.join(SRC, 'app.py')] + argv
+
+
+def run(runs=10):
+    train_date = str(date.today() + timedelta(days=1))
+    with tempfile.TemporaryDirectory() as workdir:
+        db_path = os.path.join(workdir, 'bench.sqlite3')
+        seed_database(db_path, train_date)
+        offline = ['--db=%s' % db_path, '--base-url=http://127.0.0.1:9']
+        # 第一次运行会生成车站快照，不计入结果
+        measure(app_command(['beijing', 'baotou', train_date] + offline), 1)
+        return {
+            # 空的 Python 进程启动耗时，作为参照
+            'python_startup': measure([sys.executable, '-c', 'pass'], runs),
+            'help': measure(app_command(['--help']), runs),
+            'bad_arguments': measure(app_command([]), runs),
+            'cached_query': measure(app_command(['beijing', 'baotou', train_date] + offline), runs),
+        }
+
+
+if __name__ == '__main__':
+    from docopt import docopt
+
+    args = docopt(__doc__)
+    results = run(int(args['--runs']))
+    if args['--json']:
+        print(json.dumps({'benchmark': 'startup', 'results': results}, ensure_ascii=False, indent=2))
+    else:
+        for name, result in results.items():
+            print('%-16s median %8.2f ms   min %8.2f ms' % (name, result['median_ms'], result['min_ms']))
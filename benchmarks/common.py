@@ -0,0 +1,51 @@
+#!/usr/bin/env python3
+"""基准测试共用的工具：临时数据库、连到替身服务的查询器实例、计时"""
+
+import contextlib
+import io
+import os
+import statistics
+import sys
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+SRC = os.path.join(ROOT, 'src')
+if SRC not in sys.path:
+    sys.path.insert(0, SRC)
+
+from app import TrainTicketsFinder  # noqa: E402
+from mysqlite import Sqlite  # noqa: E402
+from standin import synthetic_stations  # noqa: E402
+
+
+def seed_stations(db_path, stations=None):
+    """写入合成的车站数据并记录当前的车站版本，查询器启动时不会再去同步车站列表"""
+    db = Sqlite(db_path)
+    db.sync_stations_data(stations or synthetic_stations(), station_version=TrainTicketsFinder.station_version)
+    db.connect.close()
+
+
+def make_finder(workdir, base_url, *options):
+    """创建一个使用临时数据库、请求发往 base_url 的查询器"""
+    db_path = os.path.join(workdir, 'bench.sqlite3')
+    if not os.path.exists(db_path):
+        seed_stations(db_path)
+    return TrainTicketsFinder(['bj', 'bt', '--db=%s' % db_path, '--base-url=%s' % base_url] + list(options))
+
+
+@contextlib.contextmanager
+def quiet():
+    """屏蔽被测代码的进度输出"""
+    with contextlib.redirect_stdout(io.StringIO()):
+        yield
+
+
+def timed(function, runs):
+    """运行 function runs 次，返回耗时的中位数和最小值（毫秒）以及最后一次的返回值"""
+    timings = []
+    result = None
+    for _ in range(runs):
+        started = time.perf_counter()
+        result = function()
+        timings.append((time.perf_counter() - started) * 1000)
+    return {'median_ms': round(statistics.median(timings), 3), 'min_ms': round(min(timings), 3), 'runs': runs}, result
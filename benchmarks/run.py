@@ -0,0 +1,63 @@
+#!/usr/bin/env python3
+"""
+运行全部离线基准测试，结果以 JSON 输出，便于保存下来与之后的改动对比
+所有请求都发往本地的 12306 替身服务（benchmarks/standin.py），不需要网络
+
+Usage:
+    run.py [--only=<list>] [--quick] [--output=<file>]
+
+Options:
+    --only=<list>       只运行指定的基准，逗号分隔：startup,parse,join,prices,columnar
+    --quick             减少运行次数和数据量，用于快速检查
+    --output=<file>     把结果写入文件，不传则输出到标准输出
+"""
+
+import json
+import platform
+import sys
+import time
+
+import bench_columnar
+import bench_join
+import bench_parse
+import bench_prices
+import bench_startup
+
+BENCHMARKS = {
+    'startup': (lambda: bench_startup.run(10), lambda: bench_startup.run(3)),
+    'parse': (lambda: bench_parse.run(20000, 5), lambda: bench_parse.run(2000, 2)),
+    'join': (lambda: bench_join.run((50, 200, 800), 5), lambda: bench_join.run((50, 200), 2)),
+    'prices': (lambda: bench_prices.run(60, 0.05, 3), lambda: bench_prices.run(20, 0.02, 1)),
+    'columnar': (lambda: bench_columnar.run(200000, 800, 3), lambda: bench_columnar.run(20000, 200, 1)),
+}
+
+
+def run(names, quick=False):
+    report = {
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'started_at': time.strftime('%Y-%m-%dT%H:%M:%S'),
+        'quick': quick,
+        'benchmarks': {},
+    }
+    for name in names:
+        full, short = BENCHMARKS[name]
+        print('running %s ...' % name, file=sys.stderr)
+        report['benchmarks'][name] = short() if quick else full()
+    return report
+
+
+if __name__ == '__main__':
+    from docopt import docopt
+
+    args = docopt(__doc__)
+    names = args['--only'].split(',') if args['--only'] else list(BENCHMARKS)
+    unknown = [name for name in names if name not in BENCHMARKS]
+    if unknown:
+        sys.exit('未知的基准测试：%s' % ', '.join(unknown))
+    output = json.dumps(run(names, args['--quick']), ensure_ascii=False, indent=2)
+    if args['--output']:
+        with open(args['--output'], 'w', encoding='utf-8') as result_file:
+            result_file.write(output + '\n')
+    else:
+        print(output)
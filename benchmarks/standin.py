@@ -0,0 +1,213 @@
+#!/usr/bin/env python3
+"""
+本地的 12306 替身服务，用于离线测试和基准测试
+提供车站列表、cookie 初始化页面、余票查询和票价查询四个接口，数据优先取自录制的响应文件，没有时按参数确定性地生成；
+可以配置每个请求的延迟，以及模拟 12306 请求过快或 cookie 失效时返回 HTML 错误页面的行为
+
+Usage:
+    standin.py [--port=<port>] [--latency=<seconds>] [--throttle-every=<n>] [--fixtures=<file>]
+
+Options:
+    --port=<port>           监听端口 [default: 8306]
+    --latency=<seconds>     每个请求的延迟（秒） [default: 0]
+    --throttle-every=<n>    每 n 个接口请求返回一次 HTML 错误页面，0 表示不模拟限流 [default: 0]
+    --fixtures=<file>       录制的响应文件，格式见 StandinServer.load_fixtures
+"""
+
+import hashlib
+import json
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+ERROR_PAGE = '<!DOCTYPE html><html><head><title>网络可能存在问题，请您重试一下！</title></head><body></body></html>'
+
+# 车次类型前缀，与命令行的 -g/-c/-d/-k/-t/-z/-l 选项对应
+TRAIN_TYPES = 'GCDKTZL'
+SEAT_STATES = ('有', '无', '', '*', '1', '8', '20')
+
+
+def synthetic_stations(count=200):
+    """生成 count 个车站：(中文名, 电报码, 全拼, 简拼)，前几个是常用的真实车站"""
+    stations = [('北京', 'BJP', 'beijing', 'bj'), ('北京西', 'BXP', 'beijingxi', 'bjx'),
+                ('包头', 'BTC', 'baotou', 'bt'), ('呼和浩特东', 'NDC', 'huhehaotedong', 'hhhtd'),
+                ('鄂尔多斯', 'EEC', 'eerduosi', 'eeds'), ('集宁南', 'JAC', 'jiningnan', 'jnn')]
+    for i in range(len(stations), count):
+        # 站名的拼音字段只能是小写字母，编号也用字母表示
+        suffix = chr(ord('a') + i // 26 % 26) + chr(ord('a') + i % 26)
+        stations.append(('测试站%s' % chr(0x4e00 + i), 'Z' + suffix.upper(), 'ceshizhan' + suffix, 'csz' + suffix))
+    return stations
+
+
+def station_name_js(stations):
+    """按 station_name.js 的格式输出车站列表"""
+    body = ''.join('@%s|%s|%s|%s|%s|%d' % (station[3], station[0], station[1], station[2], station[3], i)
+                   for i, station in enumerate(stations))
+    return "var station_names ='%s';" % body
+
+
+def synthetic_train(train_uuid, train_number, from_station, dest_station, from_time, duration_minutes, seats,
+                    status='预订'):
+    """按余票接口的字段顺序构造一条 | 分隔的车次数据，seats 依次为 商务座、一等座、二等座、软卧、硬卧、硬座、站票"""
+    train_info = [''] * 36
+    train_info[0] = 'secret'
+    train_info[1] = status
+    train_info[2] = train_uuid
+    train_info[3] = train_number
+    train_info[4] = train_info[6] = from_station
+    train_info[5] = train_info[7] = dest_station
+    train_info[8] = from_time
+    arrival = (int(from_time[:2]) * 60 + int(from_time[3:]) + duration_minutes) % (24 * 60)
+    train_info[9] = '%02d:%02d' % divmod(arrival, 60)
+    train_info[10] = '%02d:%02d' % divmod(duration_minutes, 60)
+    train_info[16], train_info[17] = '01', '08'
+    train_info[32], train_info[31], train_info[30], train_info[23], train_info[28], train_info[29], train_info[26] = seats
+    train_info[35] = 'OM9'
+    return '|'.join(train_info)
+
+
+def synthetic_train_list(from_station, dest_station, train_date, count=None):
+    """按 (出发站, 到达站, 日期) 确定性地生成一组车次，同样的参数总是得到同样的数据"""
+    seed = int(hashlib.md5(('%s|%s' % (from_station, dest_station)).encode()).hexdigest(), 16)
+    count = count if count is not None else 20 + seed % 40
+    train_list = []
+    for i in range(count):
+        value = (seed >> (i % 64)) + i * 7919
+        train_type = TRAIN_TYPES[value % len(TRAIN_TYPES)]
+        train_number = '%s%d' % (train_type, 1 + (value // 7) % 9000)
+        from_minutes = (5 * 60 + i * 1140 // max(count, 1)) % (24 * 60)
+        seats = tuple(SEAT_STATES[(value >> shift) % len(SEAT_STATES)] for shift in range(7))
+        status = '列车停运' if value % 31 == 0 else '预订'
+        train_list.append(synthetic_train(
+            '%06X%s' % (seed % 0xFFFFFF, train_number), train_number, from_station, dest_station,
+            '%02d:%02d' % divmod(from_minutes, 60), 60 + value % 600, seats, status
+        ))
+    return train_list
+
+
+def synthetic_price(request_params):
+    seed = int(hashlib.md5(request_params.get('train_no', '').encode()).hexdigest(), 16)
+    base = 50 + seed % 500
+    return {'A9': '¥%.1f' % (base * 3), 'M': '¥%.1f' % (base * 1.6), 'O': '¥%.1f' % base,
+            'A4': '¥%.1f' % (base * 1.5), 'A3': '¥%.1f' % base, 'A1': '¥%.1f' % (base * 0.6),
+            'WZ': '¥%.1f' % (base * 0.6)}
+
+
+class StandinServer:
+
+    def __init__(self, port=0, latency=0, throttle_every=0, stations=None, trains_per_leg=None):
+        self.latency = latency
+        self.throttle_every = throttle_every
+        self.stations = stations or synthetic_stations()
+        self.trains_per_leg = trains_per_leg
+        # 录制的响应：{'leftTicket': {'日期|出发|到达': [...]}, 'price': {'train_no|from_no|to_no': {...}}}
+        self.fixtures = {'leftTicket': {}, 'price': {}}
+        self.counts = {}
+        self._api_requests = 0
+        self._lock = threading.Lock()
+        self.httpd = ThreadingHTTPServer(('127.0.0.1', port), self._handler_class())
+        self.httpd.daemon_threads = True
+        self._thread = None
+
+    @property
+    def base_url(self):
+        return 'http://127.0.0.1:%d' % self.httpd.server_port
+
+    def load_fixtures(self, path):
+        with open(path, encoding='utf-8') as fixtures:
+            data = json.load(fixtures)
+        for kind in self.fixtures:
+            self.fixtures[kind].update(data.get(kind, {}))
+
+    def start(self):
+        self._thread = threading.Thread(target=self.httpd.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self.httpd.shutdown()
+        self.httpd.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc_info):
+        self.stop()
+
+    def _count(self, endpoint):
+        with self._lock:
+            self.counts[endpoint] = self.counts.get(endpoint, 0) + 1
+            if endpoint in ('leftTicket', 'price'):
+                self._api_requests += 1
+                return self.throttle_every and self._api_requests % self.throttle_every == 0
+        return False
+
+    def respond(self, path, params, cookie):
+        """返回 (状态码, Content-Type, 响应内容, 额外的响应头)"""
+        if self.latency:
+            time.sleep(self.latency)
+        if path.endswith('/station_name.js'):
+            self._count('station')
+            return 200, 'application/javascript', station_name_js(self.stations), [('ETag', '"standin"')]
+        if path.endswith('/leftTicket/init'):
+            self._count('init')
+            return 200, 'text/html', '<html></html>', [('Set-Cookie', 'JSESSIONID=standin; Path=/')]
+        if '/leftTicket/query' in path:
+            endpoint = 'price' if path.endswith('/queryTicketPrice') else 'leftTicket'
+            throttled = self._count(endpoint)
+            if throttled or 'JSESSIONID' not in cookie:
+                return 200, 'text/html', ERROR_PAGE, []
+            if endpoint == 'price':
+                key = '%s|%s|%s' % (params.get('train_no'), params.get('from_station_no'), params.get('to_station_no'))
+                data = self.fixtures['price'].get(key) or synthetic_price(params)
+                return 200, 'application/json', json.dumps({'status': True, 'data': data}), []
+            train_date = params.get('leftTicketDTO.train_date')
+            from_station = params.get('leftTicketDTO.from_station')
+            dest_station = params.get('leftTicketDTO.to_station')
+            key = '%s|%s|%s' % (train_date, from_station, dest_station)
+            result = self.fixtures['leftTicket'].get(key)
+            if result is None:
+                result = synthetic_train_list(from_station, dest_station, train_date, self.trains_per_leg)
+            return 200, 'application/json', json.dumps({'status': True, 'data': {'result': result}}), []
+        return 404, 'text/plain', 'not found', []
+
+    def _handler_class(self):
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = 'HTTP/1.1'
+            # 响应头和响应体分两次写出，关闭 Nagle 算法避免与客户端的延迟确认叠加出额外的等待
+            disable_nagle_algorithm = True
+
+            def log_message(self, *args):
+                pass
+
+            def do_GET(self):
+                url = urlparse(self.path)
+                params = {key: values[0] for key, values in parse_qs(url.query).items()}
+                status, content_type, body, headers = server.respond(url.path, params, self.headers.get('Cookie') or '')
+                body = body.encode('utf-8')
+                self.send_response(status)
+                self.send_header('Content-Type', '%s; charset=utf-8' % content_type)
+                self.send_header('Content-Length', str(len(body)))
+                for name, value in headers:
+                    self.send_header(name, value)
+                self.end_headers()
+                self.wfile.write(body)
+
+        return Handler
+
+
+if __name__ == '__main__':
+    from docopt import docopt
+
+    args = docopt(__doc__)
+    standin = StandinServer(int(args['--port']), float(args['--latency']), int(args['--throttle-every']))
+    if args['--fixtures']:
+        standin.load_fixtures(args['--fixtures'])
+    print('12306 替身服务已启动：%s' % standin.base_url)
+    try:
+        standin.httpd.serve_forever()
+    except KeyboardInterrupt:
+        standin.stop()
@@ -3,164 +3,337 @@
 基于 Python 3.x 的命令行版 12306 火车票查询器
 
 Usage:
-    app.py (<from_city>) [<inte_city>] (<dest_city>) [<date>] [-g][-c][-d][-k][-t][-z][-l]
+    app.py <from_city> <dest_city> [<date>] [-g][-c][-d][-k][-t][-z][-l] [options]
+    app.py <from_city> <inte_city> <dest_city> [<date>] [-g][-c][-d][-k][-t][-z][-l] [options]
+    app.py --batch=<file> [-g][-c][-d][-k][-t][-z][-l] [options]
+    app.py --serve [options]
+
+Options:
+    --refresh-stations          强制重新同步车站列表
+    --db=<file>                 本地数据库文件，车站快照保存在同目录下 [default: data.sqlite3]
+    --no-cache                  不使用本地缓存的余票和票价数据
+    --min-layover=<minutes>     中转最短换乘时间（分钟） [default: 0]
+    --max-layover=<minutes>     中转最长换乘时间（分钟），不传则不限制
+    --hubs-file=<file>          从文件中读取候选中转城市，每行一个
+    --days=<n>                  中转查询的日期窗口，从乘车日期起连续查询 n 天，可以找到跨天的换乘方案
+    --top=<k>                   中转查询只输出排名前 k 的方案
+    --rank=<key>                中转方案的排序方式：total 总历时、layover 换乘时间、depart 发车时间，
+                                pareto 综合总历时、换乘时间、出发时段、余票和票价，只输出帕累托最优的方案 [default: total]
+    --depart-window=<range>     按 pareto 排序时期望的出发时段，偏离越多越差，例如 08:00-12:00
+    --pareto-depth=<n>          按 pareto 排序时，只为不看票价时前 n 层帕累托前沿上的方案查询票价 [default: 2]
+    --stream                    确定在前 k 名之内的方案立即输出（按发车时间排序时有效）
+    --auto-hubs=<n>             按本地时刻表推断中转城市，只查询排名前 n 的城市；同时给出中转城市时只在其中挑选
+    --offline                   中转查询先用本地时刻表规划候选方案，只为排名靠前的方案联网刷新余票
+    --batch=<file>              批量查询，从文件逐行读取“出发 到达 [日期]”，- 表示从标准输入读取
+    --format=<fmt>              输出格式：table 表格、stream 逐行输出的定宽彩色表格、json、csv、ndjson（jsonl 与之相同），
+                                json / csv / ndjson 不着色，提示信息写到标准错误；批量查询默认 ndjson，其它默认 table
+    --watch                     监视模式，持续轮询余票，只输出余票或换乘方案的变化
+    --interval=<seconds>        监视模式的最短轮询间隔（秒），没有变化时逐渐放慢，被限流时加倍退避 [default: 30]
+    --max-interval=<seconds>    监视模式的最长轮询间隔（秒），默认为最短间隔的 8 倍
+    --serve                     启动常驻查询服务，车站索引、cookie、数据库和刚查过的余票常驻内存
+    --listen=<addr>             常驻查询服务监听的地址 [default: 127.0.0.1:8307]
+    --server=<url>              直达和中转查询交给已启动的常驻查询服务，例如 127.0.0.1:8307，
+                                默认读取环境变量 TRAIN12306_SERVER
+    --workers=<n>               并发查询余票和票价的线程数 [default: 8]
+    --rate=<n>                  每秒最多发出的余票和票价请求数 [default: 10]
+    --timeout=<seconds>         单次请求的超时时间（秒） [default: 10]
+    --base-url=<url>            12306 接口地址，可指向本地的替身服务，默认读取环境变量 TRAIN12306_BASE_URL，
+                                都没有时使用 https://kyfw.12306.cn
+    --profile                   结束时在标准错误输出各阶段耗时、接口延迟分布、重试次数和缓存命中率
+    --profile-json=<file>       把上述统计结果以 JSON 格式写入文件
 """
 
+import json
+import math
+import os
+import random
 import re
 import sys
 import time
 from datetime import date, datetime, timedelta
-from json import JSONDecodeError
 
-import requests
 from docopt import docopt
-from prettytable import PrettyTable
 
 import colortext
+from batch import BatchRunner
+from cache import ResponseCache
+from fetcher import PriceFetcher, TokenBucket
+from hubs import HubFinder
+from instrument import Profiler
 from mysqlite import Sqlite
+from pareto import ParetoRanking, parse_window
+from render import FORMATS, MACHINE_FORMATS, BoxTable, create_renderer, train_record, transfer_record
+from stationindex import StationIndex
+from timetable import OfflinePlanner, Timetable
+from trainleg import (DEST_STATION, DEST_TIME, DURATION, EDZ, FROM_STATION, FROM_STATION_NO, FROM_TIME, RW,
+                      SEAT_TYPES, SWZ, TO_STATION_NO, TRAIN_NUMBER, TRAIN_UUID, WZ, YDZ, YW, YZ, TrainLeg, is_available,
+                      is_stopped)
+from transfer import RANK_KEYS, STREAM_BOUNDS, TopK, join_transfers, merge_joins
+from transport import ThrottledError, Transport, TransportError
+from watch import Watcher
+
+
+# 列车类型选项，与车次号的首字母对应
+TRAIN_TYPE_OPTIONS = ('-g', '-c', '-d', '-k', '-t', '-z', '-l')
 
 
 class TrainTicketsFinder:
 
-    def __init__(self):
+    # 当前使用的 12306 车站列表版本
+    station_version = '1.9181'
+    # 各接口相对于 --base-url 的路径
+    station_api = '/otn/resources/js/framework/station_name.js'
+    tickets_api = '/otn/leftTicket/queryT'
+    price_api = '/otn/leftTicket/queryTicketPrice'
+    # 直达查询被限流或连接失败时的重试次数
+    left_ticket_retries = 2
+
+    def __init__(self, argv=None, lazy=True, args=None):
+        """
+        lazy - 延迟初始化，车站同步和 cookie 获取都推迟到第一次真正需要时；为 False 时在构造时就完成这些联网准备工作
+        args - 已经由 _parse_args 解析好的命令行参数，传入时不再解析 argv
+        """
         # 解析命令行参数
-        self.args = docopt(__doc__)
-        # 指定 requests 响应编码
-        self.response_encoding = 'utf-8'
-        # 每次接口请求间隔时间限制，防止请求过快被返回异常
-        self.request_interval_seconds = 1
+        self.args = args or self._parse_args(argv)
+        # 运行过程的性能统计，--profile / --profile-json 时启用，作为库使用时也可以通过 self.profiler.add_hook 启用
+        self.profiler = Profiler(enabled=bool(self.args['--profile'] or self.args['--profile-json']))
+        # 输出格式，json / csv / ndjson 时标准输出只有数据，提示信息改写到标准错误
+        self.output_format = self.args['--format'] or ('ndjson' if self.args['--batch'] else 'table')
+        self.machine_output = self.output_format in MACHINE_FORMATS
+        self._renderer = None
+        self._leg_dicts = None
+        # 按 pareto 排序时各行程段的最低票价，输出方案时一并显示
+        self._fares = None
+        # 并发查询的线程数
+        self.workers = int(self.args['--workers'])
+        # 所有请求共用一个传输层，复用连接并统一管理 cookie
+        # 接口地址可以用 --base-url 或环境变量 TRAIN12306_BASE_URL 指向本地的替身服务
+        self.transport = Transport(
+            base_url=self.args['--base-url'] or os.environ.get('TRAIN12306_BASE_URL') or Transport.DEFAULT_BASE_URL,
+            pool_size=self.workers,
+            timeout=float(self.args['--timeout']),
+            profiler=self.profiler
+        )
+        # 所有余票和票价请求共享一个令牌桶限速，防止请求过快被返回异常
+        self.rate_limiter = TokenBucket(rate=float(self.args['--rate']))
         # 不支持的坐席类别用下面的符号表示
         self.unsupported_seat = ""# colortext.light_yellow('×')
         # 初始化数据库并创建数据表
-        self.db = Sqlite('data.sqlite3')
-        # 获取并加载全国火车站站名信息
-        self.fetch_all_station_names()
-        # 尝试获取 12306 网站 cookie
-        self.cookies = requests.get('https://kyfw.12306.cn/otn/leftTicket/init?linktypeid=dc').cookies
-        self.tickets_api = 'https://kyfw.12306.cn/otn/leftTicket/queryT'
-
-    def fetch_all_station_names(self):
-        """获取全国火车站站名信息，在 12306 网站上是以下面的 JavaScript 链接直接写死了返回来的"""
-        # if self.db.select_one_from(self.db.table_name_station) is None:
-        response = requests.get('https://kyfw.12306.cn/otn/resources/js/framework/station_name.js?station_version=1.9181')
+        self.db = Sqlite(self.args['--db'])
+        # 余票和票价的本地缓存，--no-cache 时每次都直接请求接口
+        self.cache = ResponseCache(self.db, enabled=not self.args['--no-cache'], profiler=self.profiler)
+        # 查询过的车次时刻写入本地时刻表，供离线规划中转方案使用
+        self.timetable = Timetable(self.db)
+        # 车站信息一次性加载到内存索引，后续按名字解析车站不再访问数据库，见 self.stations
+        self._stations = None
+        self.station_snapshot = os.path.splitext(self.db.path)[0] + '.stations.json'
+        if self.args['--refresh-stations']:
+            self.fetch_all_station_names(force=True)
+        if not lazy:
+            # 同步全国火车站站名信息，本地已是当前版本时不发请求
+            self.fetch_all_station_names()
+            # 尝试获取 12306 网站 cookie，之后 cookie 失效时由传输层自动刷新
+            self.transport.ensure_cookies()
+        self.price_fetcher = PriceFetcher(
+            self.transport,
+            self.price_api,
+            self.rate_limiter,
+            max_workers=self.workers,
+            cache=self.cache,
+            profiler=self.profiler
+        )
+
+    @staticmethod
+    def _parse_args(argv=None):
+        """
+        解析命令行参数
+        三个位置参数时 docopt 会优先按 <from_city> <dest_city> <date> 解析，第三个参数不是日期时视为中转查询
+        """
+        args = docopt(__doc__, argv=argv)
+        if args['<inte_city>'] is None and args['<date>'] and not re.match(r'^\d{4}-\d{2}-\d{2}$', args['<date>']):
+            args['<inte_city>'], args['<dest_city>'], args['<date>'] = args['<dest_city>'], args['<date>'], None
+        return args
+
+    def _info(self, *values):
+        """输出提示信息，输出格式是给程序读取的数据时写到标准错误"""
+        print(*values, file=sys.stderr if self.machine_output else sys.stdout)
+
+    @property
+    def stations(self):
+        """车站索引在第一次用到时才加载：优先读取本地快照，快照不存在或版本不一致时读数据库，必要时再联网同步"""
+        if self._stations is None:
+            with self.profiler.phase('stations'):
+                self._stations = StationIndex.load_snapshot(self.station_snapshot, self.station_version)
+                if self._stations is None:
+                    self.fetch_all_station_names()
+        return self._stations
+
+    def fetch_all_station_names(self, force=False):
+        """
+        获取全国火车站站名信息，在 12306 网站上是以下面的 JavaScript 链接直接写死了返回来的
+        本地记录了已同步的 station_version，版本一致时直接使用本地数据；
+        强制刷新时带上 ETag / Last-Modified 做条件请求，只把有变化的车站写回数据库
+        同步完成后写出车站快照，下次启动直接读取快照
+        """
+        if self._stations is None:
+            self._stations = StationIndex.from_db(self.db)
+        synced_version = self.db.get_meta('station_version')
+        if not force and synced_version == self.station_version and len(self._stations):
+            self._stations.save_snapshot(self.station_snapshot, self.station_version)
+            return
+
+        headers = {}
+        if synced_version == self.station_version:
+            etag = self.db.get_meta('station_etag')
+            last_modified = self.db.get_meta('station_last_modified')
+            if etag:
+                headers['If-None-Match'] = etag
+            if last_modified:
+                headers['If-Modified-Since'] = last_modified
+        try:
+            response = self.transport.get(self.station_api,
+                                          params={'station_version': self.station_version}, headers=headers)
+        except (TransportError, OSError) as error:
+            self._info(colortext.light_red('[ERROR] 同步车站列表失败：%s' % error))
+            sys.exit(1)
         # response = requests.get('https://www.12306.cn/index/script/core/common/station_name_v10115.js')
-        response.encoding = self.response_encoding
+        if response.status_code == 304:
+            self._stations.save_snapshot(self.station_snapshot, self.station_version)
+            return
         if response.ok:
             stations = re.findall(r'([\u4e00-\u9fa5]+)\|([A-Z]+)\|([a-z]+)\|([a-z]+)', response.text)
-            self.db.batch_insert_stations_data(stations)
+            if not stations:
+                return
+            # 只写入新增或有变化的车站，并删除新列表里已经没有的车站
+            changed = [station for station in stations if self._stations.by_en.get(station[1]) != station]
+            removed = set(self._stations.by_en) - {station[1] for station in stations}
+            synced = self.db.sync_stations_data(
+                changed, removed,
+                station_version=self.station_version,
+                station_etag=response.headers.get('ETag'),
+                station_last_modified=response.headers.get('Last-Modified')
+            )
+            if synced and (changed or removed):
+                self._stations = StationIndex.from_db(self.db)
+            if synced:
+                self._stations.save_snapshot(self.station_snapshot, self.station_version)
+
+    def _fetch_train_list(self, from_station_en, dest_station_en, train_date):
+        """查询两站之间的余票，同 _load_train_list，查询失败时提示后退出"""
+        try:
+            train_list = self._load_train_list(from_station_en, dest_station_en, train_date,
+                                               retries=self.left_ticket_retries)
+        except ThrottledError as error:
+            # 刷新 cookie 并退避重试之后接口仍然返回 HTML 错误页面
+            self._info(colortext.light_red('[ERROR] 请求被 12306 限流或 cookie 已失效，请稍后再试\n%s' % error))
+            sys.exit(1)
+        except (TransportError, OSError) as error:
+            # 连接失败、超时（requests 的 ConnectionError / Timeout 都是 OSError）与接口返回错误状态码一样处理
+            self._info("没有得到信息--zty")
+            self._info(colortext.light_red('[ERROR] %s' % error))
+            sys.exit(1)
+        self._info(colortext.light_green('\n车次及余票信息查询成功，正在查询票价数据...\n'))
+        return train_list
+
+    def _load_train_list(self, from_station_en, dest_station_en, train_date, retries=0, backoff_seconds=0.5):
+        """
+        查询两站之间的余票，返回以 | 分隔的原始车次数据列表，短时间内的重复查询直接使用本地缓存
+        被限流或连接失败时按带抖动的指数退避最多重试 retries 次，仍然失败则抛出 ThrottledError / TransportError / OSError
+        """
+        train_list = self.cache.get_left_tickets(train_date, from_station_en, dest_station_en)
+        if train_list is not None:
+            return train_list
+        for attempt in range(retries + 1):
+            try:
+                train_list = self._request_train_list(from_station_en, dest_station_en, train_date) or []
+                break
+            except (ThrottledError, OSError):
+                if attempt == retries:
+                    raise
+                self.profiler.count('left_ticket.retry')
+                time.sleep(random.uniform(0, backoff_seconds * 2 ** attempt))
+        self._store_train_list(from_station_en, dest_station_en, train_date, train_list)
+        return train_list
+
+    def _store_train_list(self, from_station_en, dest_station_en, train_date, train_list):
+        """
+        把联网得到的余票写入缓存，同时把车次时刻记入本地时刻表
+        只在写缓存时记录：缓存有效期内的重复查询不必重写时刻表，盯票轮询只看余票变化也不记录
+        """
+        self.cache.set_left_tickets(train_date, from_station_en, dest_station_en, train_list)
+        with self.profiler.phase('timetable'):
+            self.timetable.record(from_station_en, dest_station_en, train_date, train_list or [])
+
+    def _request_train_list(self, from_station_en, dest_station_en, train_date):
+        """不经过缓存直接请求余票接口，失败时抛出 TransportError / ThrottledError，由调用方决定如何处理"""
+        with self.profiler.phase('rate_limit_wait'):
+            self.rate_limiter.acquire()
+        request_params = {
+            'leftTicketDTO.train_date': train_date,
+            'leftTicketDTO.from_station': from_station_en,
+            'leftTicketDTO.to_station': dest_station_en,
+            'purpose_codes': 'ADULT'
+        }
+        response_json = self.transport.get_json(self.tickets_api, params=request_params)
+        return response_json.get('data').get('result')
+
+    def _submit_legs(self, executor, legs):
+        """把去重后的行程段提交到线程池，返回 {(出发电报码, 到达电报码, 乘车日期): Future}"""
+        keys = dict.fromkeys(
+            (self._get_station_name(from_city)[1], self._get_station_name(dest_city)[1], self._check_train_date(train_date))
+            for from_city, dest_city, train_date in legs
+        )
+        return {key: executor.submit(self.query_train_time_tickets, *key) for key in keys}
 
     def _get_station_name(self,city):
-        station_en = self.db.select_station_name_en(city)
-        if station_en is None:
-            station_cn = self.db.select_station_name_cn(city)
-            if station_cn is None:
-                print(colortext.light_red('\n参数错误：出发城市 [%s] 不是一个正确的城市名' % city))
-                sys.exit(1)
-            return station_cn,city
-        return city, station_en
+        stations = self.stations
+        with self.profiler.phase('lookup'):
+            station = stations.resolve(city)
+        if station is None:
+            self._info(colortext.light_red('\n参数错误：出发城市 [%s] 不是一个正确的城市名' % city))
+            candidates = self.stations.prefix(city)
+            if candidates:
+                self._info('你是不是要找：%s' % '、'.join(candidate.name_cn for candidate in candidates))
+            sys.exit(1)
+        return station
 
     def query_train_time_tickets(self, from_city, dest_city, train_date):
         """
             返回两站之间火车信息
         """
-        trains = []
-
         f_station_cn,f_station_en = self._get_station_name(from_city)
         d_station_cn,d_station_en = self._get_station_name(dest_city)
 
-        # 检查输入的乘车日期是否正确
-        today_date_str = str(date.today())
-        train_date = train_date or today_date_str
-        is_date = re.match(r'^(2\d{3}-\d{2}-\d{2})$', train_date)
-        train_date_ymd = train_date.split('-')
-        if not is_date or int(train_date_ymd[1]) > 12 or int(train_date_ymd[2]) > 31 or train_date < today_date_str:
-            print(colortext.light_yellow('\n参数错误：乘车日期 [%s] 不正确，将自动查询今天的车次信息' % train_date))
-            train_date = today_date_str
-        api = self.tickets_api
-        request_params = {
-            'leftTicketDTO.train_date': train_date,
-            'leftTicketDTO.from_station': f_station_en,
-            'leftTicketDTO.to_station': d_station_en,
-            'purpose_codes': 'ADULT'
-        }
-        try:
-            response = requests.get(api, params=request_params, cookies=self.cookies)
-            if (not response.ok) or response.status_code != 200:
-                print("没有得到信息--zty")
-                sys.exit()
-            response_json = response.json()
-            train_list = response_json.get('data').get('result')
-            print(colortext.light_green('\n车次及余票信息查询成功，正在查询票价数据...\n'))
-        except JSONDecodeError:
-            print(colortext.light_red('[ERROR] JSON解析异常，可能是旧的请求API发生变化\n%s' % api))
-
-        for idx, train in enumerate(train_list):
-            '''
-            按 12306 现有的接口，返回的数据是一个列表，单条数据是以 | 分隔的字符串
-            在分析这里的数据时，我是靠规律和基本猜测确定对应数据在哪个字段上的
-            不知道官方接口为什么要这样返回数据，防止爬虫？感觉这样也防不住啊！
-            '''
-            # print(f"find {idx}/{len(train_list)}")
-            train_info = train.split('|')
-
-            tickets_remain = {
-                'swz': train_info[32] or self.unsupported_seat,  # 商务座/特等座余票
-                'ydz': train_info[31] or self.unsupported_seat,  # 一等座余票
-                'edz': train_info[30] or self.unsupported_seat,  # 二等座余票
-                'rw': train_info[23] or self.unsupported_seat,  # 软卧余票
-                'yw': train_info[28] or self.unsupported_seat,  # 硬卧余票
-                'yz': train_info[29] or self.unsupported_seat,  # 硬座余票
-                'wz': train_info[26] or self.unsupported_seat  # 站票余票
-            }
-            go_flag= False
-            if train_info[1] == '列车停运':
-                print(f' [{train_info[3]}] 在[{train_date}] 停运')
-                continue
-            for item in tickets_remain.values():
-                if "有" in item:
-                    go_flag = True
-                    break
-                if bool(re.search(r'\d',item)):
-                    go_flag = True
-                    break
-            if go_flag:
-                duration=timedelta(hours=int(train_info[10].split(":")[0]),minutes=int(train_info[10].split(":")[1]))
-                from_time = datetime.strptime(train_date+"-"+train_info[8],"%Y-%m-%d-%H:%M")
-                start_station,start_station_e = self._get_station_name(train_info[4])
-                end_station, end_station_e = self._get_station_name(train_info[5])
-                from_station,from_station_e  = self._get_station_name(train_info[6])
-                dest_station, dest_station_e = self._get_station_name(train_info[7])
-
-                trains.append({
-                    "train_number" :train_info[3],
-
-                    "start_station_e": start_station_e,
-                    "start_station":start_station,
-                    "end_station": end_station,
-                    "end_station_e":end_station_e,
-                    "from_station":from_station,
-                    "from_station_e" : from_station_e,
-                    # 到达车站
-                    "dest_station":dest_station,
-                    "dest_station_e" : dest_station_e,
-                    # 发车时间
-                    "from_time" : from_time,
-                    # 到达时间
-                    "dest_time" : from_time+duration,
-                    "dest_time_check":train_info[9],
-                    "duration" : duration,
-
-                    "tickets_remain" : tickets_remain,
-
-                    "train_uuid" : train_info[2],
-                    "from_station_no" : train_info[16],
-                    "to_station_no" : train_info[17],
-                    "seat_types" : train_info[35]
-                })
-        print(f"从{f_station_cn}到{d_station_cn}共 {len(trains)}/{len(train_list)}趟列车")
+        train_date = self._check_train_date(train_date)
+        train_list = self._fetch_train_list(f_station_en, d_station_en, train_date)
+        trains = self._parse_train_list(train_list, train_date)
+        self._info(f"从{f_station_cn}到{d_station_cn}共 {len(trains)}/{len(train_list)}趟列车")
         return len(trains),len(train_list),trains
 
-
+    def _parse_train_list(self, train_list, train_date, report_stopped=True):
+        """
+        解析余票接口返回的原始车次数据，跳过停运和没有余票的车次
+        report_stopped - 是否打印停运的车次，批量查询的结果直接写到标准输出，不能混入这些提示
+        """
+        trains = []
+        stations = self.stations
+        # 乘车日期只解析一次，每趟车的发车时间在需要时再由它推算
+        day = datetime.strptime(train_date, '%Y-%m-%d')
+        with self.profiler.phase('parse'):
+            for train in train_list:
+                '''
+                按 12306 现有的接口，返回的数据是一个列表，单条数据是以 | 分隔的字符串
+                在分析这里的数据时，我是靠规律和基本猜测确定对应数据在哪个字段上的
+                不知道官方接口为什么要这样返回数据，防止爬虫？感觉这样也防不住啊！
+                '''
+                train_info = train.split('|')
+                if is_stopped(train_info):
+                    if report_stopped:
+                        self._info(f' [{train_info[TRAIN_NUMBER]}] 在[{train_date}] 停运')
+                    continue
+                if is_available(train_info):
+                    trains.append(TrainLeg(train, train_info, day, stations))
+        return trains
 
     def query_satisfied_trains_info(self):
         """
@@ -171,144 +344,104 @@ class TrainTicketsFinder:
         purpose_codes - 普通票或学生票，普通票传值为 ADULT
         """
         from_city, _, dest_city, from_station_en,_, dest_station_en, train_date, need_filter = self._check_input_args()
-        api = self.tickets_api
-        request_params = {
-            'leftTicketDTO.train_date': train_date,
-            'leftTicketDTO.from_station': from_station_en,
-            'leftTicketDTO.to_station': dest_station_en,
-            'purpose_codes': 'ADULT'
-        }
-        response = requests.get(api, params=request_params, cookies=self.cookies)
+        train_list = self._fetch_train_list(from_station_en, dest_station_en, train_date)
 
-        if response.ok:
-            if response.status_code!=200:
-                print("没有得到信息--zty")
-                sys.exit()
-            try:
-                response_json = response.json()
-                train_list = response_json.get('data').get('result')
-                print(colortext.light_green('\n车次及余票信息查询成功，正在查询票价数据...\n'))
-            except JSONDecodeError:
-                print(colortext.light_red('[ERROR] JSON解析异常，可能是旧的请求API发生变化\n%s' % api))
-                sys.exit()
-
-            result_table = PrettyTable()
-            table_header = ['车次', '车站', '时间', '历时', '商务座/特等座', '一等座', '二等座', '软卧', '硬卧', '硬座', '站票']
-            result_table.field_names = table_header
-
-            # 遍历查询到的全部车次信息
-            satisfied_train_count = 0
-            for idx,train in enumerate(train_list):
-                '''
-                按 12306 现有的接口，返回的数据是一个列表，单条数据是以 | 分隔的字符串
-                在分析这里的数据时，我是靠规律和基本猜测确定对应数据在哪个字段上的
-                不知道官方接口为什么要这样返回数据，防止爬虫？感觉这样也防不住啊！
-                '''
-                print(f"find {idx}/{len(train_list)}")
-                train_info = train.split('|')
-                train_number, station, train_time, duration = self._format_train_info_fields(train_info)
-
-                # 根据输入参数过滤列车类型
-                current_train_type = '-' + train_number[0].lower()
-                if not need_filter or self.args[current_train_type] is True:
-                    # 跳过【停运列车】的数据查询
-                    if train_info[1] != '列车停运':
-                        satisfied_train_count += 1
-                        # 余票及对应票价
-                        tickets_and_prices = self._query_train_tickets_and_prices(train_info, train_date)
-                        result_table.add_row([
-                            train_number, station, train_time, duration, tickets_and_prices['swz'],
-                            tickets_and_prices['ydz'], tickets_and_prices['edz'], tickets_and_prices['rw'],
-                            tickets_and_prices['yw'], tickets_and_prices['yz'], tickets_and_prices['wz']
-                        ])
-
-            # 打印数据结果
-            train_date = colortext.light_yellow(train_date)
-            from_city = colortext.light_green(self.db.select_station_name_cn(from_station_en))
-            dest_city = colortext.light_red(self.db.select_station_name_cn(dest_station_en))
-            train_count = colortext.light_blue(satisfied_train_count)
-            print('\n查询到满足条件的 %s 从 %s 到 %s 的列车一共 %s 趟（已过滤掉停运列车数据）\n' % (
-                train_date, from_city, dest_city, train_count
-            ))
-            print(result_table)
+        # 遍历查询到的全部车次信息，先筛出满足条件的车次，再统一并发查询票价
+        satisfied_trains = []
+        for idx,train in enumerate(train_list):
+            '''
+            按 12306 现有的接口，返回的数据是一个列表，单条数据是以 | 分隔的字符串
+            在分析这里的数据时，我是靠规律和基本猜测确定对应数据在哪个字段上的
+            不知道官方接口为什么要这样返回数据，防止爬虫？感觉这样也防不住啊！
+            '''
+            if self.output_format == 'table':
+                self._info(f"find {idx}/{len(train_list)}")
+            train_info = train.split('|')
+
+            # 根据输入参数过滤列车类型
+            current_train_type = '-' + train_info[TRAIN_NUMBER][0].lower()
+            if not need_filter or self.args[current_train_type] is True:
+                # 跳过【停运列车】的数据查询
+                if not is_stopped(train_info):
+                    satisfied_trains.append(train_info)
+
+        # 余票及对应票价，票价结果与车次顺序一致
+        with self.profiler.phase('prices'):
+            price_infos = self.price_fetcher.fetch_all(
+                [self._price_request_params(train_info, train_date) for train_info in satisfied_trains]
+            )
+        with self.profiler.phase('render'):
+            if self.output_format == 'table':
+                self._print_trains_table(satisfied_trains, price_infos, train_date, from_station_en, dest_station_en)
+            else:
+                renderer = create_renderer(self.output_format, 'trains')
+                for train_info, price_info in zip(satisfied_trains, price_infos):
+                    renderer.row(train_record(train_info, price_info, self.stations))
+                renderer.close()
+
+    def _print_trains_table(self, satisfied_trains, price_infos, train_date, from_station_en, dest_station_en):
+        """用带边框的表格输出直达查询的结果"""
+        table_header = ['车次', '车站', '时间', '历时', '商务座/特等座', '一等座', '二等座', '软卧', '硬卧', '硬座', '站票']
+        result_table = BoxTable(table_header)
+        for train_info, price_info in zip(satisfied_trains, price_infos):
+            tickets_and_prices = self._format_tickets_and_prices(train_info, price_info)
+            result_table.add_row(list(self._format_train_info_fields(train_info)) + [
+                tickets_and_prices['swz'], tickets_and_prices['ydz'], tickets_and_prices['edz'],
+                tickets_and_prices['rw'], tickets_and_prices['yw'], tickets_and_prices['yz'],
+                tickets_and_prices['wz']
+            ])
+        satisfied_train_count = len(satisfied_trains)
+
+        # 打印数据结果
+        train_date = colortext.light_yellow(train_date)
+        from_city = colortext.light_green(self.stations.name_cn(from_station_en))
+        dest_city = colortext.light_red(self.stations.name_cn(dest_station_en))
+        train_count = colortext.light_blue(satisfied_train_count)
+        print('\n查询到满足条件的 %s 从 %s 到 %s 的列车一共 %s 趟（已过滤掉停运列车数据）\n' % (
+            train_date, from_city, dest_city, train_count
+        ))
+        print(result_table)
 
     def _format_train_info_fields(self, train_info):
         # 车次
-        train_number = train_info[3]
+        train_number = train_info[TRAIN_NUMBER]
         # 出发车站
-        from_station_cn = colortext.light_green(self.db.select_station_name_cn(train_info[6]))
+        from_station_cn = colortext.light_green(self.stations.name_cn(train_info[FROM_STATION]))
         # 到达车站
-        dest_station_cn = colortext.light_red(self.db.select_station_name_cn(train_info[7]))
+        dest_station_cn = colortext.light_red(self.stations.name_cn(train_info[DEST_STATION]))
         station = from_station_cn + '\n' + dest_station_cn
         # 发车时间
-        from_time = colortext.light_green(train_info[8])
+        from_time = colortext.light_green(train_info[FROM_TIME])
         # 到达时间
-        dest_time = colortext.light_red(train_info[9])
+        dest_time = colortext.light_red(train_info[DEST_TIME])
         train_time = from_time + '\n' + dest_time
         # 历时多久
-        duration = train_info[10]
+        duration = train_info[DURATION]
 
         return train_number, station, train_time, duration
 
-    def _query_train_tickets_and_prices(self, train_info, train_date):
-        """整理余票数据，查询各个坐席的票价"""
-
-        # 查询票价需要用到的请求参数
-        train_uuid = train_info[2]
-        from_station_no = train_info[16]
-        to_station_no = train_info[17]
-        seat_types = train_info[35]
-
-        api = 'https://kyfw.12306.cn/otn/leftTicket/queryTicketPrice'
-        request_params = {
-            'train_no': train_uuid,
-            'from_station_no': from_station_no,
-            'to_station_no': to_station_no,
-            'seat_types': seat_types,
+    def _price_request_params(self, train_info, train_date):
+        """查询票价需要用到的请求参数"""
+        return {
+            'train_no': train_info[TRAIN_UUID],
+            'from_station_no': train_info[FROM_STATION_NO],
+            'to_station_no': train_info[TO_STATION_NO],
+            'seat_types': train_info[SEAT_TYPES],
             'train_date': train_date
         }
-        response = requests.get(api, params=request_params, cookies=self.cookies)
 
+    def _format_tickets_and_prices(self, train_info, price_info):
+        """将余票数据与票价拼到一起，用于表格显示"""
         tickets_and_prices = {
-            'swz': train_info[32] or self.unsupported_seat,  # 商务座/特等座余票
-            'ydz': train_info[31] or self.unsupported_seat,  # 一等座余票
-            'edz': train_info[30] or self.unsupported_seat,  # 二等座余票
-            'rw': train_info[23] or self.unsupported_seat,  # 软卧余票
-            'yw': train_info[28] or self.unsupported_seat,  # 硬卧余票
-            'yz': train_info[29] or self.unsupported_seat,  # 硬座余票
-            'wz': train_info[26] or self.unsupported_seat  # 站票余票
+            'swz': train_info[SWZ] or self.unsupported_seat,  # 商务座/特等座余票
+            'ydz': train_info[YDZ] or self.unsupported_seat,  # 一等座余票
+            'edz': train_info[EDZ] or self.unsupported_seat,  # 二等座余票
+            'rw': train_info[RW] or self.unsupported_seat,  # 软卧余票
+            'yw': train_info[YW] or self.unsupported_seat,  # 硬卧余票
+            'yz': train_info[YZ] or self.unsupported_seat,  # 硬座余票
+            'wz': train_info[WZ] or self.unsupported_seat  # 站票余票
         }
 
-        # if response.ok:
-        #     '''
-        #     通过测试和观察，查询车票请求频率过快时会大概率导致请求失败，从而得到错误页面而不是正确的响应
-        #     所以此处暂时以简单的方式做一个请求频率限制，每请求成功一次睡眠几秒钟，以此来规避请求异常问题
-        #     '''
-        #     if response.status_code!=200:
-        #         print("没有得到价格--zty")
-        #         sys.exit()
-        #
-            # time.sleep(self.request_interval_seconds)
-        request_interval_seconds = 0
-        while (True):
-            try:
-                response = requests.get(api, params=request_params, cookies=self.cookies)
-                if (not response.ok) or response.status_code != 200:
-                    print("没有得到价格--zty")
-                    break
-                    # sys.exit()
-                time.sleep(request_interval_seconds if request_interval_seconds > 1 else 0)
-                response_json = response.json()
-                price_info = response_json.get('data')
-                print('编号为 %s 的列车票价请求成功' % (train_info[3]))
-                break
-            except JSONDecodeError:
-                print(colortext.light_red(f'[ERROR] {train_info[3]}  JSON解析异常，可能是请求参数异常\n{request_params} ，'
-                                          f'{ request_interval_seconds} 秒后执行下一次车票查询请求'))
-
-                request_interval_seconds +=1
-
-
         tickets_and_prices['swz'] += '\n' + colortext.light_yellow(price_info.get('A9', ''))
         tickets_and_prices['ydz'] += '\n' + colortext.light_yellow(price_info.get('M', ''))
         tickets_and_prices['edz'] += '\n' + colortext.light_yellow(price_info.get('O', ''))
@@ -327,46 +460,55 @@ class TrainTicketsFinder:
         dest_city = self.args['<dest_city>']
 
         # 检查输入的城市名是否正确
-        from_station_en = self.db.select_station_name_en(from_city)
+        from_station_en = self.stations.name_en(from_city)
         if from_station_en is None:
-            print(colortext.light_red('\n参数错误：出发城市 [%s] 不是一个正确的城市名' % from_city))
+            self._info(colortext.light_red('\n参数错误：出发城市 [%s] 不是一个正确的城市名' % from_city))
             sys.exit(1)
 
-        dest_station_en = self.db.select_station_name_en(dest_city)
+        dest_station_en = self.stations.name_en(dest_city)
         if dest_station_en is None:
-            print(colortext.light_red('\n参数错误：到达城市 [%s] 不是一个正确的城市名' % dest_city))
+            self._info(colortext.light_red('\n参数错误：到达城市 [%s] 不是一个正确的城市名' % dest_city))
             sys.exit(1)
 
-        internal_station_en = self.db.select_station_name_en(internal_city)
-        if internal_station_en is None:
-            print(colortext.light_red('\n参数错误：到达城市 [%s] 不是一个正确的城市名' % internal_city))
+        internal_station_en = internal_city and self.stations.name_en(internal_city)
+        if internal_city and internal_station_en is None:
+            self._info(colortext.light_red('\n参数错误：到达城市 [%s] 不是一个正确的城市名' % internal_city))
             sys.exit(1)
-        # 检查输入的乘车日期是否正确
-        train_date = self.args['<date>']
-        today_date_str = str(date.today())
-        train_date = train_date or today_date_str
-        is_date = re.match(r'^(2\d{3}-\d{2}-\d{2})$', train_date)
-        train_date_ymd = train_date.split('-')
-        if not is_date or int(train_date_ymd[1]) > 12 or int(train_date_ymd[2]) > 31 or train_date < today_date_str:
-            print(colortext.light_yellow('\n参数错误：乘车日期 [%s] 不正确，将自动查询今天的车次信息' % train_date))
-            train_date = today_date_str
+        train_date = self._check_train_date(self.args['<date>'])
 
         # 判断是否需要执行列车类型过滤操作
         need_filter = 0
-        for train_type in ['-g', '-c', '-d', '-k', '-t', '-z', '-l']:
+        for train_type in TRAIN_TYPE_OPTIONS:
             if self.args[train_type] is True:
                 need_filter += 1
 
         return from_city,internal_city, dest_city, from_station_en, internal_station_en,dest_station_en, train_date, need_filter
 
+    def _train_filter(self):
+        """按 -g/-c/-d 等列车类型选项过滤车次的函数，参数为车次号，没有传这些选项时返回 None"""
+        if not any(self.args[train_type] for train_type in TRAIN_TYPE_OPTIONS):
+            return None
+        return lambda train_number: self.args.get('-' + train_number[0].lower()) is True
+
+    def _check_train_date(self, train_date):
+        """检查输入的乘车日期是否正确，不传或不正确时使用今天的日期"""
+        today_date_str = str(date.today())
+        train_date = train_date or today_date_str
+        is_date = re.match(r'^(2\d{3}-\d{2}-\d{2})$', train_date)
+        train_date_ymd = train_date.split('-')
+        if not is_date or int(train_date_ymd[1]) > 12 or int(train_date_ymd[2]) > 31 or train_date < today_date_str:
+            self._info(colortext.light_yellow('\n参数错误：乘车日期 [%s] 不正确，将自动查询今天的车次信息' % train_date))
+            train_date = today_date_str
+        return train_date
+
     def show_rounte(self,train):
-        seat = colortext.light_blue(train['tickets_remain']['edz']) if \
-            train['tickets_remain']['edz'] else train['tickets_remain']['yz']
+        tickets_remain = train.tickets_remain
+        seat = colortext.light_blue(tickets_remain['edz']) if tickets_remain['edz'] else tickets_remain['yz']
         str = ""
-        str += f"[{colortext.light_red(train['train_number'])}]({seat})"
-        # str += f"({train['start_station']}-{train['end_station']})"
-        str += f"\t{train['from_station']}  \t{train['from_time'].strftime('%m-%d %H:%M')}"
-        str += f"-->\t{train['dest_station']} {train['dest_time'].strftime('%m-%d %H:%M')}"
+        str += f"[{colortext.light_red(train.train_number)}]({seat})"
+        # str += f"({train.start_station}-{train.end_station})"
+        str += f"\t{train.from_station}  \t{train.from_time.strftime('%m-%d %H:%M')}"
+        str += f"-->\t{train.dest_station} {train.dest_time.strftime('%m-%d %H:%M')}"
         return str
     def calculte_timedelta(self,first,second):
         minutes = (second-first).seconds/60
@@ -374,48 +516,343 @@ class TrainTicketsFinder:
         minutes = minutes % 60
         return int(hours),int(minutes)
 
-    def change(self,source,internalcity,destination,train_date,same_inter=True):
+    def change(self,source,internalcity,destination,train_date,same_inter=True,min_layover=timedelta(0),max_layover=None):
+        """
+        查询经 internalcity 中转的换乘方案
+        min_layover / max_layover - 换乘时间的上下界（timedelta），max_layover 为 None 时不限制
+        """
+        self.change_hubs(source, [internalcity], destination, train_date, same_inter, min_layover, max_layover)
 
-        _, _, trains_d = app.query_train_time_tickets(from_city=internalcity, dest_city=destination, train_date=train_date)
-        _, _, trains_f = app.query_train_time_tickets(from_city=source, dest_city=internalcity, train_date=train_date)
-        trains_f.sort(key=lambda tr: tr["dest_time"])
-        trains_d.sort(key=lambda tr: tr["from_time"])
-        train_pairs = []
-        for tf in trains_f:
-            for td in trains_d:
-                if tf["dest_time"] > td["from_time"]:
-                    continue
-                train_pairs.append((tf, td))
-        # print(train_pairs)
-        num = 0
-        final_results = []
-        for first, second in train_pairs:
-            if same_inter and first["dest_station"] != second["from_station"]:
-                continue
-            str = app.show_rounte(first)
-            str2 = app.show_rounte(second)
-            totalhours, totalminutes = app.calculte_timedelta(first["from_time"], second['dest_time'])
-            hours, minutes = app.calculte_timedelta(first["dest_time"], second['from_time'])
-            totaltime = colortext.light_green(f"[total {totalhours}:{totalminutes}]")
-            changetime = colortext.light_yellow(f"@({hours}:{minutes})")
-            final_results.append({
-                "str": f"{totaltime}  \t{str}  \t{changetime}\t{str2}",
-                "total": timedelta(hours=totalhours, minutes=totalminutes),
-                "change": timedelta(hours=hours, minutes=minutes)
-            })
-            # print( f"{totaltime}  \t{str}  \t{changetime}\t{str2}")
-            # num+=1
-        final_results.sort(key=lambda x: x["total"])
-        # final_results.sort(key=lambda x:x["change"])
-        for item in final_results:
-            print(item["str"])
-        print(f"总共有 {len(final_results)}/{len(train_pairs)}种方法")
+    def change_hubs(self,source,hubs,destination,train_date,same_inter=True,min_layover=timedelta(0),max_layover=None,
+                    days=None,top=None,rank='total',stream=False,depart_window=None,pareto_depth=2):
+        """
+        同时考察多个候选中转城市 hubs，所有行程段去重后一次并发查询，各中转城市的换乘方案合并后统一排序
+        days - 日期窗口模式，第一程查询从 train_date 起连续 days 天，第二程多查到换乘可能跨到的日期（由第一程最晚的
+               到达日期和最长换乘时间决定），按绝对时间配对，夜里到达的第一程也能接上次日早上出发的第二程；结果按第一程的出发日期逐天输出
+        top / rank - 只输出按 rank（total 总历时 / layover 换乘时间 / depart 发车时间）排序的前 top 种方案
+        stream - 一旦确定某个方案在前 top 名之内就立即输出，目前只有按发车时间排序时能提前确定
+        rank 为 pareto 时做多目标排序，depart_window 为期望的出发时段 (开始分钟数, 结束分钟数)，
+        只为不看票价时前 pareto_depth 层前沿上的方案查询票价，见 pareto.ParetoRanking
+        """
+        source_en = self._get_station_name(source)[1]
+        destination_en = self._get_station_name(destination)[1]
+        train_date = self._check_train_date(train_date)
+        hub_codes = list(dict.fromkeys(self._get_station_name(hub)[1] for hub in hubs))
+        if days is None:
+            extra_days = 0
+            first_dates = second_dates = [train_date]
+        else:
+            # 先按第一程最晚次日到达估计，再加上最长换乘时间可能跨过的天数；第一程查询完成后再按实际的到达日期补查
+            layover_days = 0 if max_layover is None else math.ceil(max_layover / timedelta(days=1))
+            extra_days = 1 + layover_days
+            first_dates = self._date_range(train_date, days)
+            second_dates = self._date_range(train_date, days + extra_days)
+        stream_bound = STREAM_BOUNDS.get(rank) if stream else None
+        from concurrent.futures import ThreadPoolExecutor
+
+        total_count = 0
+        candidate_count = 0
+        with ThreadPoolExecutor(max_workers=self.workers) as executor:
+            legs = self._submit_legs(executor,
+                                     [(source_en, hub, first_date) for first_date in first_dates for hub in hub_codes] +
+                                     [(hub, destination_en, second_date) for second_date in second_dates for hub in hub_codes])
+            if days is not None:
+                # 历时超过一天的第一程会在第三天甚至更晚才到达，第二程要补查到这些日期
+                arrival_days = max([(train.dest_time - train.day).days for first_date in first_dates for hub in hub_codes
+                                    for train in legs[(source_en, hub, first_date)].result()[2]], default=0)
+                if arrival_days + layover_days > extra_days:
+                    extra_days = arrival_days + layover_days
+                    queried_dates = len(second_dates)
+                    second_dates = self._date_range(train_date, days + extra_days)
+                    legs.update(self._submit_legs(executor, [(hub, destination_en, second_date)
+                                                             for second_date in second_dates[queried_dates:]
+                                                             for hub in hub_codes]))
+            # 逐天配对并输出，不必等后面日期的行程查询完成
+            for day, first_date in enumerate(first_dates):
+                if rank == 'pareto':
+                    ranking = ParetoRanking(self.price_fetcher, top, pareto_depth, depart_window, self.profiler)
+                    self._fares = ranking.fares
+                else:
+                    ranking = TopK(top, rank)
+                joins = []
+                for hub in hub_codes:
+                    trains_f = sorted(legs[(source_en, hub, first_date)].result()[2], key=lambda tr: tr.from_time)
+                    trains_d = [train for second_date in second_dates[day:day + extra_days + 1]
+                                for train in legs[(hub, destination_en, second_date)].result()[2]]
+                    candidate_count += len(trains_f) * len(trains_d)
+                    joins.append(join_transfers(trains_f, trains_d, min_layover, max_layover, same_inter))
+                if days is not None:
+                    self._info(colortext.light_yellow(f"\n{first_date} 出发的换乘方案："))
+                # 各中转城市的配对结果按第一程发车时间归并并去重，见 merge_joins
+                # 流式输出时 join 阶段的耗时包含提前输出的那部分 render
+                with self.profiler.phase('join'):
+                    for first, second in merge_joins(joins):
+                        total_count += 1
+                        ranking.push(first, second)
+                        if stream_bound is not None:
+                            self._print_transfers(ranking.release(stream_bound(first)))
+                self._print_transfers(ranking.release())
+        self._close_renderer()
+        self._info(f"总共有 {total_count}/{candidate_count}种方法")
+
+    def plan_offline(self, source, hubs, destination, train_date, same_inter=True, min_layover=timedelta(0),
+                     max_layover=None, top=None, rank='total'):
+        """用本地时刻表规划经 hubs 中转的方案，只为排名前 top（默认 10）的方案联网刷新余票"""
+        source_en = self._get_station_name(source)[1]
+        destination_en = self._get_station_name(destination)[1]
+        train_date = self._check_train_date(train_date)
+        hub_codes = list(dict.fromkeys(self._get_station_name(hub)[1] for hub in hubs))
+        planner = OfflinePlanner(self)
+        pairs, candidate_count = planner.plan(source_en, hub_codes, destination_en, train_date, min_layover,
+                                              max_layover, same_inter, top or 10, rank)
+        self._print_transfers(pairs)
+        self._close_renderer()
+        self._info(f"本地时刻表共 {candidate_count} 种候选方案，刷新了 {planner.refreshed} 个行程段的余票，输出 {len(pairs)} 种")
+
+    def discover_hubs(self, source, destination, limit, pool=()):
+        """
+        按本地时刻表中见过的车次推断中转城市，返回排名前 limit 的车站电报码
+        pool - 用户给出的候选中转城市，不为空时只在其中挑选
+        """
+        source_en = self._get_station_name(source)[1]
+        destination_en = self._get_station_name(destination)[1]
+        pool_codes = [self._get_station_name(hub)[1] for hub in pool]
+        with self.profiler.phase('hubs'):
+            candidates = HubFinder(self.db, self.stations).rank(source_en, destination_en, pool_codes or None, limit)
+        if not candidates:
+            self._info(colortext.light_red('\n本地时刻表中没有足够的车次记录推断 %s 到 %s 的中转城市，'
+                                           '请直接给出中转城市或用 --hubs-file 提供候选' % (source, destination)))
+            sys.exit(1)
+        for candidate in candidates:
+            minutes = '%d:%02d' % divmod(candidate.minutes, 60) if candidate.minutes else '未知'
+            self._info('候选中转城市 %s：第一程 %s 趟，第二程 %s 趟，最短乘车 %s' % (
+                colortext.light_yellow(candidate.name_cn), candidate.first_trains, candidate.second_trains, minutes))
+        return [candidate.name_en for candidate in candidates]
+
+    def _print_transfers(self, pairs):
+        with self.profiler.phase('render'):
+            if self.output_format == 'table':
+                for pair in pairs:
+                    print(self._transfer_result(*pair)["str"])
+                return
+            if self._renderer is None:
+                self._renderer = create_renderer(self.output_format,
+                                                 'transfers' if self._fares is None else 'priced_transfers')
+                self._leg_dicts = {}
+            for first, second in pairs:
+                self._renderer.row(transfer_record(first, second, self._leg_dicts, self._fares))
+
+    def _close_renderer(self):
+        """json 格式要等全部结果产出后才一次输出"""
+        if self._renderer is not None:
+            with self.profiler.phase('render'):
+                self._renderer.close()
+            self._renderer = None
+            self._leg_dicts = None
+
+    @staticmethod
+    def _date_range(train_date, days):
+        start = datetime.strptime(train_date, '%Y-%m-%d').date()
+        return [str(start + timedelta(days=offset)) for offset in range(days)]
+
+    def _transfer_result(self, first, second):
+        str = self.show_rounte(first)
+        str2 = self.show_rounte(second)
+        totalhours, totalminutes = self.calculte_timedelta(first.from_time, second.dest_time)
+        hours, minutes = self.calculte_timedelta(first.dest_time, second.from_time)
+        totaltime = colortext.light_green(f"[total {totalhours}:{totalminutes}]")
+        changetime = colortext.light_yellow(f"@({hours}:{minutes})")
+        fare = ""
+        if self._fares is not None:
+            fare = self._fares.get(first), self._fares.get(second)
+            fare = "\t" + colortext.light_yellow("¥%.1f" % sum(fare) if None not in fare else "¥?")
+        return {
+            "str": f"{totaltime}  \t{str}  \t{changetime}\t{str2}{fare}",
+            "total": timedelta(hours=totalhours, minutes=totalminutes),
+            "change": timedelta(hours=hours, minutes=minutes)
+        }
 
 
-if __name__ == '__main__':
-    app = TrainTicketsFinder()
-    # app.query_satisfied_trains_info()
-    train_date = "2021-01-05"
-    # app.change("北京","呼和浩特东","鄂尔多斯","2021-01-16")
-    app.change("EEC","包头","北京","2021-01-16")
+def read_hubs(args):
+    """命令行中逗号分隔的中转城市，加上 --hubs-file 文件中的中转城市"""
+    hubs = args['<inte_city>'].split(',') if args['<inte_city>'] else []
+    if args['--hubs-file']:
+        with open(args['--hubs-file'], encoding='utf-8') as hubs_file:
+            hubs += [line.strip() for line in hubs_file if line.strip() and not line.startswith('#')]
+    return hubs
+
+
+def client_supported(args):
+    """客户端模式只处理直达和中转查询，批量、监视、离线规划、日期窗口和自动推断中转城市的查询仍在本进程中执行"""
+    return not (args['--serve'] or args['--batch'] or args['--watch'] or args['--offline'] or args['--days'] or
+                args['--stream'] or args['--auto-hubs'] or args['--rank'] == 'pareto')
+
+
+def request_server(server_url, path, params, timeout):
+    """向常驻查询服务发出一个请求，返回 (状态码, 解析后的 JSON)；只用 http.client，不导入 requests 和 asyncio"""
+    from http.client import HTTPConnection
+    from urllib.parse import urlencode, urlsplit
+
+    url = urlsplit(server_url if '://' in server_url else 'http://' + server_url)
+    connection = HTTPConnection(url.hostname, url.port or 80, timeout=timeout)
+    try:
+        connection.request('GET', path + '?' + urlencode({name: value for name, value in params.items() if value}))
+        response = connection.getresponse()
+        return response.status, json.loads(response.read().decode('utf-8'))
+    finally:
+        connection.close()
+
+
+def client_main(args, server_url):
+    """
+    客户端模式：把直达或中转查询交给常驻查询服务，本进程不打开数据库、不加载车站索引也不联网准备
+    服务返回的直达查询结果不带票价；table 格式以 stream 的定宽表格输出
+    """
+    output_format = args['--format'] or 'table'
+    if output_format not in FORMATS + MACHINE_FORMATS:
+        print(colortext.light_red('参数错误：不支持的输出格式 [%s]' % output_format), file=sys.stderr)
+        sys.exit(1)
+    check_options(args)
+    info_file = sys.stderr if output_format in MACHINE_FORMATS else sys.stdout
+    hubs = read_hubs(args)
+    params = {'from': args['<from_city>'], 'to': args['<dest_city>'], 'date': args['<date>']}
+    if hubs:
+        path, kind, key = '/change', 'transfers', 'transfers'
+        params.update(via=','.join(hubs), min_layover=args['--min-layover'], max_layover=args['--max-layover'],
+                      top=args['--top'], rank=args['--rank'])
+    else:
+        path, kind, key = '/trains', 'legs', 'trains'
+        params['types'] = ''.join(option[1] for option in TRAIN_TYPE_OPTIONS if args[option])
+    try:
+        status, body = request_server(server_url, path, params, float(args['--timeout']) * 6)
+    except (OSError, ValueError) as error:
+        print(colortext.light_red('无法连接常驻查询服务 %s：%s' % (server_url, error)), file=sys.stderr)
+        sys.exit(1)
+    if status != 200:
+        print(colortext.light_red('[ERROR] %s' % body.get('error')), file=sys.stderr)
+        sys.exit(1)
+    renderer = create_renderer('stream' if output_format == 'table' else output_format, kind)
+    for record in body[key]:
+        renderer.row(record)
+    renderer.close()
+    if hubs:
+        print('总共有 %s 种方法，输出 %s 种' % (body['total'], len(body[key])), file=info_file)
+    else:
+        print('共 %s/%s 趟列车' % (body['count'], body['total']), file=info_file)
+
+
+# 需要是整数的选项及其最小值
+INT_OPTIONS = (('--top', 1), ('--days', 1), ('--min-layover', 0), ('--max-layover', 0), ('--auto-hubs', 1),
+               ('--pareto-depth', 1), ('--workers', 1))
+# 需要是正数的选项
+POSITIVE_OPTIONS = ('--interval', '--max-interval', '--rate', '--timeout')
+
+
+def check_options(args):
+    """在开始查询之前检查数值和排序方式选项，不正确时提示后退出，不等到行程都查询完才报错"""
+    for option, minimum in INT_OPTIONS:
+        value = args[option]
+        if value is not None and not (value.isdigit() and int(value) >= minimum):
+            print(colortext.light_red('参数错误：%s 应为不小于 %s 的整数 [%s]' % (option, minimum, value)), file=sys.stderr)
+            sys.exit(1)
+    for option in POSITIVE_OPTIONS:
+        value = args[option]
+        try:
+            valid = value is None or float(value) > 0
+        except ValueError:
+            valid = False
+        if not valid:
+            print(colortext.light_red('参数错误：%s 应为正数 [%s]' % (option, value)), file=sys.stderr)
+            sys.exit(1)
+    if args['--rank'] not in RANK_KEYS and args['--rank'] != 'pareto':
+        print(colortext.light_red('参数错误：不支持的排序方式 [%s]，可选 %s' % (
+            args['--rank'], '、'.join(list(RANK_KEYS) + ['pareto']))), file=sys.stderr)
+        sys.exit(1)
+
+
+def main(app):
+    """按命令行参数启动常驻服务，或执行批量、直达或中转查询"""
+    if app.output_format not in FORMATS + MACHINE_FORMATS or (app.args['--batch'] and app.output_format not in BatchRunner.FORMATS) \
+            or (app.args['--watch'] and app.output_format not in Watcher.FORMATS):
+        print(colortext.light_red('参数错误：不支持的输出格式 [%s]' % app.output_format), file=sys.stderr)
+        sys.exit(1)
+    check_options(app.args)
+    if app.args['--serve']:
+        from daemon import serve
+
+        serve(app, app.args['--listen'])
+        return
+    if app.args['--batch']:
+        if app.args['--batch'] == '-':
+            counts = BatchRunner(app, app.output_format).run(sys.stdin)
+        else:
+            with open(app.args['--batch'], encoding='utf-8') as batch_file:
+                counts = BatchRunner(app, app.output_format).run(batch_file)
+        print('共 %s 条查询，请求了 %s 个行程段，%s 条失败' % counts, file=sys.stderr)
+        return
+    hubs = read_hubs(app.args)
+    if app.args['--auto-hubs']:
+        hubs = app.discover_hubs(app.args['<from_city>'], app.args['<dest_city>'], int(app.args['--auto-hubs']), hubs)
+    max_layover = app.args['--max-layover']
+    try:
+        depart_window = app.args['--depart-window'] and parse_window(app.args['--depart-window'])
+    except ValueError as error:
+        print(colortext.light_red('参数错误：%s' % error), file=sys.stderr)
+        sys.exit(1)
+    if app.args['--watch']:
+        max_interval = app.args['--max-interval']
+        watcher = Watcher(app, float(app.args['--interval']), max_interval and float(max_interval),
+                          app._train_filter())
+        source_en = app._get_station_name(app.args['<from_city>'])[1]
+        destination_en = app._get_station_name(app.args['<dest_city>'])[1]
+        train_date = app._check_train_date(app.args['<date>'])
+        if hubs:
+            watcher.watch_transfers(source_en, list(dict.fromkeys(app._get_station_name(hub)[1] for hub in hubs)),
+                                    destination_en, train_date,
+                                    min_layover=timedelta(minutes=int(app.args['--min-layover'])),
+                                    max_layover=max_layover and timedelta(minutes=int(max_layover)))
+        else:
+            watcher.watch_trains(source_en, destination_en, train_date)
+    elif hubs and app.args['--offline'] and (app.args['--rank'] == 'pareto' or app.args['--days'] or app.args['--stream']):
+        # 离线规划只查询乘车日期当天，也不逐个输出方案，这些选项不能静默忽略
+        unsupported = [option for option, used in (('--rank=pareto', app.args['--rank'] == 'pareto'),
+                                                   ('--days', app.args['--days']), ('--stream', app.args['--stream']))
+                       if used]
+        print(colortext.light_red('参数错误：离线规划暂不支持 %s' % '、'.join(unsupported)), file=sys.stderr)
+        sys.exit(1)
+    elif hubs and app.args['--offline']:
+        app.plan_offline(app.args['<from_city>'], hubs, app.args['<dest_city>'], app.args['<date>'],
+                         min_layover=timedelta(minutes=int(app.args['--min-layover'])),
+                         max_layover=max_layover and timedelta(minutes=int(max_layover)),
+                         top=app.args['--top'] and int(app.args['--top']),
+                         rank=app.args['--rank'])
+    elif hubs:
+        app.change_hubs(app.args['<from_city>'], hubs, app.args['<dest_city>'], app.args['<date>'],
+                        min_layover=timedelta(minutes=int(app.args['--min-layover'])),
+                        max_layover=max_layover and timedelta(minutes=int(max_layover)),
+                        days=app.args['--days'] and int(app.args['--days']),
+                        top=app.args['--top'] and int(app.args['--top']),
+                        rank=app.args['--rank'],
+                        stream=app.args['--stream'],
+                        depart_window=depart_window,
+                        pareto_depth=int(app.args['--pareto-depth']))
+    else:
+        app.query_satisfied_trains_info()
+
 
+if __name__ == '__main__':
+    # 已经启动了常驻查询服务时，直达和中转查询直接交给它，不必再构造查询器
+    cli_args = TrainTicketsFinder._parse_args()
+    # 构造查询器时就要用到 --workers、--rate 和 --timeout，先检查再构造
+    check_options(cli_args)
+    server_url = cli_args['--server'] or os.environ.get('TRAIN12306_SERVER')
+    if server_url and client_supported(cli_args):
+        client_main(cli_args, server_url)
+        sys.exit()
+    app = TrainTicketsFinder(args=cli_args)
+    try:
+        main(app)
+    finally:
+        # 出错退出时也输出已经收集到的统计
+        if app.profiler.enabled:
+            app.profiler.report(print_summary=app.args['--profile'], json_path=app.args['--profile-json'])
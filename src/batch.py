@@ -0,0 +1,131 @@
+#!/usr/bin/env python3
+"""
+批量查询：在一个进程里查询多组 (出发, 到达, 日期)，车站索引、cookie 和数据库连接只准备一次
+相同的行程段只查询一次，所有请求共用查询器的线程数和令牌桶限速，哪一组先查完就先输出哪一组
+"""
+
+import csv
+import json
+import re
+import sys
+from datetime import date
+
+from trainleg import SEAT_FIELDS
+from transport import ThrottledError, TransportError
+
+CSV_FIELDS = ['line', 'from', 'to', 'date', 'train_number', 'from_station', 'dest_station', 'from_time', 'dest_time',
+              'duration'] + [name for name, _ in SEAT_FIELDS] + ['error']
+
+
+def read_queries(lines):
+    """
+    逐行读取查询，产出 (行号, 出发, 到达, 日期)，日期可以省略
+    每行可以是空白或逗号分隔的 “出发 到达 [日期]”，也可以是 {"from": ..., "to": ..., "date": ...} 形式的 JSON；
+    空行和 # 开头的行会被忽略
+    """
+    for line_no, line in enumerate(lines, 1):
+        line = line.strip()
+        if not line or line.startswith('#'):
+            continue
+        if line.startswith('{'):
+            try:
+                query = json.loads(line)
+            except ValueError:
+                yield line_no, line, None, None
+                continue
+            yield line_no, query.get('from'), query.get('to'), query.get('date')
+        else:
+            fields = re.split(r'[\s,]+', line)
+            yield line_no, fields[0], fields[1] if len(fields) > 1 else None, fields[2] if len(fields) > 2 else None
+
+
+class BatchRunner:
+
+    # 每条查询一行 JSON（jsonl 与 ndjson 相同），或每趟车一行 CSV
+    FORMATS = ('ndjson', 'jsonl', 'csv')
+
+    def __init__(self, finder, output_format='ndjson', output=None, max_retries=2, backoff_seconds=0.5):
+        self.finder = finder
+        self.output_format = output_format
+        self.output = output or sys.stdout
+        self.max_retries = max_retries
+        self.backoff_seconds = backoff_seconds
+        self.train_filter = finder._train_filter()
+        self._csv = None
+
+    def _resolve(self, from_city, dest_city, train_date):
+        """把一条查询解析成行程段 (出发电报码, 到达电报码, 日期)，参数有误时返回错误说明"""
+        if not from_city or not dest_city:
+            return None, '查询格式错误，应为：出发 到达 [日期]'
+        from_station = self.finder.stations.resolve(from_city)
+        if from_station is None:
+            return None, '出发城市 [%s] 不是一个正确的城市名' % from_city
+        dest_station = self.finder.stations.resolve(dest_city)
+        if dest_station is None:
+            return None, '到达城市 [%s] 不是一个正确的城市名' % dest_city
+        train_date = train_date or str(date.today())
+        if not re.match(r'^2\d{3}-\d{2}-\d{2}$', train_date):
+            return None, '乘车日期 [%s] 不正确' % train_date
+        return (from_station[1], dest_station[1], train_date), None
+
+    def _fetch_leg(self, key):
+        """查询并解析一个行程段，返回 (余票接口返回的车次总数, 有票的车次)；被限流时有限次退避重试"""
+        train_list = self.finder._load_train_list(*key, retries=self.max_retries, backoff_seconds=self.backoff_seconds)
+        trains = self.finder._parse_train_list(train_list, key[2], report_stopped=False)
+        if self.train_filter:
+            trains = [train for train in trains if self.train_filter(train.train_number)]
+        return len(train_list), trains
+
+    def _write(self, query, key=None, total=0, trains=(), error=None):
+        line_no, from_city, dest_city, train_date = query
+        if self.output_format == 'csv':
+            if self._csv is None:
+                self._csv = csv.DictWriter(self.output, CSV_FIELDS)
+                self._csv.writeheader()
+            row = {'line': line_no, 'from': from_city, 'to': dest_city, 'date': key[2] if key else train_date}
+            if error is not None:
+                self._csv.writerow(dict(row, error=error))
+            for train in trains:
+                train_dict = train.to_dict()
+                seats = train_dict.pop('seats')
+                self._csv.writerow(dict(row, **{field: train_dict[field] for field in CSV_FIELDS if field in train_dict},
+                                        **seats))
+        else:
+            record = {'line': line_no, 'from': from_city, 'to': dest_city, 'date': key[2] if key else train_date}
+            if error is not None:
+                record['error'] = error
+            else:
+                record.update(from_station_e=key[0], dest_station_e=key[1], total=total, count=len(trains),
+                              trains=[train.to_dict() for train in trains])
+            self.output.write(json.dumps(record, ensure_ascii=False) + '\n')
+        self.output.flush()
+
+    def run(self, lines):
+        """执行批量查询，返回 (查询条数, 实际请求的行程段数, 失败条数)"""
+        from concurrent.futures import ThreadPoolExecutor, as_completed
+
+        queries_by_leg = {}
+        failed = 0
+        queries = list(read_queries(lines))
+        for query in queries:
+            key, error = self._resolve(*query[1:])
+            if error is not None:
+                self._write(query, error=error)
+                failed += 1
+            else:
+                queries_by_leg.setdefault(key, []).append(query)
+
+        with ThreadPoolExecutor(max_workers=self.finder.workers) as executor:
+            futures = {executor.submit(self._fetch_leg, key): key for key in queries_by_leg}
+            for future in as_completed(futures):
+                key = futures[future]
+                try:
+                    total, trains = future.result()
+                except (ThrottledError, TransportError, OSError) as error:
+                    for query in queries_by_leg[key]:
+                        self._write(query, key, error='查询失败：%s' % error)
+                    failed += len(queries_by_leg[key])
+                    continue
+                for query in queries_by_leg[key]:
+                    self._write(query, key, total, trains)
+        return len(queries), len(queries_by_leg), failed
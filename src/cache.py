@@ -0,0 +1,101 @@
+#!/usr/bin/env python3
+"""余票与票价接口的本地缓存，数据存放在 data.sqlite3 的缓存表中，按 TTL 过期、按最近访问淘汰"""
+
+import json
+import threading
+import time
+from contextlib import contextmanager
+
+from instrument import Profiler
+
+
+class ResponseCache:
+
+    def __init__(self, db, left_ticket_ttl=60, price_ttl=7 * 24 * 3600, max_entries=10000, enabled=True,
+                 profiler=None, touch_interval=600):
+        self.db = db
+        self.profiler = profiler or Profiler()
+        # 余票变化很快只缓存很短时间，票价基本不变可以缓存很久
+        self.left_ticket_ttl = left_ticket_ttl
+        self.price_ttl = price_ttl
+        self.max_entries = max_entries
+        self.enabled = enabled
+        self._writes = 0
+        # 访问时间只用于按最近访问淘汰，精确到 touch_interval 秒就够了，距上次访问更近的命中不再写库
+        self.touch_interval = touch_interval
+        # 等待写回的访问时间 {键: 访问时间}，batch() 期间的命中在结束时一个事务写回
+        self._touched = {}
+        self._batching = 0
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def left_ticket_key(train_date, from_station_en, dest_station_en):
+        return 'leftTicket|%s|%s|%s' % (train_date, from_station_en, dest_station_en)
+
+    @staticmethod
+    def price_key(request_params):
+        return 'price|%s|%s|%s|%s|%s' % (
+            request_params['train_no'], request_params['from_station_no'], request_params['to_station_no'],
+            request_params['seat_types'], request_params['train_date']
+        )
+
+    def get(self, key):
+        if not self.enabled:
+            return None
+        now = time.time()
+        row = self.db.select_cache(key, now)
+        # 按键的前缀（leftTicket / price）分别统计命中率
+        self.profiler.count('cache.%s.%s' % (key.split('|', 1)[0], 'miss' if row is None else 'hit'))
+        if row is None:
+            return None
+        value, accessed_at = row
+        if now - accessed_at >= self.touch_interval:
+            with self._lock:
+                self._touched[key] = now
+                batching = self._batching
+            if not batching:
+                self.flush()
+        return json.loads(value)
+
+    @contextmanager
+    def batch(self):
+        """批量读取缓存，期间命中的访问时间在结束时一次写回，而不是每次命中提交一个事务"""
+        with self._lock:
+            self._batching += 1
+        try:
+            yield self
+        finally:
+            with self._lock:
+                self._batching -= 1
+            self.flush()
+
+    def flush(self):
+        """写回等待中的访问时间"""
+        with self._lock:
+            if self._batching or not self._touched:
+                return
+            touched, self._touched = self._touched, {}
+        self.db.touch_cache(touched)
+
+    def set(self, key, value, ttl):
+        if not self.enabled:
+            return
+        now = time.time()
+        self.db.upsert_cache(key, json.dumps(value, ensure_ascii=False), now + ttl, now)
+        # 每写入一定次数再做一次淘汰，避免每次写入都扫表
+        self._writes += 1
+        if self._writes % 100 == 0:
+            self.flush()
+            self.db.trim_cache(self.max_entries, now)
+
+    def get_left_tickets(self, train_date, from_station_en, dest_station_en):
+        return self.get(self.left_ticket_key(train_date, from_station_en, dest_station_en))
+
+    def set_left_tickets(self, train_date, from_station_en, dest_station_en, train_list):
+        self.set(self.left_ticket_key(train_date, from_station_en, dest_station_en), train_list, self.left_ticket_ttl)
+
+    def get_price(self, request_params):
+        return self.get(self.price_key(request_params))
+
+    def set_price(self, request_params, price_info):
+        self.set(self.price_key(request_params), price_info, self.price_ttl)
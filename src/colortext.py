@@ -1,26 +1,33 @@
 #!/usr/bin/env python3
 """对命令行显示彩色文字的方法做一些简单封装，在主程序中以模块的方式来调用"""
 
-from colorama import Fore, Style
-
 
 def light_red(content=''):
-    return _fore_color(color=Fore.RED, content=content)
+    return _fore_color(color='RED', content=content)
 
 
 def light_green(content=''):
-    return _fore_color(color=Fore.GREEN, content=content)
+    return _fore_color(color='GREEN', content=content)
 
 
 def light_blue(content=''):
-    return _fore_color(color=Fore.BLUE, content=content)
+    return _fore_color(color='BLUE', content=content)
 
 
 def light_yellow(content=''):
-    return _fore_color(color=Fore.YELLOW, content=content)
+    return _fore_color(color='YELLOW', content=content)
+
 
+def _fore_color(color='WHITE', content=''):
+    """将命令行中的内容 content 显示为指定的颜色 color，colorama 在第一次输出彩色文字时才导入"""
+    from colorama import Fore, Style
 
-def _fore_color(color=Fore.WHITE, content=''):
-    """将命令行中的内容 content 显示为指定的颜色 color"""
     content = content if isinstance(content, str) else str(content)
-    return color + content + Style.RESET_ALL
+    return getattr(Fore, color) + content + Style.RESET_ALL
+
+
+def color_codes(color='WHITE'):
+    """返回 (开始, 结束) 两段 ANSI 控制码，逐行输出大量数据时直接拼接字符串，不必每个单元格调用一次 _fore_color"""
+    from colorama import Fore, Style
+
+    return getattr(Fore, color), Style.RESET_ALL
@@ -0,0 +1,292 @@
+#!/usr/bin/env python3
+"""
+余票数据的列式表示，用于离线分析大量归档的 data.result：原始的 | 分隔车次数据一次转换成 NumPy 数组，
+车次类型过滤、有票判断和按发车时间的换乘配对都在整列上向量化完成，不再逐趟车构造 TrainLeg
+NumPy 是可选依赖，第一次转换或配对时才导入，只有用到本模块时才需要安装：pip install numpy
+"""
+
+from trainleg import (DEST_STATION, DURATION, END_STATION, FROM_STATION, FROM_TIME, PLENTY, SEAT_FIELDS,
+                      START_STATION, STATUS, TRAIN_NUMBER, TRAIN_UUID)
+
+# 由 _require_numpy 在第一次用到时导入
+np = None
+
+# 余票字段的编码：张数本身，有 -> PLENTY，无 -> 0，* 未开售 -> -2，空 -> -1（该车次没有这种坐席）
+NOT_OFFERED = -1
+NOT_ON_SALE = -2
+
+# 车次数据中的字符串列，列名与 TrainLeg 的属性一致
+STRING_COLUMNS = (('train_uuid', TRAIN_UUID), ('train_number', TRAIN_NUMBER), ('start_station_e', START_STATION),
+                  ('end_station_e', END_STATION), ('from_station_e', FROM_STATION), ('dest_station_e', DEST_STATION))
+
+
+def _require_numpy():
+    global np
+    if np is None:
+        try:
+            import numpy
+        except ImportError:
+            raise ImportError('列式解析需要 NumPy，请先执行 pip install numpy') from None
+        np = numpy
+
+
+def seat_code(value):
+    """单个余票字段的编码，整列换算见 _Fields.seat_codes，两者规则一致"""
+    if value == '有':
+        return PLENTY
+    if value == '无':
+        return 0
+    if value == '*':
+        return NOT_ON_SALE
+    return int(value) if value.isdigit() else NOT_OFFERED
+
+
+class _Fields:
+    """
+    整批数据用换行连接后编码成一个 UTF-8 字节数组，用 NumPy 找出全部分隔符的位置，
+    每一列按下标切出各条数据在该列的字节，拼成 (条数, 最大长度) 的 uint8 矩阵，不为每个字段创建 Python 字符串
+    同一批数据的字段数不一致时，先逐条拆分并补齐到相同的字段数
+    """
+
+    def __init__(self, train_list):
+        width = train_list[0].count('|') + 1
+        if not self._split('\n'.join(train_list), len(train_list), width):
+            width = max(train.count('|') + 1 for train in train_list)
+            text = '\n'.join('|'.join((train.split('|') + [''] * width)[:width]) for train in train_list)
+            if not self._split(text, len(train_list), width):
+                raise ValueError('车次数据中不能含有换行符')
+        self.width = width
+
+    def _split(self, text, rows, width):
+        """
+        找出各字段的起始位置和长度，每条数据恰好有 width 个字段时返回 True
+        只比较分隔符总数不够：一条多一个字段、另一条少一个字段时总数不变，所以还要检查每条数据的
+        第 width 个分隔符正好是换行
+        """
+        # 末尾多放一个 0 字节，字段长度以外的位置都指向它，切出的矩阵不需要再清零
+        self.buffer = np.frombuffer(text.encode() + b'\0', dtype=np.uint8)
+        newlines = self.buffer == ord('\n')
+        separators = np.flatnonzero(newlines | (self.buffer == ord('|')))
+        if len(separators) != rows * width - 1 or np.count_nonzero(newlines) != rows - 1 \
+                or not newlines[separators[width - 1::width]].all():
+            return False
+        index_type = np.int32 if len(self.buffer) < np.iinfo(np.int32).max else np.int64
+        starts = np.empty(len(separators) + 1, dtype=index_type)
+        starts[0] = 0
+        np.add(separators, 1, out=starts[1:], casting='unsafe')
+        lengths = np.empty_like(starts)
+        np.subtract(separators, starts[:-1], out=lengths[:-1], casting='unsafe')
+        lengths[-1] = len(self.buffer) - 1 - starts[-1]
+        # (条数, 字段数) 的矩阵，一列的起始位置和长度是其中的一列
+        self.starts = starts.reshape(rows, width)
+        self.lengths = lengths.reshape(rows, width)
+        self.sentinel = index_type(len(self.buffer) - 1)
+        return True
+
+    def matrix(self, index):
+        """第 index 列的 (字节矩阵, 各字段的字节数)，字段不足最大长度的部分补 0"""
+        starts = self.starts[:, index]
+        lengths = self.lengths[:, index]
+        longest = int(lengths.max())
+        offsets = np.arange(max(longest, 1), dtype=starts.dtype)
+        positions = starts[:, None] + offsets
+        if int(lengths.min()) != longest:
+            # 电报码、时刻这类定长字段不需要这一步
+            positions = np.where(offsets < lengths[:, None], positions, self.sentinel)
+        return self.buffer[positions], lengths
+
+    def strings(self, index):
+        """ASCII 字段（车次编号、车次号、电报码）转换成字符串数组"""
+        matrix, _ = self.matrix(index)
+        # ASCII 字节扩展成 UCS4 码点就是 NumPy 的 U 类型，比经过 S 类型再 astype('U') 逐个解码快得多
+        return matrix.astype(np.uint32).view('U%d' % matrix.shape[1]).ravel()
+
+    def equals(self, index, value):
+        """第 index 列是否等于 value；只取出长度相同的字段逐字节比较，不切出整列的矩阵"""
+        encoded = np.frombuffer(value.encode(), dtype=np.uint8)
+        equal = np.zeros(len(self.starts), dtype=bool)
+        rows = np.flatnonzero(self.lengths[:, index] == len(encoded))
+        if len(rows):
+            positions = self.starts[rows, index][:, None] + np.arange(len(encoded), dtype=self.starts.dtype)
+            equal[rows] = (self.buffer[positions] == encoded).all(axis=1)
+        return equal
+
+    @staticmethod
+    def _equals(matrix, lengths, value):
+        encoded = value.encode()
+        if matrix.shape[1] < len(encoded):
+            return np.zeros(len(lengths), dtype=bool)
+        # 逐个字节比较整列，比在二维矩阵上按行归约快
+        equal = lengths == len(encoded)
+        for column, byte in enumerate(encoded):
+            equal &= matrix[:, column] == byte
+        return equal
+
+    @staticmethod
+    def _digits(matrix, lengths):
+        """各字段是否全是数字，以及按十进制换算的值"""
+        numeric = lengths > 0
+        values = np.zeros(len(lengths), dtype=np.int64)
+        for column in range(matrix.shape[1]):
+            inside = lengths > column
+            # uint8 相减会回绕，不是数字的字节都大于 9
+            digit = matrix[:, column] - np.uint8(ord('0'))
+            numeric &= (digit <= 9) | ~inside
+            values = np.where(inside, values * 10 + digit, values)
+        return numeric, values
+
+    def clock_minutes(self, index):
+        """HH:MM 形式的时间换算成分钟数，格式不对时为 -1"""
+        matrix, lengths = self.matrix(index)
+        if matrix.shape[1] < 5:
+            return np.full(len(lengths), -1, dtype=np.int32)
+        hours_ok, hours = self._digits(matrix[:, :2], np.minimum(lengths, 2))
+        minutes_ok, minutes = self._digits(matrix[:, 3:5], np.clip(lengths - 3, 0, 2))
+        valid = (lengths == 5) & (matrix[:, 2] == ord(':')) & hours_ok & minutes_ok
+        return np.where(valid, hours * 60 + minutes, -1).astype(np.int32)
+
+    def seat_codes(self, index):
+        """余票字段按 seat_code 的规则编码"""
+        matrix, lengths = self.matrix(index)
+        numeric, values = self._digits(matrix, lengths)
+        codes = np.where(numeric, np.minimum(values, np.iinfo(np.int16).max), NOT_OFFERED).astype(np.int16)
+        for value, code in (('有', PLENTY), ('无', 0), ('*', NOT_ON_SALE)):
+            codes[self._equals(matrix, lengths, value)] = code
+        return codes
+
+
+class LeftTicketColumns:
+    """
+    一批车次数据的列式表示，每一列是长度相同的 NumPy 数组：
+    train_uuid / train_number / *_station_e - 字符串列
+    day - 乘车日期（datetime64[D]），stopped - 是否停运
+    from_minutes / duration_minutes - 发车时刻（当天的分钟数）和历时（分钟），格式不对时为 -1
+    seats - {坐席名: int16 数组}，编码见 seat_code
+    raw - 原始字符串列表，需要时可以据此构造 TrainLeg
+    """
+
+    def __init__(self, columns, raw):
+        self.columns = columns
+        self.raw = raw
+
+    def __len__(self):
+        return len(self.columns['day'])
+
+    def __getattr__(self, name):
+        columns = self.__dict__.get('columns')
+        if columns is not None and name in columns:
+            return columns[name]
+        raise AttributeError(name)
+
+    @classmethod
+    def from_list(cls, train_list, train_date):
+        """把一次余票查询返回的原始数据列表转换成列，train_date 为 YYYY-MM-DD"""
+        return cls.from_batches([(train_date, train_list)])
+
+    @classmethod
+    def from_batches(cls, batches):
+        """
+        把多次查询的结果合并成一份列式数据，batches 为 (乘车日期, 原始数据列表) 的序列，
+        例如按日期和线路归档的 data.result；所有批次的字段一起拆分，各列只转换一次
+        """
+        _require_numpy()
+        raw = []
+        days = []
+        counts = []
+        for train_date, train_list in batches:
+            raw.extend(train_list)
+            days.append(train_date)
+            counts.append(len(train_list))
+        columns = {'day': np.repeat(np.array(days, dtype='datetime64[D]'), counts)}
+        if not raw:
+            for name, _ in STRING_COLUMNS:
+                columns[name] = np.array([], dtype='U1')
+            columns['stopped'] = np.array([], dtype=bool)
+            columns['from_minutes'] = columns['duration_minutes'] = np.array([], dtype=np.int32)
+            columns['seats'] = {name: np.array([], dtype=np.int16) for name, _ in SEAT_FIELDS}
+            return cls(columns, raw)
+        fields = _Fields(raw)
+        for name, index in STRING_COLUMNS:
+            columns[name] = fields.strings(index)
+        columns['stopped'] = fields.equals(STATUS, '列车停运')
+        columns['from_minutes'] = fields.clock_minutes(FROM_TIME)
+        columns['duration_minutes'] = fields.clock_minutes(DURATION)
+        columns['seats'] = {name: fields.seat_codes(index) for name, index in SEAT_FIELDS}
+        return cls(columns, raw)
+
+    def take(self, selector):
+        """按布尔掩码或下标数组取出一部分车次，返回新的 LeftTicketColumns"""
+        selector = np.asarray(selector)
+        indices = np.flatnonzero(selector) if selector.dtype == bool else selector
+        columns = {name: values[indices] for name, values in self.columns.items() if name != 'seats'}
+        columns['seats'] = {name: values[indices] for name, values in self.columns['seats'].items()}
+        return LeftTicketColumns(columns, [self.raw[index] for index in indices.tolist()])
+
+    def train_type_mask(self, types):
+        """车次号首字母在 types 中的车次，types 为 'gd' 这样的字符串，与命令行的 -g/-d 等选项对应"""
+        initials = self.columns['train_number'].astype('U1').view(np.uint32)
+        return np.isin(initials, [ord(letter) for letter in types.upper() + types.lower()])
+
+    def available_mask(self):
+        """任意一个坐席还有余票，与 trainleg.is_available 的判断一致"""
+        mask = np.zeros(len(self), dtype=bool)
+        for values in self.columns['seats'].values():
+            mask |= values > 0
+        return mask
+
+    def filter(self, types=None, available=True):
+        """与 _parse_train_list 相同的筛选：跳过停运车次，available 为 True 时只保留有票的车次，types 按车次类型过滤"""
+        mask = ~self.columns['stopped'] & (self.columns['from_minutes'] >= 0) & (self.columns['duration_minutes'] >= 0)
+        if available:
+            mask &= self.available_mask()
+        if types:
+            mask &= self.train_type_mask(types)
+        return self.take(mask)
+
+    @property
+    def departure(self):
+        """发车时间，以 1970-01-01 零点起的分钟数表示，不同日期的车次可以直接比较"""
+        return self.columns['day'].astype(np.int64) * 24 * 60 + self.columns['from_minutes']
+
+    @property
+    def arrival(self):
+        return self.departure + self.columns['duration_minutes']
+
+
+def join_transfers(first, second, min_layover=0, max_layover=None, same_inter=True):
+    """
+    向量化的换乘配对，语义与 transfer.join_transfers 相同：第二程在第一程到达站（same_inter 为 False 时不限车站）
+    出发，且发车时间在第一程到达后 [min_layover, max_layover] 分钟之内
+    返回 (第一程下标数组, 第二程下标数组)，按第一程的下标、第二程的发车时间排列
+    第二程按 (车站, 发车时间) 排序后，每趟第一程对应的第二程是一段连续区间，两次 searchsorted 找出全部区间边界
+    """
+    _require_numpy()
+    if not len(first) or not len(second):
+        empty = np.array([], dtype=np.int64)
+        return empty, empty
+    if same_inter:
+        _, codes = np.unique(np.concatenate([first.columns['dest_station_e'], second.columns['from_station_e']]),
+                                    return_inverse=True)
+        first_station = codes[:len(first)].astype(np.int64)
+        second_station = codes[len(first):].astype(np.int64)
+    else:
+        first_station = np.zeros(len(first), dtype=np.int64)
+        second_station = np.zeros(len(second), dtype=np.int64)
+    # 车站编号放在高位、分钟数放在低位，拼成一个可以整体排序和二分查找的键
+    shift = np.int64(1) << 40
+    departure = second.departure
+    order = np.argsort(second_station * shift + departure, kind='stable')
+    keys = (second_station * shift + departure)[order]
+    arrival = first.arrival
+    low = np.searchsorted(keys, first_station * shift + arrival + min_layover, side='left')
+    if max_layover is None:
+        high = np.searchsorted(keys, (first_station + 1) * shift, side='left')
+    else:
+        high = np.searchsorted(keys, first_station * shift + arrival + max_layover, side='right')
+    counts = np.maximum(high - low, 0)
+    total = int(counts.sum())
+    first_index = np.repeat(np.arange(len(first)), counts)
+    # 每个区间内的偏移量：全局序号减去所在区间的起始序号
+    starts = np.repeat(np.cumsum(counts) - counts, counts)
+    second_index = order[np.repeat(low, counts) + np.arange(total) - starts]
+    return first_index, second_index
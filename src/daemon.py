@@ -0,0 +1,270 @@
+#!/usr/bin/env python3
+"""
+常驻查询服务：车站索引、cookie、数据库连接和刚查过的行程段常驻内存，命令行加上 --server 后把查询转给它
+基于 asyncio 的最小 HTTP 服务，只用标准库；真正的查询仍在线程池中由 TrainTicketsFinder 完成，
+所有请求共用它的令牌桶限速；同一个行程段正在查询时，后到的请求等待同一个结果，不会重复请求上游
+
+接口（GET，参数放在查询字符串中，返回 JSON）：
+    /trains?from=&to=&date=&types=          两站之间有票的车次，对应 query_train_time_tickets，types 为 gd 这样的车次类型
+    /change?from=&via=&to=&date=&min_layover=&max_layover=&top=&rank=
+                                            经 via（逗号分隔多个）中转的换乘方案，对应 change
+    /status                                 服务运行状态和性能统计
+"""
+
+import asyncio
+import json
+import re
+import sys
+import time
+from datetime import date, timedelta
+from urllib.parse import parse_qs, urlsplit
+
+import colortext
+from render import transfer_record
+from transfer import RANK_KEYS, TopK, join_transfers, merge_joins
+from transport import ThrottledError, TransportError
+
+DEFAULT_LISTEN = '127.0.0.1:8307'
+STATUS_TEXT = {200: b'OK', 400: b'Bad Request', 404: b'Not Found', 500: b'Internal Server Error', 502: b'Bad Gateway'}
+
+
+class RequestError(Exception):
+    """请求参数有误，返回 400"""
+
+
+class QueryDaemon:
+    """
+    finder - 常驻的 TrainTicketsFinder，服务期间一直复用它的传输层、数据库和车站索引
+    行程段解析后的结果在内存中保留 finder.cache.left_ticket_ttl 秒，这段时间内的重复查询不再读数据库和解析
+    max_legs - 内存中最多保留的行程段数，超出时先删除过期的，再按查询完成的先后淘汰
+    """
+
+    def __init__(self, finder, max_legs=1024):
+        self.finder = finder
+        # 常驻服务总是收集统计，通过 /status 查看
+        self.profiler = finder.profiler
+        self.profiler.enabled = True
+        self.ttl = finder.cache.left_ticket_ttl
+        # (出发电报码, 到达电报码, 日期) -> (查询完成的时间, 余票接口返回的车次总数, 有票的车次)，按查询完成的先后排列
+        self._legs = {}
+        self.max_legs = max_legs
+        # 正在查询的行程段 -> Future
+        self._inflight = {}
+        self._executor = None
+        self.started_at = time.time()
+        self.requests = 0
+
+    def warm_up(self):
+        """启动时加载车站索引并获取 cookie；联网失败时只提示，第一次查询时会再次尝试"""
+        self.finder.stations
+        try:
+            self.finder.transport.ensure_cookies()
+        except (TransportError, OSError) as error:
+            print(colortext.light_yellow('获取 cookie 失败，将在第一次查询时重试：%s' % error), file=sys.stderr)
+
+    def _fetch_leg(self, key):
+        """在线程池中执行：查询并解析一个行程段，返回 (余票接口返回的车次总数, 有票的车次)"""
+        train_list = self.finder._load_train_list(*key)
+        return len(train_list), self.finder._parse_train_list(train_list, key[2], report_stopped=False)
+
+    def _finish_leg(self, key, future):
+        self._inflight.pop(key, None)
+        if not future.cancelled() and future.exception() is None:
+            # 先删除再插入，保持按查询完成的先后排列
+            self._legs.pop(key, None)
+            self._legs[key] = (time.monotonic(),) + future.result()
+            if len(self._legs) > self.max_legs:
+                self._evict_legs()
+
+    def _evict_legs(self):
+        """从最早完成的行程段开始删除，过期的全部删除，未过期的删到不超过 max_legs 为止"""
+        now = time.monotonic()
+        while self._legs:
+            key, entry = next(iter(self._legs.items()))
+            if len(self._legs) <= self.max_legs and now - entry[0] < self.ttl:
+                break
+            del self._legs[key]
+
+    async def leg(self, key):
+        """取一个行程段：内存中未过期时直接返回，正在查询时等待同一个结果，否则提交到线程池查询"""
+        entry = self._legs.get(key)
+        if entry is not None:
+            if time.monotonic() - entry[0] < self.ttl:
+                self.profiler.count('daemon.leg.memory')
+                return entry[1:]
+            del self._legs[key]
+        future = self._inflight.get(key)
+        if future is None:
+            self.profiler.count('daemon.leg.fetch')
+            future = asyncio.get_running_loop().run_in_executor(self._executor, self._fetch_leg, key)
+            future.add_done_callback(lambda done: self._finish_leg(key, done))
+            self._inflight[key] = future
+        else:
+            self.profiler.count('daemon.leg.coalesced')
+        # 某个客户端断开时不能取消其它请求也在等待的查询
+        return await asyncio.shield(future)
+
+    def _station(self, params, name, label):
+        city = params.get(name)
+        if not city:
+            raise RequestError('缺少参数 %s' % name)
+        station = self.finder.stations.resolve(city)
+        if station is None:
+            raise RequestError('%s [%s] 不是一个正确的城市名' % (label, city))
+        return station[1]
+
+    @staticmethod
+    def _date(params):
+        train_date = params.get('date') or str(date.today())
+        if not re.match(r'^2\d{3}-\d{2}-\d{2}$', train_date):
+            raise RequestError('乘车日期 [%s] 不正确' % train_date)
+        return train_date
+
+    @staticmethod
+    def _minutes(params, name):
+        value = params.get(name)
+        if not value:
+            return None
+        if not value.isdigit():
+            raise RequestError('参数 %s 应为分钟数' % name)
+        return timedelta(minutes=int(value))
+
+    async def trains(self, params):
+        from_station_en = self._station(params, 'from', '出发城市')
+        dest_station_en = self._station(params, 'to', '到达城市')
+        train_date = self._date(params)
+        total, trains = await self.leg((from_station_en, dest_station_en, train_date))
+        types = params.get('types')
+        if types:
+            trains = [train for train in trains if train.train_number[0].lower() in types.lower()]
+        return {
+            'from_station_e': from_station_en,
+            'dest_station_e': dest_station_en,
+            'date': train_date,
+            'total': total,
+            'count': len(trains),
+            'trains': [train.to_dict() for train in trains],
+        }
+
+    async def change(self, params):
+        source_en = self._station(params, 'from', '出发城市')
+        destination_en = self._station(params, 'to', '到达城市')
+        train_date = self._date(params)
+        hubs = [hub for hub in (params.get('via') or '').split(',') if hub]
+        if not hubs:
+            raise RequestError('缺少参数 via')
+        hub_codes = list(dict.fromkeys(self._station({'via': hub}, 'via', '中转城市') for hub in hubs))
+        min_layover = self._minutes(params, 'min_layover') or timedelta(0)
+        max_layover = self._minutes(params, 'max_layover')
+        top = params.get('top')
+        if top is not None and not (top.isdigit() and int(top) >= 1):
+            raise RequestError('参数 top 应为正整数')
+        rank = params.get('rank') or 'total'
+        if rank not in RANK_KEYS:
+            raise RequestError('不支持的排序方式 [%s]' % rank)
+
+        keys = [(source_en, hub, train_date) for hub in hub_codes] + [(hub, destination_en, train_date) for hub in hub_codes]
+        legs = dict(zip(keys, await asyncio.gather(*(self.leg(key) for key in keys))))
+        # 配对和排序只用到已经解析好的车次，放到线程池里执行，不阻塞其它请求
+        return await asyncio.get_running_loop().run_in_executor(
+            self._executor, self._join, source_en, hub_codes, destination_en, train_date, legs, min_layover,
+            max_layover, top and int(top), rank)
+
+    @staticmethod
+    def _join(source_en, hub_codes, destination_en, train_date, legs, min_layover, max_layover, top, rank):
+        """与 change_hubs 相同的配对、归并去重和排序，结果转换成 transfer_record"""
+        ranking = TopK(top, rank)
+        joins = [join_transfers(sorted(legs[(source_en, hub, train_date)][1], key=lambda tr: tr.from_time),
+                                legs[(hub, destination_en, train_date)][1], min_layover, max_layover)
+                 for hub in hub_codes]
+        total = 0
+        for first, second in merge_joins(joins):
+            total += 1
+            ranking.push(first, second)
+        leg_dicts = {}
+        return {
+            'date': train_date,
+            'total': total,
+            'transfers': [transfer_record(first, second, leg_dicts) for first, second in ranking.release()],
+        }
+
+    async def status(self, params):
+        return {
+            'uptime_seconds': round(time.time() - self.started_at, 1),
+            'requests': self.requests,
+            'legs_in_memory': len(self._legs),
+            'legs_inflight': len(self._inflight),
+            'profile': self.profiler.summary(),
+        }
+
+    async def handle(self, reader, writer):
+        """每个连接处理一个请求，响应后关闭连接；处理请求时的意外错误返回 500，不会让连接一直挂着"""
+        try:
+            await self._respond(writer, *await self._dispatch(reader))
+        except ConnectionError:
+            # 客户端已经断开，响应写不出去
+            pass
+        finally:
+            writer.close()
+
+    async def _dispatch(self, reader):
+        """读取并处理一个请求，返回 (状态码, 响应内容)"""
+        status, body = 200, None
+        try:
+            request_line = await reader.readline()
+            while (await reader.readline()).strip():
+                pass
+            method, target, _ = request_line.decode('latin-1').split(' ', 2)
+            url = urlsplit(target)
+            handler = {'/trains': self.trains, '/change': self.change, '/status': self.status}.get(url.path)
+            if method != 'GET' or handler is None:
+                status, body = 404, {'error': '不支持的请求 %s %s' % (method, url.path)}
+            else:
+                self.requests += 1
+                params = {name: values[-1] for name, values in parse_qs(url.query).items()}
+                with self.profiler.phase('daemon.' + url.path[1:]):
+                    body = await handler(params)
+        except RequestError as error:
+            status, body = 400, {'error': str(error)}
+        except (ThrottledError, TransportError, OSError) as error:
+            status, body = 502, {'error': '查询失败：%s' % error}
+        except ValueError:
+            status, body = 400, {'error': '无法解析的请求'}
+        except Exception as error:
+            # 例如上游返回的 JSON 结构与预期不同
+            self.profiler.count('daemon.error')
+            print(colortext.light_red('处理请求时发生异常：%r' % error), file=sys.stderr)
+            status, body = 500, {'error': '服务内部错误：%s' % error}
+        return status, body
+
+    @staticmethod
+    async def _respond(writer, status, body):
+        data = json.dumps(body, ensure_ascii=False).encode('utf-8')
+        writer.write(b'HTTP/1.1 %d %s\r\nContent-Type: application/json; charset=utf-8\r\n'
+                     b'Content-Length: %d\r\nConnection: close\r\n\r\n' % (
+                         status, STATUS_TEXT[status], len(data)) + data)
+        await writer.drain()
+
+    async def serve(self, host, port):
+        from concurrent.futures import ThreadPoolExecutor
+
+        self._executor = ThreadPoolExecutor(max_workers=self.finder.workers)
+        server = await asyncio.start_server(self.handle, host, port)
+        print(colortext.light_green('查询服务已启动：http://%s:%s' % (host, port)), file=sys.stderr)
+        try:
+            async with server:
+                await server.serve_forever()
+        finally:
+            self._executor.shutdown(wait=False)
+
+
+def serve(finder, listen=DEFAULT_LISTEN):
+    """启动常驻查询服务，listen 为 host:port，Ctrl-C 结束"""
+    host, _, port = listen.rpartition(':')
+    daemon = QueryDaemon(finder)
+    daemon.warm_up()
+    try:
+        asyncio.run(daemon.serve(host or '127.0.0.1', int(port)))
+    except KeyboardInterrupt:
+        pass
+
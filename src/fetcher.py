@@ -0,0 +1,106 @@
+#!/usr/bin/env python3
+"""并发查询票价：线程池 + 共享令牌桶限速，失败时按带抖动的指数退避有限次重试"""
+
+import random
+import sys
+import threading
+import time
+
+import colortext
+from instrument import Profiler
+from transport import ThrottledError, TransportError
+
+
+class TokenBucket:
+    """
+    令牌桶限速器，所有线程共享同一份上游请求配额，rate 为每秒补充的令牌数
+    容量至少为 1，rate 小于 1 时桶里也能攒够一个完整的令牌，否则 acquire 永远等不到
+    """
+
+    def __init__(self, rate, capacity=None):
+        self.rate = float(rate)
+        self.capacity = max(1.0, float(capacity or rate))
+        self._tokens = self.capacity
+        self._updated_at = time.monotonic()
+        self._lock = threading.Lock()
+
+    def acquire(self):
+        """取走一个令牌，令牌不足时阻塞到下一个令牌补充为止"""
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self._tokens = min(self.capacity, self._tokens + (now - self._updated_at) * self.rate)
+                self._updated_at = now
+                if self._tokens >= 1:
+                    self._tokens -= 1
+                    return
+                wait_seconds = (1 - self._tokens) / self.rate
+            time.sleep(wait_seconds)
+
+
+class PriceFetcher:
+
+    def __init__(self, transport, api, limiter, max_workers=8, max_retries=4, backoff_seconds=0.5, cache=None,
+                 profiler=None):
+        self.transport = transport
+        self.profiler = profiler or Profiler()
+        self.cache = cache
+        self.api = api
+        self.limiter = limiter
+        self.max_workers = max_workers
+        self.max_retries = max_retries
+        self.backoff_seconds = backoff_seconds
+
+    def _fetch_and_store(self, request_params):
+        price_info = self._request(request_params)
+        if price_info and self.cache is not None:
+            self.cache.set_price(request_params, price_info)
+        return price_info
+
+    def _request(self, request_params):
+        """通过测试和观察，请求频率过快时 12306 会返回错误页面而不是 JSON，此时退避一段时间后重试"""
+        train_no = request_params.get('train_no')
+        for attempt in range(self.max_retries + 1):
+            with self.profiler.phase('rate_limit_wait'):
+                self.limiter.acquire()
+            self.profiler.count('price.request')
+            try:
+                return self.transport.get_json(self.api, request_params).get('data') or {}
+            except ThrottledError as error:
+                self.profiler.count('price.throttled')
+                failure = error
+            except TransportError as error:
+                self.profiler.count('price.failed')
+                print(colortext.light_red('[ERROR] 编号为 %s 的列车票价请求失败：%s' % (train_no, error)),
+                      file=sys.stderr)
+                return {}
+            except OSError as error:
+                self.profiler.count('price.network_error')
+                failure = error
+            if attempt == self.max_retries:
+                self.profiler.count('price.failed')
+                print(colortext.light_red('[ERROR] 编号为 %s 的列车票价请求 %s 次后仍失败：%s' % (
+                    train_no, attempt + 1, failure)), file=sys.stderr)
+                return {}
+            # 全抖动的指数退避，避免多个线程同时重试再次触发限流
+            self.profiler.count('price.retry')
+            with self.profiler.phase('backoff'):
+                time.sleep(random.uniform(0, self.backoff_seconds * 2 ** attempt))
+        return {}
+
+    def fetch_all(self, request_params_list):
+        """并发查询多趟列车的票价，返回结果与传入参数的顺序一致；全部命中缓存时不会创建线程池"""
+        if self.cache is None:
+            price_infos = [None] * len(request_params_list)
+        else:
+            with self.cache.batch():
+                price_infos = [self.cache.get_price(request_params) for request_params in request_params_list]
+        missing = [i for i, price_info in enumerate(price_infos) if price_info is None]
+        if missing:
+            from concurrent.futures import ThreadPoolExecutor
+
+            with ThreadPoolExecutor(max_workers=min(self.max_workers, len(missing))) as executor:
+                fetched = executor.map(self._fetch_and_store, [request_params_list[i] for i in missing])
+                for i, price_info in zip(missing, fetched):
+                    price_infos[i] = price_info
+        return price_infos
@@ -0,0 +1,162 @@
+#!/usr/bin/env python3
+"""
+自动推断中转城市：在本地时刻表见过的车次里，找出出发城市之后、到达城市之前都有车次停靠的车站，
+按两段各有多少趟车、两段加起来是否绕远排序，中转查询只联网查询排名最前的几个城市
+车站表里没有经纬度，“是否绕远”用乘车时间衡量：两段最短乘车时间之和越接近最快的走法越合理
+"""
+
+import math
+from collections import defaultdict, namedtuple
+
+# first_trains / second_trains - 本地时刻表中 出发城市→该站、该站→到达城市 的车次数
+# minutes - 两段最短乘车时间之和（分钟），时刻表中没有对应时刻时为 None
+HubCandidate = namedtuple('HubCandidate', ['name_en', 'name_cn', 'first_trains', 'second_trains', 'minutes', 'score'])
+
+# 同城的车站以方位字区分，例如 北京西、包头东
+_DIRECTIONS = '东西南北'
+# 始发站、终点站在区段中没有出现时的站序
+_FIRST_STOP, _LAST_STOP = 1, 999
+
+
+def city_name(name_cn):
+    """车站所在的城市名，去掉结尾的方位字；两个字的站名（例如 济南）保持不变"""
+    if len(name_cn) > 2 and name_cn[-1] in _DIRECTIONS:
+        return name_cn[:-1]
+    return name_cn
+
+
+def _clock(text):
+    hours, minutes = text.split(':')
+    return int(hours) * 60 + int(minutes)
+
+
+class HubFinder:
+    """
+    只读本地数据库，不发请求；本地时刻表记录的行程段越多，推断越准确
+    每趟车的各区段按站序拼成停站列表，出发城市的车站之后停靠的站都是第一程可以到达的，到达城市的车站之前停靠的站都可以作为第二程的起点
+    """
+
+    def __init__(self, db, stations):
+        self.db = db
+        self.stations = stations
+        self._cities = None
+
+    def city_stations(self, name_en):
+        """与 name_en 同城的全部车站电报码"""
+        if self._cities is None:
+            cities = defaultdict(set)
+            for station in self.stations.by_en.values():
+                cities[city_name(station.name_cn)].add(station.name_en)
+            self._cities = cities
+        name_cn = self.stations.name_cn(name_en)
+        return (self._cities.get(city_name(name_cn), set()) if name_cn else set()) | {name_en}
+
+    def _city(self, name_en):
+        name_cn = self.stations.name_cn(name_en)
+        return city_name(name_cn) if name_cn else name_en
+
+    def _stops(self, station_codes):
+        """{车次编号: {车站: [站序, 发车时刻, 到达时刻]}}，时刻为当天的分钟数，不知道时为 None"""
+        trains = defaultdict(dict)
+        terminals = {}
+        for (train_uuid, start_station, end_station, from_station, dest_station, from_no, to_no, from_time,
+             duration) in self.db.select_timetable_trains_at(sorted(station_codes)):
+            stops = trains[train_uuid]
+            departure = _clock(from_time)
+            stops.setdefault(from_station, [int(from_no), None, None])[1] = departure
+            stops.setdefault(dest_station, [int(to_no), None, None])[2] = (departure + _clock(duration)) % (24 * 60)
+            terminals[train_uuid] = (start_station, end_station)
+        for train_uuid, (start_station, end_station) in terminals.items():
+            trains[train_uuid].setdefault(start_station, [_FIRST_STOP, None, None])
+            trains[train_uuid].setdefault(end_station, [_LAST_STOP, None, None])
+        return trains
+
+    @staticmethod
+    def _ride(board, alight):
+        """同一趟车从 board 站上车到 alight 站下车的分钟数，两个时刻都不知道时返回 None"""
+        departure = board[1] if board[1] is not None else board[2]
+        arrival = alight[2] if alight[2] is not None else alight[1]
+        if departure is None or arrival is None:
+            return None
+        return (arrival - departure) % (24 * 60) or None
+
+    def rank(self, source_en, destination_en, pool=None, limit=None):
+        """
+        返回按推断可信度从高到低排列的 HubCandidate 列表
+        pool - 候选中转车站的电报码，为 None 时从本地时刻表能推断出的全部车站中挑选；
+               给出时只在这些城市中挑选，本地没有记录的城市排在最后，按给出的顺序
+        同城的多个车站合并为一个候选，取车次最多的车站作为查询用的电报码
+        """
+        source_set = self.city_stations(source_en)
+        destination_set = self.city_stations(destination_en)
+        excluded = source_set | destination_set
+        # 车站 -> 第一程 / 第二程经过该站的车次编号集合，车站 -> 第一程 / 第二程的最短乘车时间
+        first_trains = defaultdict(set)
+        second_trains = defaultdict(set)
+        first_minutes = {}
+        second_minutes = {}
+        direct_minutes = None
+        for train_uuid, stops in self._stops(excluded).items():
+            boards = [stop for code, stop in stops.items() if code in source_set]
+            alights = [stop for code, stop in stops.items() if code in destination_set]
+            # 同城有多个车站停靠时，在最靠近对方城市的那一站上下车
+            board = max(boards, key=lambda stop: stop[0]) if boards else None
+            alight = min(alights, key=lambda stop: stop[0]) if alights else None
+            if board and alight:
+                # 直达车（或反方向的车）不提供中转候选，只用来确定最快的走法
+                ride = self._ride(board, alight) if board[0] < alight[0] else None
+                if ride is not None:
+                    direct_minutes = ride if direct_minutes is None else min(direct_minutes, ride)
+                continue
+            for code, stop in stops.items():
+                if code in excluded:
+                    continue
+                if board and stop[0] > board[0]:
+                    first_trains[code].add(train_uuid)
+                    ride = self._ride(board, stop)
+                    if ride is not None:
+                        first_minutes[code] = min(first_minutes.get(code, ride), ride)
+                if alight and stop[0] < alight[0]:
+                    second_trains[code].add(train_uuid)
+                    ride = self._ride(stop, alight)
+                    if ride is not None:
+                        second_minutes[code] = min(second_minutes.get(code, ride), ride)
+
+        cities = defaultdict(list)
+        for code in set(first_trains) | set(second_trains):
+            cities[self._city(code)].append(code)
+        pool_cities = None if pool is None else list(dict.fromkeys(self._city(code) for code in pool))
+        if pool_cities is not None:
+            for code in pool:
+                cities.setdefault(self._city(code), [code])
+
+        candidates = []
+        for city, codes in cities.items():
+            if pool_cities is not None and city not in pool_cities:
+                continue
+            first = set().union(*(first_trains[code] for code in codes))
+            second = set().union(*(second_trains[code] for code in codes))
+            first_ride = min((first_minutes[code] for code in codes if code in first_minutes), default=None)
+            second_ride = min((second_minutes[code] for code in codes if code in second_minutes), default=None)
+            minutes = None if first_ride is None or second_ride is None else first_ride + second_ride
+            name_en = max(codes, key=lambda code: len(first_trains[code]) + len(second_trains[code]))
+            candidates.append([name_en, self.stations.name_cn(name_en) or city, len(first), len(second), minutes])
+
+        # 没有直达车的记录时，以所有候选中最短的两段乘车时间之和作为基准
+        fastest = direct_minutes or min((candidate[4] for candidate in candidates if candidate[4]), default=None)
+        ranked = []
+        for name_en, name_cn, first_count, second_count, minutes in candidates:
+            # 两段都有车次时按车次数的几何平均乘以绕远系数打分，时刻不全时绕远系数取 0.5
+            plausibility = fastest / minutes if fastest and minutes else 0.5
+            score = math.sqrt(first_count * second_count) * min(plausibility, 1.0)
+            ranked.append(HubCandidate(name_en, name_cn, first_count, second_count, minutes, round(score, 3)))
+
+        def sort_key(candidate):
+            sides = bool(candidate.first_trains) + bool(candidate.second_trains)
+            pool_order = -pool_cities.index(self._city(candidate.name_en)) if pool_cities is not None else 0
+            return sides, candidate.score, candidate.first_trains + candidate.second_trains, pool_order
+
+        ranked.sort(key=sort_key, reverse=True)
+        if pool_cities is None:
+            ranked = [candidate for candidate in ranked if candidate.first_trains or candidate.second_trains]
+        return ranked[:limit] if limit is not None else ranked
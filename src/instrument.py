@@ -0,0 +1,153 @@
+#!/usr/bin/env python3
+"""
+运行过程的性能统计：各阶段耗时、计数器、各接口请求的延迟分布
+命令行用 --profile / --profile-json 输出统计结果；作为库使用时可以用 add_hook 注册回调，实时收到每一个统计事件
+"""
+
+import json
+import sys
+import threading
+import time
+from contextlib import contextmanager
+
+# 接口延迟分布的桶上界（毫秒），最后一个桶收纳超过所有上界的请求
+LATENCY_BUCKETS_MS = (10, 25, 50, 100, 250, 500, 1000, 2500, 5000)
+
+
+class Profiler:
+    """
+    线程安全的统计器，未启用且没有回调时所有记录方法都直接返回，几乎没有开销
+    阶段耗时按调用累计，在线程池中并行执行的阶段会把各线程的耗时相加；阶段可以嵌套，内层耗时同时计入外层
+    """
+
+    def __init__(self, enabled=False):
+        self.enabled = enabled
+        self.started_at = time.perf_counter()
+        self.phases = {}
+        self.counters = {}
+        self.latencies = {}
+        self._hooks = []
+        self._lock = threading.Lock()
+
+    def add_hook(self, hook):
+        """
+        注册回调 hook(kind, name, value)，kind 为 phase（value 为秒）、count（value 为增量）或 latency（value 为秒）
+        注册回调后统计器自动启用
+        """
+        self._hooks.append(hook)
+        self.enabled = True
+
+    def _emit(self, kind, name, value):
+        for hook in self._hooks:
+            hook(kind, name, value)
+
+    @contextmanager
+    def phase(self, name):
+        """统计一段代码的耗时"""
+        if not self.enabled:
+            yield
+            return
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.record_phase(name, time.perf_counter() - started)
+
+    def record_phase(self, name, seconds):
+        if not self.enabled:
+            return
+        with self._lock:
+            phase = self.phases.setdefault(name, {'count': 0, 'total': 0.0, 'max': 0.0})
+            phase['count'] += 1
+            phase['total'] += seconds
+            phase['max'] = max(phase['max'], seconds)
+        self._emit('phase', name, seconds)
+
+    def count(self, name, value=1):
+        if not self.enabled:
+            return
+        with self._lock:
+            self.counters[name] = self.counters.get(name, 0) + value
+        self._emit('count', name, value)
+
+    def observe_latency(self, endpoint, seconds):
+        """记录一次接口请求的耗时"""
+        if not self.enabled:
+            return
+        milliseconds = seconds * 1000
+        with self._lock:
+            latency = self.latencies.setdefault(endpoint, {
+                'count': 0, 'total': 0.0, 'max': 0.0, 'buckets': [0] * (len(LATENCY_BUCKETS_MS) + 1)
+            })
+            latency['count'] += 1
+            latency['total'] += milliseconds
+            latency['max'] = max(latency['max'], milliseconds)
+            bucket = 0
+            while bucket < len(LATENCY_BUCKETS_MS) and milliseconds > LATENCY_BUCKETS_MS[bucket]:
+                bucket += 1
+            latency['buckets'][bucket] += 1
+        self._emit('latency', endpoint, seconds)
+
+    @staticmethod
+    def _hit_rates(counters):
+        """由 cache.<种类>.hit / cache.<种类>.miss 计数器算出各类缓存的命中率"""
+        kinds = {name[len('cache.'):].rpartition('.')[0] for name in counters if name.startswith('cache.')}
+        rates = {}
+        for kind in kinds:
+            hits = counters.get('cache.%s.hit' % kind, 0)
+            rates[kind] = round(hits / (hits + counters.get('cache.%s.miss' % kind, 0)), 4)
+        return rates
+
+    def summary(self):
+        """以可以直接写成 JSON 的字典返回全部统计结果，时间单位为毫秒"""
+        with self._lock:
+            return {
+                'wall_ms': round((time.perf_counter() - self.started_at) * 1000, 3),
+                'phases': {
+                    name: {'count': phase['count'], 'total_ms': round(phase['total'] * 1000, 3),
+                           'max_ms': round(phase['max'] * 1000, 3)}
+                    for name, phase in self.phases.items()
+                },
+                'counters': dict(self.counters),
+                'cache_hit_rates': self._hit_rates(self.counters),
+                'latency': {
+                    endpoint: {
+                        'count': latency['count'],
+                        'mean_ms': round(latency['total'] / latency['count'], 3),
+                        'max_ms': round(latency['max'], 3),
+                        'histogram': {
+                            ('<=%d' % bound if bound is not None else '>%d' % LATENCY_BUCKETS_MS[-1]): count
+                            for bound, count in zip(LATENCY_BUCKETS_MS + (None,), latency['buckets'])
+                        },
+                    }
+                    for endpoint, latency in self.latencies.items()
+                },
+            }
+
+    def format_summary(self):
+        summary = self.summary()
+        lines = ['', '[profile] 总耗时 %.1f ms' % summary['wall_ms'], '阶段耗时：']
+        for name, phase in sorted(summary['phases'].items(), key=lambda item: -item[1]['total_ms']):
+            lines.append('  %-20s %6d 次  合计 %10.1f ms  最长 %9.1f ms' % (
+                name, phase['count'], phase['total_ms'], phase['max_ms']))
+        if summary['latency']:
+            lines.append('接口延迟：')
+            for endpoint, latency in summary['latency'].items():
+                lines.append('  %-20s %6d 次  平均 %10.1f ms  最长 %9.1f ms' % (
+                    endpoint, latency['count'], latency['mean_ms'], latency['max_ms']))
+                lines.append('    ' + '  '.join('%s:%d' % bucket for bucket in latency['histogram'].items() if bucket[1]))
+        if summary['counters']:
+            lines.append('计数：')
+            for name, value in sorted(summary['counters'].items()):
+                lines.append('  %-28s %d' % (name, value))
+        for kind, rate in sorted(summary['cache_hit_rates'].items()):
+            lines.append('  缓存命中率 %-17s %.1f%%' % (kind, rate * 100))
+        return '\n'.join(lines)
+
+    def report(self, print_summary=True, json_path=None):
+        """命令行结束时输出统计：摘要打印到标准错误，json_path 不为空时写出 JSON 文件"""
+        if json_path:
+            with open(json_path, 'w', encoding='utf-8') as json_file:
+                json.dump(self.summary(), json_file, ensure_ascii=False, indent=2)
+        if print_summary:
+            print(self.format_summary(), file=sys.stderr)
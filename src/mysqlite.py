@@ -3,20 +3,36 @@
 
 import os
 import sqlite3
+import sys
+import threading
 
 import colortext
 
 
 class Sqlite:
 
-    COMMA = ','
+    # 表结构有变化时加一，数据库里记录的版本一致时启动就不必再执行建表和迁移语句
+    SCHEMA_VERSION = 3
 
     def __init__(self, dbname):
         app_root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
-        self.connect = sqlite3.connect(os.path.join(app_root, dbname))
+        self.path = os.path.join(app_root, dbname)
+        # 票价查询会在线程池中读写缓存表，连接允许跨线程使用，由 self.lock 串行化
+        self.connect = sqlite3.connect(self.path, check_same_thread=False)
         self.cursor = self.connect.cursor()
+        self.lock = threading.RLock()
         self.table_name_station = 'station'
-        self.create_table_station()
+        self.table_name_meta = 'meta'
+        self.table_name_cache = 'response_cache'
+        self.table_name_train = 'timetable_train'
+        self.table_name_segment = 'timetable_segment'
+        self.table_name_validity = 'timetable_validity'
+        if self.connect.execute('PRAGMA user_version').fetchone()[0] != Sqlite.SCHEMA_VERSION:
+            self.create_table_station()
+            self.create_table_meta()
+            self.create_table_cache()
+            self.create_table_timetable()
+            self._create_table('PRAGMA user_version = %d' % Sqlite.SCHEMA_VERSION)
 
     def create_table_station(self):
         sql = '''
@@ -29,40 +45,204 @@ class Sqlite:
             )
         ''' % self.table_name_station
         self._create_table(sql)
+        # 旧版本每次启动都会整表追加一遍，先按电报码去重，再加唯一约束
+        self._create_table('DELETE FROM %s WHERE id NOT IN (SELECT MIN(id) FROM %s GROUP BY name_en)' % (
+            self.table_name_station, self.table_name_station
+        ))
+        self._create_table('CREATE UNIQUE INDEX IF NOT EXISTS uq_%s_name_en ON %s (name_en)' % (
+            self.table_name_station, self.table_name_station
+        ))
+        # 车站查询都是按这几列做等值匹配，建索引避免每次全表扫描
+        for column in ('name_cn', 'name_pinyin', 'name_pinyin_short'):
+            self._create_table('CREATE INDEX IF NOT EXISTS idx_%s_%s ON %s (%s)' % (
+                self.table_name_station, column, self.table_name_station, column
+            ))
 
-    def batch_insert_stations_data(self, stations_data):
-        for i, station in enumerate(stations_data):
-            stations_data[i] = str(station)
-        sql = 'INSERT INTO %s (name_cn, name_en, name_pinyin, name_pinyin_short) VALUES' % self.table_name_station
-        sql += Sqlite.COMMA.join(stations_data)
-        try:
-            self.cursor.execute(sql)
-            self.connect.commit()
-        except Exception as error:
-            print(colortext.light_red('批量插入车站数据错误，发生异常：%s' % error))
-            self.connect.rollback()
-            self.connect.close()
+    def create_table_meta(self):
+        sql = '''
+            CREATE TABLE IF NOT EXISTS %s (
+                key VARCHAR(32) PRIMARY KEY,
+                value TEXT
+            )
+        ''' % self.table_name_meta
+        self._create_table(sql)
+
+    def create_table_cache(self):
+        sql = '''
+            CREATE TABLE IF NOT EXISTS %s (
+                key TEXT PRIMARY KEY,
+                value TEXT NOT NULL,
+                expires_at REAL NOT NULL,
+                accessed_at REAL NOT NULL
+            )
+        ''' % self.table_name_cache
+        self._create_table(sql)
+        self._create_table('CREATE INDEX IF NOT EXISTS idx_%s_accessed_at ON %s (accessed_at)' % (
+            self.table_name_cache, self.table_name_cache
+        ))
+
+    def select_cache(self, key, now):
+        """读取未过期的缓存，返回 (内容, 最近访问时间)，过期或不存在时返回 None；不更新访问时间，见 touch_cache"""
+        with self.lock:
+            return self.connect.execute(
+                'SELECT value, accessed_at FROM %s WHERE key = ? AND expires_at > ?' % self.table_name_cache, (key, now)
+            ).fetchone()
+
+    def touch_cache(self, accessed):
+        """在同一个事务中更新多条缓存的访问时间，accessed 为 {键: 访问时间}"""
+        with self.lock, self.connect:
+            self.connect.executemany(
+                'UPDATE %s SET accessed_at = ? WHERE key = ?' % self.table_name_cache,
+                [(accessed_at, key) for key, accessed_at in accessed.items()]
+            )
+
+    def upsert_cache(self, key, value, expires_at, now):
+        with self.lock, self.connect:
+            self.connect.execute(
+                'INSERT OR REPLACE INTO %s (key, value, expires_at, accessed_at) VALUES (?, ?, ?, ?)' % (
+                    self.table_name_cache
+                ), (key, value, expires_at, now)
+            )
+
+    def trim_cache(self, max_entries, now):
+        """删除过期缓存，并按最近访问时间淘汰超出条数上限的缓存"""
+        with self.lock, self.connect:
+            self.connect.execute('DELETE FROM %s WHERE expires_at <= ?' % self.table_name_cache, (now,))
+            self.connect.execute(
+                'DELETE FROM %s WHERE key IN (SELECT key FROM %s ORDER BY accessed_at DESC LIMIT -1 OFFSET ?)' % (
+                    self.table_name_cache, self.table_name_cache
+                ), (max_entries,)
+            )
 
-    def select_station_name_en(self, input_station_name):
-        sql = 'SELECT name_en FROM %s WHERE name_cn = "%s" OR name_pinyin = "%s"' % (
-            self.table_name_station, input_station_name, input_station_name
-        )
+    def create_table_timetable(self):
+        """
+        本地时刻表：车次、车次在两站之间的区段、以及看到该区段开行的日期
+        时刻与日期无关，只有余票每天变化，离线规划中转方案时直接读这几张表
+        """
+        self._create_table('''
+            CREATE TABLE IF NOT EXISTS %s (
+                train_uuid VARCHAR(16) PRIMARY KEY,
+                train_number VARCHAR(8) NOT NULL,
+                start_station CHAR(3) NOT NULL,
+                end_station CHAR(3) NOT NULL,
+                seat_types VARCHAR(16) NOT NULL
+            )
+        ''' % self.table_name_train)
+        self._create_table('''
+            CREATE TABLE IF NOT EXISTS %s (
+                train_uuid VARCHAR(16) NOT NULL,
+                from_station CHAR(3) NOT NULL,
+                dest_station CHAR(3) NOT NULL,
+                from_time CHAR(5) NOT NULL,
+                duration CHAR(5) NOT NULL,
+                from_station_no CHAR(2) NOT NULL,
+                to_station_no CHAR(2) NOT NULL,
+                PRIMARY KEY (train_uuid, from_station, dest_station)
+            )
+        ''' % self.table_name_segment)
+        # 查找经停某些车站的车次（select_timetable_trains_at）按出发站或到达站过滤，主键的第一列是车次编号用不上
+        for column in ('from_station', 'dest_station'):
+            self._create_table('CREATE INDEX IF NOT EXISTS idx_%s_%s ON %s (%s)' % (
+                self.table_name_segment, column, self.table_name_segment, column
+            ))
+        # 按查询时的出发、到达电报码（可以是城市里的任意车站）和乘车日期记录开行，规划时按这三列查找
+        self._create_table('''
+            CREATE TABLE IF NOT EXISTS %s (
+                query_from CHAR(3) NOT NULL,
+                query_dest CHAR(3) NOT NULL,
+                train_date CHAR(10) NOT NULL,
+                train_uuid VARCHAR(16) NOT NULL,
+                from_station CHAR(3) NOT NULL,
+                dest_station CHAR(3) NOT NULL,
+                PRIMARY KEY (query_from, query_dest, train_date, train_uuid, from_station, dest_station)
+            ) WITHOUT ROWID
+        ''' % self.table_name_validity)
+
+    def store_timetable(self, trains, segments, validity):
+        """在同一个事务中写入车次、区段和开行日期，已有的记录以新数据为准"""
+        with self.lock, self.connect:
+            self.connect.executemany('INSERT OR REPLACE INTO %s VALUES (?, ?, ?, ?, ?)' % self.table_name_train, trains)
+            self.connect.executemany(
+                'INSERT OR REPLACE INTO %s VALUES (?, ?, ?, ?, ?, ?, ?)' % self.table_name_segment, segments
+            )
+            self.connect.executemany(
+                'INSERT OR IGNORE INTO %s VALUES (?, ?, ?, ?, ?, ?)' % self.table_name_validity, validity
+            )
+
+    def select_timetable(self, query_from, query_dest, first_date, last_date):
+        """
+        查询在 first_date 到 last_date 之间看到过的区段，每个区段一行
+        返回 (车次编号, 车次, 始发站, 终点站, 出发站, 到达站, 发车时间, 历时, 出发站序号, 到达站序号, 席别, 最近一次开行日期)
+        """
+        sql = '''
+            SELECT s.train_uuid, t.train_number, t.start_station, t.end_station, s.from_station, s.dest_station,
+                   s.from_time, s.duration, s.from_station_no, s.to_station_no, t.seat_types, MAX(v.train_date)
+            FROM %s v
+            JOIN %s s ON s.train_uuid = v.train_uuid AND s.from_station = v.from_station
+                AND s.dest_station = v.dest_station
+            JOIN %s t ON t.train_uuid = v.train_uuid
+            WHERE v.query_from = ? AND v.query_dest = ? AND v.train_date BETWEEN ? AND ?
+            GROUP BY s.train_uuid, s.from_station, s.dest_station
+        ''' % (self.table_name_validity, self.table_name_segment, self.table_name_train)
+        with self.lock:
+            return self.connect.execute(sql, (query_from, query_dest, first_date, last_date)).fetchall()
+
+    def select_timetable_trains_at(self, station_codes):
+        """
+        查询停靠 station_codes 中任意一个车站的车次在本地时刻表中的全部区段，每个区段一行
+        返回 (车次编号, 始发站, 终点站, 出发站, 到达站, 出发站序号, 到达站序号, 发车时间, 历时)
+        """
+        placeholders = ', '.join('?' * len(station_codes))
+        sql = '''
+            SELECT s.train_uuid, t.start_station, t.end_station, s.from_station, s.dest_station,
+                   s.from_station_no, s.to_station_no, s.from_time, s.duration
+            FROM %s s
+            JOIN %s t ON t.train_uuid = s.train_uuid
+            WHERE s.train_uuid IN (
+                SELECT train_uuid FROM %s WHERE from_station IN (%s) OR dest_station IN (%s)
+            )
+        ''' % (self.table_name_segment, self.table_name_train, self.table_name_segment, placeholders, placeholders)
+        with self.lock:
+            return self.connect.execute(sql, list(station_codes) * 2).fetchall()
+
+    def get_meta(self, key, default=None):
+        sql = 'SELECT value FROM %s WHERE key = ?' % self.table_name_meta
+        self.cursor.execute(sql, (key,))
+        result = self.cursor.fetchone()
+        return result[0] if result else default
+
+    def set_meta(self, **values):
+        sql = 'INSERT OR REPLACE INTO %s (key, value) VALUES (?, ?)' % self.table_name_meta
+        self.cursor.executemany(sql, [(key, value) for key, value in values.items() if value is not None])
+        self.connect.commit()
+
+    def sync_stations_data(self, changed_stations, removed_codes=(), **meta):
+        """在同一个事务中更新有变化的车站、删除已下线的车站并记录同步版本信息"""
+        upsert_sql = '''
+            INSERT INTO %s (name_cn, name_en, name_pinyin, name_pinyin_short) VALUES (?, ?, ?, ?)
+            ON CONFLICT (name_en) DO UPDATE SET
+                name_cn = excluded.name_cn,
+                name_pinyin = excluded.name_pinyin,
+                name_pinyin_short = excluded.name_pinyin_short
+        ''' % self.table_name_station
+        delete_sql = 'DELETE FROM %s WHERE name_en = ?' % self.table_name_station
+        meta_sql = 'INSERT OR REPLACE INTO %s (key, value) VALUES (?, ?)' % self.table_name_meta
         try:
-            self.cursor.execute(sql)
-            result = self.cursor.fetchone()
-            return result and result[0]
+            with self.connect:
+                self.connect.executemany(upsert_sql, changed_stations)
+                self.connect.executemany(delete_sql, [(code,) for code in removed_codes])
+                self.connect.executemany(meta_sql, [(key, value) for key, value in meta.items() if value is not None])
+            return True
         except Exception as error:
-            print(colortext.light_red('数据查询失败：%s\n发生异常：%s' % (sql, error)))
-            self.connect.close()
+            print(colortext.light_red('同步车站数据错误，发生异常：%s' % error), file=sys.stderr)
+            return False
 
-    def select_station_name_cn(self, input_station_name):
-        sql = 'SELECT name_cn FROM %s WHERE name_en = "%s" OR name_pinyin = "%s"' % (
-            self.table_name_station, input_station_name, input_station_name
-        )
+    def select_all_stations(self):
+        """按插入顺序返回全部车站数据，用于一次性构建内存中的车站索引"""
+        sql = 'SELECT name_cn, name_en, name_pinyin, name_pinyin_short FROM %s ORDER BY id' % self.table_name_station
         try:
             self.cursor.execute(sql)
-            result = self.cursor.fetchone()
-            return result and result[0]
+            return self.cursor.fetchall()
         except Exception as error:
             print(colortext.light_red('数据查询失败：%s\n发生异常：%s' % (sql, error)))
             self.connect.close()
@@ -0,0 +1,164 @@
+#!/usr/bin/env python3
+"""
+换乘方案的多目标排序：总历时、换乘时间、偏离期望出发时段的分钟数、余票和票价，只输出不被其它方案全面超过的方案（帕累托前沿）
+票价接口最慢也最容易被限流，先只用不需要联网的指标求前几层前沿，只为这些方案涉及的行程段查询票价，
+再把票价加进来求最终的前沿；不在这几层里的方案，票价再便宜也只会被略过，属于有意的近似
+"""
+
+from render import PRICE_CODES
+from trainleg import PLENTY
+
+
+def seats_left(value):
+    """余票字段换算成张数：有 -> PLENTY，数字 -> 张数，无 / * / 空 -> 0"""
+    if value == '有':
+        return PLENTY
+    return int(value) if value.isdigit() else 0
+
+
+def parse_window(text):
+    """解析 HH:MM-HH:MM 形式的期望出发时段，返回当天的 (开始分钟数, 结束分钟数)"""
+    start, _, end = text.partition('-')
+    window = []
+    for clock in (start, end):
+        hours, _, minutes = clock.strip().partition(':')
+        if not (hours.isdigit() and minutes.isdigit()):
+            raise ValueError('出发时段应为 HH:MM-HH:MM：%s' % text)
+        window.append(int(hours) * 60 + int(minutes))
+    return tuple(window)
+
+
+def leg_price_params(leg):
+    """查询一个行程段票价的请求参数，与 TrainTicketsFinder._price_request_params 一致"""
+    return {
+        'train_no': leg.train_uuid,
+        'from_station_no': leg.from_station_no,
+        'to_station_no': leg.to_station_no,
+        'seat_types': leg.seat_types,
+        'train_date': leg.train_date,
+    }
+
+
+def lowest_fare(leg, price_info):
+    """还有余票的坐席中最便宜的票价，没有可用的票价时返回 None"""
+    fares = []
+    for name, remain in leg.tickets_remain.items():
+        if not seats_left(remain):
+            continue
+        price = next((price_info[code] for code in PRICE_CODES[name] if code in price_info), '')
+        try:
+            fares.append(float(price.lstrip('¥')))
+        except ValueError:
+            continue
+    return min(fares) if fares else None
+
+
+def dominates(a, b):
+    """a 的每一项都不比 b 差且至少有一项更好（各项都是越小越好）"""
+    better = False
+    for x, y in zip(a, b):
+        if x > y:
+            return False
+        if x < y:
+            better = True
+    return better
+
+
+def skyline(items, vector):
+    """
+    sort-filter-skyline：按各项之和排序后，一个元素只可能被排在它前面的元素支配，
+    每个元素只需和已经确定在前沿上的元素比较；返回 (前沿, 其余元素)，前沿按排序后的顺序
+    """
+    keyed = sorted(((vector(item), item) for item in items), key=lambda entry: (sum(entry[0]), entry[0]))
+    front = []
+    front_vectors = []
+    rest = []
+    for values, item in keyed:
+        if any(dominates(other, values) for other in front_vectors):
+            rest.append(item)
+        else:
+            front.append(item)
+            front_vectors.append(values)
+    return front, rest
+
+
+class ParetoRanking:
+    """
+    接口与 TopK 相同：push 加入组合，release 产出结果；全部组合加入后（bound 为 None）才能确定前沿
+    price_fetcher - PriceFetcher，只为廉价指标下前 depth 层前沿上的方案涉及的行程段查询票价，同一个行程段只查一次
+    k - 只输出前沿中总历时最短的 k 个，为 None 时输出整个前沿
+    depart_window - 期望的出发时段 (开始分钟数, 结束分钟数)，为 None 时不考虑出发时段
+    """
+
+    def __init__(self, price_fetcher, k=None, depth=2, depart_window=None, profiler=None):
+        self.price_fetcher = price_fetcher
+        self.k = k
+        self.depth = depth
+        self.depart_window = depart_window
+        self.profiler = profiler or price_fetcher.profiler
+        self.pairs = []
+        # 行程段 -> 最低票价，供输出时显示
+        self.fares = {}
+        self._leg_seats = {}
+        self._released = False
+
+    def __len__(self):
+        return len(self.pairs)
+
+    def push(self, first, second):
+        self.pairs.append((first, second))
+
+    def _window_minutes(self, first):
+        if self.depart_window is None:
+            return 0
+        start, end = self.depart_window
+        clock = first.from_time.hour * 60 + first.from_time.minute
+        return max(start - clock, clock - end, 0)
+
+    def _seats(self, leg):
+        """行程段余票最多的坐席的张数，同一个行程段会出现在很多组合里，只计算一次"""
+        seats = self._leg_seats.get(leg)
+        if seats is None:
+            seats = self._leg_seats[leg] = max(map(seats_left, leg.tickets_remain.values()))
+        return seats
+
+    def _cheap_vector(self, pair):
+        """不需要联网的各项指标，都是越小越好：总历时、换乘时间（分钟）、偏离出发时段的分钟数、两程中较少的余票取负"""
+        first, second = pair
+        return ((second.dest_time - first.from_time).total_seconds() // 60,
+                (second.from_time - first.dest_time).total_seconds() // 60,
+                self._window_minutes(first),
+                -min(self._seats(first), self._seats(second)))
+
+    def fare(self, first, second):
+        first_fare = self.fares.get(first)
+        second_fare = self.fares.get(second)
+        return None if first_fare is None or second_fare is None else first_fare + second_fare
+
+    def release(self, bound=None):
+        if bound is not None or self._released:
+            return
+        self._released = True
+        with self.profiler.phase('pareto'):
+            vectors = {pair: self._cheap_vector(pair) for pair in self.pairs}
+            # 逐层剥离前沿，前 depth 层作为需要查询票价的候选
+            shortlist = []
+            rest = self.pairs
+            for _ in range(self.depth):
+                if not rest:
+                    break
+                front, rest = skyline(rest, vectors.__getitem__)
+                shortlist += front
+        legs = list(dict.fromkeys(leg for pair in shortlist for leg in pair))
+        self.profiler.count('pareto.pairs', len(self.pairs))
+        self.profiler.count('pareto.priced_legs', len(legs))
+        with self.profiler.phase('prices'):
+            price_infos = self.price_fetcher.fetch_all([leg_price_params(leg) for leg in legs])
+        for leg, price_info in zip(legs, price_infos):
+            self.fares[leg] = lowest_fare(leg, price_info)
+        with self.profiler.phase('pareto'):
+            # 没有票价的方案按最贵处理，只有其它指标更好时才会留在前沿上
+            front, _ = skyline(shortlist, lambda pair: vectors[pair] + (
+                self.fare(*pair) if self.fare(*pair) is not None else float('inf'),))
+            front.sort(key=lambda pair: vectors[pair][0])
+        yield from front[:self.k] if self.k is not None else front
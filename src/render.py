@@ -0,0 +1,285 @@
+#!/usr/bin/env python3
+"""
+查询结果的输出格式：json / csv / ndjson 直接输出数据，不做任何着色，便于交给其它程序处理；
+stream 是逐行输出的定宽彩色表格，每一行算好就立即写出，不像 table 格式那样要缓存整张表再计算列宽
+"""
+
+import csv
+import json
+import re
+import sys
+import unicodedata
+
+import colortext
+from trainleg import DEST_STATION, DEST_TIME, DURATION, FROM_STATION, FROM_TIME, SEAT_FIELDS, TRAIN_NUMBER
+
+# table 是带边框的表格（见 BoxTable，中转查询为逐行的彩色文字），其余是本模块提供的格式
+FORMATS = ('table', 'stream', 'json', 'csv', 'ndjson')
+# 输出给其它程序读取的格式，提示信息改为写到标准错误；jsonl 是 ndjson 的别名
+MACHINE_FORMATS = ('json', 'csv', 'ndjson', 'jsonl')
+
+# 各坐席对应的票价字段，站票先取硬座票价，没有时取 WZ
+PRICE_CODES = {'swz': ('A9',), 'ydz': ('M',), 'edz': ('O',), 'rw': ('A4',), 'yw': ('A3',), 'yz': ('A1',),
+               'wz': ('A1', 'WZ')}
+
+
+def train_record(train_info, price_info, stations):
+    """直达查询的一行结果，train_info 为余票接口单条数据的字段列表，price_info 为票价接口的 data 字段"""
+    return {
+        'train_number': train_info[TRAIN_NUMBER],
+        'from_station': stations.name_cn(train_info[FROM_STATION]),
+        'from_station_e': train_info[FROM_STATION],
+        'dest_station': stations.name_cn(train_info[DEST_STATION]),
+        'dest_station_e': train_info[DEST_STATION],
+        'from_time': train_info[FROM_TIME],
+        'dest_time': train_info[DEST_TIME],
+        'duration': train_info[DURATION],
+        'seats': {name: train_info[index] for name, index in SEAT_FIELDS},
+        'prices': {name: next((price_info[code] for code in PRICE_CODES[name] if code in price_info), '')
+                   for name, _ in SEAT_FIELDS},
+    }
+
+
+def transfer_record(first, second, leg_dicts=None, fares=None):
+    """
+    中转查询的一个方案，时间长度以分钟为单位
+    leg_dicts - 同一趟车会出现在很多方案里，传入一个字典缓存每个行程段转换的结果，每个行程段只转换一次
+    fares - 各行程段的最低票价，按 pareto 排序时传入，结果中加上两程票价之和 fare（没有票价时为 None）
+    """
+    if leg_dicts is None:
+        leg_dicts = {}
+    first_dict = leg_dicts.get(first)
+    if first_dict is None:
+        first_dict = leg_dicts[first] = first.to_dict()
+    second_dict = leg_dicts.get(second)
+    if second_dict is None:
+        second_dict = leg_dicts[second] = second.to_dict()
+    record = {
+        'total_minutes': int((second.dest_time - first.from_time).total_seconds() // 60),
+        'layover_minutes': int((second.from_time - first.dest_time).total_seconds() // 60),
+        'first': first_dict,
+        'second': second_dict,
+    }
+    if fares is not None:
+        first_fare, second_fare = fares.get(first), fares.get(second)
+        record['fare'] = None if first_fare is None or second_fare is None else round(first_fare + second_fare, 1)
+    return record
+
+
+def flatten(record, prefix=''):
+    """把嵌套的字典展开成一层，键用下划线连接，用于 CSV 输出"""
+    flat = {}
+    for key, value in record.items():
+        if isinstance(value, dict):
+            flat.update(flatten(value, prefix + key + '_'))
+        else:
+            flat[prefix + key] = value
+    return flat
+
+
+def display_width(text):
+    """终端中的显示宽度，中文等全角字符占两列"""
+    if text.isascii():
+        return len(text)
+    return sum(2 if unicodedata.east_asian_width(char) in 'WF' else 1 for char in text)
+
+
+# 颜色控制码不占显示宽度
+_ANSI = re.compile(r'\x1b\[[0-9;]*m')
+
+
+def _center(text, width):
+    """按显示宽度居中，多出的一个空格放在哪边与 str.center 相同"""
+    margin = width - display_width(_ANSI.sub('', text))
+    left = margin // 2 + (margin & width & 1)
+    return ' ' * left + text + ' ' * (margin - left)
+
+
+class BoxTable:
+    """
+    带边框的表格，样式与 PrettyTable 的默认样式一致：单元格居中，多行的单元格顶端对齐
+    只用标准库计算显示宽度，不必为此导入 prettytable 和 wcwidth，完全命中缓存的查询启动时少花几十毫秒
+    """
+
+    def __init__(self, field_names):
+        self.field_names = list(field_names)
+        self.rows = []
+
+    def add_row(self, row):
+        self.rows.append([str(cell).split('\n') for cell in row])
+
+    def _line(self, cells, widths):
+        return '|' + '|'.join(' %s ' % _center(cell, width) for cell, width in zip(cells, widths)) + '|'
+
+    def __str__(self):
+        widths = [display_width(name) for name in self.field_names]
+        for row in self.rows:
+            for index, lines in enumerate(row):
+                widths[index] = max([widths[index]] + [display_width(_ANSI.sub('', line)) for line in lines])
+        rule = '+' + '+'.join('-' * (width + 2) for width in widths) + '+'
+        output = [rule, self._line(self.field_names, widths), rule]
+        for row in self.rows:
+            for y in range(max(len(lines) for lines in row)):
+                output.append(self._line([lines[y] if y < len(lines) else '' for lines in row], widths))
+        output.append(rule)
+        return '\n'.join(output)
+
+
+class Renderer:
+
+    def __init__(self, out=None):
+        self.out = out or sys.stdout
+
+    def row(self, record):
+        raise NotImplementedError
+
+    def close(self):
+        self.out.flush()
+
+
+class NdjsonRenderer(Renderer):
+    """每个结果一行 JSON"""
+
+    def __init__(self, out=None):
+        super().__init__(out)
+        self.encode = json.JSONEncoder(ensure_ascii=False).encode
+
+    def row(self, record):
+        self.out.write(self.encode(record) + '\n')
+
+
+class JsonRenderer(Renderer):
+    """全部结果组成一个 JSON 数组，结束时一次输出"""
+
+    def __init__(self, out=None):
+        super().__init__(out)
+        self.records = []
+
+    def row(self, record):
+        self.records.append(record)
+
+    def close(self):
+        json.dump(self.records, self.out, ensure_ascii=False, indent=2)
+        self.out.write('\n')
+        super().close()
+
+
+class CsvRenderer(Renderer):
+    """嵌套字段展开成 first_train_number 这样的列名，表头取自第一行"""
+
+    def __init__(self, out=None):
+        super().__init__(out)
+        self.writer = None
+
+    def row(self, record):
+        flat = flatten(record)
+        if self.writer is None:
+            self.writer = csv.DictWriter(self.out, list(flat))
+            self.writer.writeheader()
+        self.writer.writerow(flat)
+
+
+def _seat_cell(seat):
+    return lambda record: '%s %s' % (record['seats'][seat] or '-', record['prices'][seat])
+
+
+def _seat_count(seat):
+    return lambda record: record['seats'][seat] or '-'
+
+
+def _leg_time(leg, field):
+    # ISO 格式的 2021-01-16T08:00 显示为 01-16 08:00
+    return lambda record: record[leg][field][5:].replace('T', ' ')
+
+
+def _minutes(field):
+    return lambda record: '%d:%02d' % divmod(record[field], 60)
+
+
+def _leg_seat(leg):
+    def cell(record):
+        seats = record[leg]['seats']
+        return seats['edz'] or seats['yz'] or '-'
+    return cell
+
+
+# 定宽表格的列：(表头, 显示宽度, 取值函数, 颜色)
+TRAIN_COLUMNS = [
+    ('车次', 7, lambda record: record['train_number'], None),
+    ('出发站', 10, lambda record: record['from_station'], 'GREEN'),
+    ('到达站', 10, lambda record: record['dest_station'], 'RED'),
+    ('出发', 5, lambda record: record['from_time'], 'GREEN'),
+    ('到达', 5, lambda record: record['dest_time'], 'RED'),
+    ('历时', 5, lambda record: record['duration'], None),
+] + [(title, 12, _seat_cell(seat), 'YELLOW')
+     for title, seat in (('商务/特等', 'swz'), ('一等座', 'ydz'), ('二等座', 'edz'), ('软卧', 'rw'), ('硬卧', 'yw'),
+                         ('硬座', 'yz'), ('站票', 'wz'))]
+
+# 不带票价的行程段（TrainLeg.to_dict 的结果），常驻服务返回的直达查询结果用这些列显示
+LEG_COLUMNS = [
+    ('车次', 7, lambda record: record['train_number'], None),
+    ('出发站', 10, lambda record: record['from_station'], 'GREEN'),
+    ('到达站', 10, lambda record: record['dest_station'], 'RED'),
+    ('出发', 5, lambda record: record['from_time'][11:], 'GREEN'),
+    ('到达', 11, lambda record: record['dest_time'][5:].replace('T', ' '), 'RED'),
+    ('历时', 5, lambda record: record['duration'], None),
+] + [(title, 6, _seat_count(seat), 'YELLOW')
+     for title, seat in (('商务', 'swz'), ('一等座', 'ydz'), ('二等座', 'edz'), ('软卧', 'rw'), ('硬卧', 'yw'),
+                         ('硬座', 'yz'), ('站票', 'wz'))]
+
+TRANSFER_COLUMNS = [
+    ('总历时', 6, _minutes('total_minutes'), 'GREEN'),
+    ('车次', 7, lambda record: record['first']['train_number'], 'RED'),
+    ('余票', 4, _leg_seat('first'), 'BLUE'),
+    ('出发站', 10, lambda record: record['first']['from_station'], None),
+    ('出发', 11, _leg_time('first', 'from_time'), None),
+    ('换乘站', 10, lambda record: record['first']['dest_station'], None),
+    ('到达', 11, _leg_time('first', 'dest_time'), None),
+    ('换乘', 5, _minutes('layover_minutes'), 'YELLOW'),
+    ('车次', 7, lambda record: record['second']['train_number'], 'RED'),
+    ('余票', 4, _leg_seat('second'), 'BLUE'),
+    ('出发', 11, _leg_time('second', 'from_time'), None),
+    ('到达站', 10, lambda record: record['second']['dest_station'], None),
+    ('到达', 11, _leg_time('second', 'dest_time'), None),
+]
+
+# 按 pareto 排序时多一列两程票价之和
+PRICED_TRANSFER_COLUMNS = TRANSFER_COLUMNS + [
+    ('票价', 8, lambda record: '-' if record['fare'] is None else '%.1f' % record['fare'], 'YELLOW'),
+]
+
+
+class StreamRenderer(Renderer):
+    """
+    定宽的彩色表格，每行立即写出
+    color - 是否着色，默认只在输出到终端时着色；颜色控制码在创建时取一次，之后只做字符串拼接
+    """
+
+    def __init__(self, columns, out=None, color=None):
+        super().__init__(out)
+        self.columns = columns
+        if color is None:
+            color = self.out.isatty()
+        self.codes = [colortext.color_codes(column[3]) if color and column[3] else ('', '') for column in columns]
+        self.out.write(' '.join(self._pad(title, width) for title, width, _, _ in columns).rstrip() + '\n')
+
+    @staticmethod
+    def _pad(text, width):
+        return text + ' ' * (width - display_width(text))
+
+    def row(self, record):
+        cells = []
+        for (_, width, value, _), (start, end) in zip(self.columns, self.codes):
+            text = value(record)
+            cells.append(start + text + end + ' ' * (width - display_width(text)))
+        self.out.write(' '.join(cells).rstrip() + '\n')
+
+
+def create_renderer(output_format, kind, out=None):
+    """kind 为 trains（直达查询）、legs（不带票价的行程段）、transfers（中转查询）或 priced_transfers（带票价的中转查询）"""
+    if output_format == 'stream':
+        columns = {'trains': TRAIN_COLUMNS, 'legs': LEG_COLUMNS, 'transfers': TRANSFER_COLUMNS,
+                   'priced_transfers': PRICED_TRANSFER_COLUMNS}[kind]
+        return StreamRenderer(columns, out)
+    renderers = {'json': JsonRenderer, 'csv': CsvRenderer, 'ndjson': NdjsonRenderer, 'jsonl': NdjsonRenderer}
+    return renderers[output_format](out)
@@ -0,0 +1,96 @@
+#!/usr/bin/env python3
+"""内存中的车站索引，一次性从 station 表加载，替代逐条的 SQLite 车站名查询"""
+
+import json
+import os
+from bisect import bisect_left
+from collections import namedtuple
+
+Station = namedtuple('Station', ['name_cn', 'name_en', 'name_pinyin', 'name_pinyin_short'])
+
+
+class StationIndex:
+
+    def __init__(self, stations=()):
+        # 中文名、电报码、全拼、简拼分别建一张字典，重复的键保留最先出现的车站（与原 SQL 的 fetchone 行为一致）
+        self.by_cn = {}
+        self.by_en = {}
+        self.by_pinyin = {}
+        self.by_pinyin_short = {}
+        # 所有可输入的名字排好序，用于前缀模糊匹配，第一次做前缀匹配时才构建
+        self._prefix_keys = None
+        self.load(stations)
+
+    @classmethod
+    def from_db(cls, db):
+        return cls(db.select_all_stations() or ())
+
+    @classmethod
+    def load_snapshot(cls, path, version):
+        """读取本地的车站快照文件，文件不存在或版本不一致时返回 None"""
+        if not os.path.exists(path):
+            return None
+        try:
+            with open(path, encoding='utf-8') as snapshot:
+                data = json.load(snapshot)
+        except (OSError, ValueError):
+            return None
+        if data.get('version') != version or not data.get('stations'):
+            return None
+        return cls(data['stations'])
+
+    def save_snapshot(self, path, version):
+        """把车站数据写成快照文件，下次启动直接读取，不必再打开数据库"""
+        data = {'version': version, 'stations': [list(station) for station in self.by_en.values()]}
+        temp_path = path + '.tmp'
+        with open(temp_path, 'w', encoding='utf-8') as snapshot:
+            json.dump(data, snapshot, ensure_ascii=False, separators=(',', ':'))
+        os.replace(temp_path, path)
+
+    def load(self, stations):
+        for row in stations:
+            station = Station(*row)
+            self.by_cn.setdefault(station.name_cn, station)
+            self.by_en.setdefault(station.name_en, station)
+            self.by_pinyin.setdefault(station.name_pinyin, station)
+            self.by_pinyin_short.setdefault(station.name_pinyin_short, station)
+        self._prefix_keys = None
+
+    def __len__(self):
+        return len(self.by_en)
+
+    def lookup(self, name):
+        """按中文名、电报码、全拼、简拼的顺序解析车站，找不到时返回 None"""
+        return (self.by_cn.get(name) or self.by_en.get(name)
+                or self.by_pinyin.get(name) or self.by_pinyin_short.get(name))
+
+    def resolve(self, name):
+        """返回 (中文站名, 电报码)，找不到时返回 None"""
+        station = self.lookup(name)
+        return station and (station.name_cn, station.name_en)
+
+    def name_en(self, name):
+        station = self.lookup(name)
+        return station and station.name_en
+
+    def name_cn(self, name):
+        station = self.lookup(name)
+        return station and station.name_cn
+
+    def prefix(self, prefix, limit=10):
+        """前缀匹配中文名或拼音，用于模糊输入时给出候选车站"""
+        if self._prefix_keys is None:
+            keys = set()
+            for table in (self.by_cn, self.by_pinyin, self.by_pinyin_short):
+                keys.update((name, station.name_en) for name, station in table.items())
+            self._prefix_keys = sorted(keys)
+        stations = []
+        seen = set()
+        start = bisect_left(self._prefix_keys, (prefix, ''))
+        for name, name_en in self._prefix_keys[start:]:
+            if not name.startswith(prefix) or len(stations) >= limit:
+                break
+            if name_en not in seen:
+                seen.add(name_en)
+                stations.append(self.by_en[name_en])
+        return stations
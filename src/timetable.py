@@ -0,0 +1,129 @@
+#!/usr/bin/env python3
+"""
+本地时刻表与离线中转规划
+每次联网查询余票时顺带把车次的时刻（与日期无关的部分）写入数据库；规划中转方案时先用本地时刻表配对和排序，
+只为排名靠前的候选方案联网刷新余票，请求次数取决于结果数量，而不是中转城市数 × 天数
+"""
+
+from datetime import datetime, timedelta
+
+from trainleg import (DEST_STATION, DURATION, END_STATION, FROM_STATION, FROM_STATION_NO, FROM_TIME, SEAT_TYPES,
+                      START_STATION, STATUS, TO_STATION_NO, TRAIN_NUMBER, TRAIN_UUID, TrainLeg, is_stopped)
+from transfer import RANK_KEYS, join_transfers
+
+
+class Timetable:
+    """
+    window_days - 时刻表按天记录开行日期，某天没有记录时，前后 window_days 天内看到过的车次也认为会开行；
+    这样得到的候选方案可能包含当天并不开行的车次，刷新余票时会被剔除
+    """
+
+    def __init__(self, db, window_days=7):
+        self.db = db
+        self.window_days = window_days
+
+    def record(self, query_from, query_dest, train_date, train_list):
+        """记录一次余票查询结果中的车次时刻，停运的车次不记录"""
+        trains = []
+        segments = []
+        validity = []
+        for train in train_list:
+            train_info = train.split('|')
+            if is_stopped(train_info):
+                continue
+            train_uuid = train_info[TRAIN_UUID]
+            trains.append((train_uuid, train_info[TRAIN_NUMBER], train_info[START_STATION], train_info[END_STATION],
+                           train_info[SEAT_TYPES]))
+            segments.append((train_uuid, train_info[FROM_STATION], train_info[DEST_STATION], train_info[FROM_TIME],
+                             train_info[DURATION], train_info[FROM_STATION_NO], train_info[TO_STATION_NO]))
+            validity.append((query_from, query_dest, train_date, train_uuid, train_info[FROM_STATION],
+                             train_info[DEST_STATION]))
+        if trains:
+            self.db.store_timetable(trains, segments, validity)
+
+    def legs(self, query_from, query_dest, train_date, stations):
+        """从本地时刻表构造 train_date 当天的行程段，余票字段为空；本地没有这个行程段时返回空列表"""
+        day = datetime.strptime(train_date, '%Y-%m-%d')
+        window = timedelta(days=self.window_days)
+        rows = self.db.select_timetable(query_from, query_dest, str((day - window).date()), str((day + window).date()))
+        legs = []
+        for row in rows:
+            # 按余票接口的字段顺序拼回一条记录，之后的配对、排序和显示都可以照常使用 TrainLeg
+            train_info = [''] * (SEAT_TYPES + 1)
+            train_info[STATUS] = '预订'
+            (train_info[TRAIN_UUID], train_info[TRAIN_NUMBER], train_info[START_STATION], train_info[END_STATION],
+             train_info[FROM_STATION], train_info[DEST_STATION], train_info[FROM_TIME], train_info[DURATION],
+             train_info[FROM_STATION_NO], train_info[TO_STATION_NO], train_info[SEAT_TYPES], _) = row
+            legs.append(TrainLeg('|'.join(train_info), train_info, day, stations))
+        return legs
+
+
+class OfflinePlanner:
+
+    def __init__(self, finder):
+        self.finder = finder
+        self.timetable = finder.timetable
+        # 本次规划中已经联网刷新过的行程段：{(出发电报码, 到达电报码, 日期): {(车次编号, 出发站, 到达站): TrainLeg}}
+        self._live = {}
+        self.refreshed = 0
+
+    def _schedule(self, key):
+        """本地时刻表中的行程段；本地还没有记录时联网查询一次（同时写入时刻表），此后同一行程段都不必再联网"""
+        legs = self.timetable.legs(*key, self.finder.stations)
+        if not legs:
+            self.finder.profiler.count('timetable.miss')
+            train_list = self.finder._fetch_train_list(*key)
+            legs = self.timetable.legs(*key, self.finder.stations)
+            if not legs and train_list:
+                # 余票来自写入时刻表之前的缓存，这里补记一次
+                self.timetable.record(*key, train_list)
+                legs = self.timetable.legs(*key, self.finder.stations)
+        return legs
+
+    def _refresh(self, key):
+        """刷新一个行程段的余票，返回其中还有票的车次"""
+        if key not in self._live:
+            self.refreshed += 1
+            trains = self.finder._parse_train_list(self.finder._fetch_train_list(*key), key[2], report_stopped=False)
+            self._live[key] = {(train.train_uuid, train.from_station_e, train.dest_station_e): train for train in trains}
+        return self._live[key]
+
+    def plan(self, source_en, hub_codes, destination_en, train_date, min_layover=timedelta(0), max_layover=None,
+             same_inter=True, top=10, rank='total'):
+        """
+        用本地时刻表配对出全部候选方案并排序，从排名最前的方案开始逐个刷新两程的余票，
+        两程都还有票的方案才输出，凑够 top 个就停止
+        返回 (输出的方案列表, 候选方案数)
+        """
+        candidates = []
+        with self.finder.profiler.phase('plan'):
+            for hub in hub_codes:
+                first_key = (source_en, hub, train_date)
+                second_key = (hub, destination_en, train_date)
+                first_trains = sorted(self._schedule(first_key), key=lambda tr: tr.from_time)
+                for first, second in join_transfers(first_trains, self._schedule(second_key), min_layover,
+                                                    max_layover, same_inter):
+                    candidates.append((first_key, second_key, first, second))
+            rank_key = RANK_KEYS[rank]
+            candidates.sort(key=lambda candidate: rank_key(candidate[2], candidate[3]))
+
+        # 排名最靠前的一批候选方案涉及的行程段先并发刷新，后面的按需刷新
+        shortlist = list(dict.fromkeys(key for candidate in candidates[:top] for key in candidate[:2]))
+        if len(shortlist) > 1:
+            from concurrent.futures import ThreadPoolExecutor
+
+            with ThreadPoolExecutor(max_workers=min(self.finder.workers, len(shortlist))) as executor:
+                list(executor.map(self._refresh, shortlist))
+
+        results = []
+        for first_key, second_key, first, second in candidates:
+            if len(results) >= top:
+                break
+            live_first = self._refresh(first_key).get((first.train_uuid, first.from_station_e, first.dest_station_e))
+            if live_first is None:
+                continue
+            live_second = self._refresh(second_key).get(
+                (second.train_uuid, second.from_station_e, second.dest_station_e))
+            if live_second is not None:
+                results.append((live_first, live_second))
+        return results, len(candidates)
@@ -0,0 +1,170 @@
+#!/usr/bin/env python3
+"""
+余票接口单条车次数据的紧凑表示
+按 12306 现有的接口，单条数据是以 | 分隔的字符串，下面是各字段所在的下标
+"""
+
+import re
+from datetime import timedelta
+
+STATUS = 1  # 预订 / 列车停运
+TRAIN_UUID = 2
+TRAIN_NUMBER = 3
+START_STATION = 4  # 始发站电报码
+END_STATION = 5  # 终点站电报码
+FROM_STATION = 6  # 出发车站电报码
+DEST_STATION = 7  # 到达车站电报码
+FROM_TIME = 8
+DEST_TIME = 9
+DURATION = 10
+FROM_STATION_NO = 16
+TO_STATION_NO = 17
+RW = 23  # 软卧
+WZ = 26  # 站票
+YW = 28  # 硬卧
+YZ = 29  # 硬座
+EDZ = 30  # 二等座
+YDZ = 31  # 一等座
+SWZ = 32  # 商务座/特等座
+SEAT_TYPES = 35
+
+# 余票字段，顺序与表格中的列一致
+SEAT_FIELDS = (('swz', SWZ), ('ydz', YDZ), ('edz', EDZ), ('rw', RW), ('yw', YW), ('yz', YZ), ('wz', WZ))
+SEAT_NAMES = {'swz': '商务座/特等座', 'ydz': '一等座', 'edz': '二等座', 'rw': '软卧', 'yw': '硬卧', 'yz': '硬座', 'wz': '站票'}
+
+# 余票为“有”或者是不为 0 的张数时说明还有票；七个字段拼起来匹配时，出现非 0 数字说明某个字段的张数大于 0
+_AVAILABLE = re.compile(r'有|[1-9]')
+
+# 余票为“有”时按这么多张计算
+PLENTY = 99
+
+# HH:MM 形式的发车时间和历时 -> timedelta，不同的取值只有几千种，换算一次后缓存
+_CLOCKS = {}
+
+
+def clock_delta(text):
+    delta = _CLOCKS.get(text)
+    if delta is None:
+        hours, minutes = text.split(':')
+        delta = _CLOCKS[text] = timedelta(hours=int(hours), minutes=int(minutes))
+    return delta
+
+
+def is_stopped(train_info):
+    return train_info[STATUS] == '列车停运'
+
+
+def is_available(train_info):
+    """任意一个坐席还有余票，七个字段拼起来只做一次正则匹配"""
+    return _AVAILABLE.search(train_info[SWZ] + train_info[YDZ] + train_info[EDZ] + train_info[RW] +
+                             train_info[YW] + train_info[YZ] + train_info[WZ]) is not None
+
+
+class TrainLeg:
+    """
+    一趟车在两站之间的行程，只保留原始字符串、配对时要用到的几个字段和发车、到达时间
+    其余字段和中文站名在第一次访问时才解析，拆分后的字段列表缓存下来；仍然支持 leg['from_time'] 这样按字典取字段的写法
+    """
+
+    __slots__ = ('raw', 'day', 'stations', 'train_uuid', 'train_number', 'from_station_e', 'dest_station_e',
+                 'from_time', 'duration', 'dest_time', '_info')
+
+    def __init__(self, raw, train_info, day, stations):
+        # day - 乘车日期当天零点的 datetime，stations - 车站索引，用于解析中文站名
+        self.raw = raw
+        self.day = day
+        self.stations = stations
+        self.train_uuid = train_info[TRAIN_UUID]
+        self.train_number = train_info[TRAIN_NUMBER]
+        self.from_station_e = train_info[FROM_STATION]
+        self.dest_station_e = train_info[DEST_STATION]
+        # 每次配对都要按发车、到达时间排序和查找，构造时就从已经拆分好的字段换算出来
+        self.from_time = day + clock_delta(train_info[FROM_TIME])
+        self.duration = clock_delta(train_info[DURATION])
+        self.dest_time = self.from_time + self.duration
+        self._info = None
+
+    def __getitem__(self, key):
+        return getattr(self, key)
+
+    def __repr__(self):
+        return 'TrainLeg(%s %s %s->%s)' % (self.train_number, self.day.date(), self.from_station_e, self.dest_station_e)
+
+    @property
+    def train_info(self):
+        """拆分后的全部字段，第一次访问时才拆分原始字符串"""
+        if self._info is None:
+            self._info = self.raw.split('|')
+        return self._info
+
+    def field(self, index):
+        return self.train_info[index]
+
+    def _station_cn(self, code):
+        return self.stations.name_cn(code) or code
+
+    @property
+    def train_date(self):
+        return self.day.strftime('%Y-%m-%d')
+
+    @property
+    def dest_time_check(self):
+        return self.field(DEST_TIME)
+
+    @property
+    def from_station(self):
+        return self._station_cn(self.from_station_e)
+
+    @property
+    def dest_station(self):
+        return self._station_cn(self.dest_station_e)
+
+    @property
+    def start_station_e(self):
+        return self.field(START_STATION)
+
+    @property
+    def start_station(self):
+        return self._station_cn(self.start_station_e)
+
+    @property
+    def end_station_e(self):
+        return self.field(END_STATION)
+
+    @property
+    def end_station(self):
+        return self._station_cn(self.end_station_e)
+
+    @property
+    def from_station_no(self):
+        return self.field(FROM_STATION_NO)
+
+    @property
+    def to_station_no(self):
+        return self.field(TO_STATION_NO)
+
+    @property
+    def seat_types(self):
+        return self.field(SEAT_TYPES)
+
+    @property
+    def tickets_remain(self):
+        train_info = self.train_info
+        return {name: train_info[index] for name, index in SEAT_FIELDS}
+
+    def to_dict(self):
+        """转换成可以直接写成 JSON 的字典，时间为 ISO 格式的字符串，余票按 SEAT_FIELDS 的坐席名给出"""
+        train_info = self.train_info
+        return {
+            'train_number': self.train_number,
+            'train_uuid': self.train_uuid,
+            'train_date': self.train_date,
+            'from_station': self.from_station,
+            'from_station_e': self.from_station_e,
+            'dest_station': self.dest_station,
+            'dest_station_e': self.dest_station_e,
+            'from_time': self.from_time.isoformat(timespec='minutes'),
+            'dest_time': self.dest_time.isoformat(timespec='minutes'),
+            'duration': train_info[DURATION],
+            'seats': {name: train_info[index] for name, index in SEAT_FIELDS},
+        }
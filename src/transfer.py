@@ -0,0 +1,117 @@
+#!/usr/bin/env python3
+"""中转换乘的车次配对，按换乘站分组后用二分查找只枚举换乘时间窗口内可行的组合；多个中转城市结果的归并；以及换乘方案的排序"""
+
+import heapq
+from bisect import bisect_left, bisect_right
+from collections import defaultdict
+from datetime import timedelta
+
+
+def join_transfers(first_trains, second_trains, min_layover=timedelta(0), max_layover=None, same_inter=True):
+    """
+    将第一程与第二程车次配对，依次产出 (第一程, 第二程)
+    same_inter - 是否要求在同一个车站换乘，为 False 时同城不同站也可以配对
+    min_layover / max_layover - 换乘时间的上下界，max_layover 为 None 时不限制
+    第二程按换乘站分组并按发车时间排序，每趟第一程只需两次二分查找，总开销与产出的组合数成正比
+    """
+    groups = defaultdict(list)
+    for train in second_trains:
+        groups[train.from_station_e if same_inter else None].append(train)
+    departures = {}
+    for station, trains in groups.items():
+        trains.sort(key=lambda tr: tr.from_time)
+        departures[station] = [train.from_time for train in trains]
+
+    for first in first_trains:
+        station = first.dest_station_e if same_inter else None
+        trains = groups.get(station)
+        if not trains:
+            continue
+        times = departures[station]
+        start = bisect_left(times, first.dest_time + min_layover)
+        end = len(times) if max_layover is None else bisect_right(times, first.dest_time + max_layover)
+        for i in range(start, end):
+            yield first, trains[i]
+
+
+def merge_joins(joins):
+    """
+    把各中转城市 join_transfers 的结果按第一程发车时间归并，依次产出 (第一程, 第二程)
+    同城的多个中转城市可能查到同一组车次，按车次、乘车日期和换乘站去重
+    """
+    seen_pairs = set()
+    for first, second in heapq.merge(*joins, key=lambda pair: pair[0].from_time):
+        pair_key = (first.train_uuid, first.day, first.dest_station_e,
+                    second.train_uuid, second.day, second.from_station_e)
+        if pair_key not in seen_pairs:
+            seen_pairs.add(pair_key)
+            yield first, second
+
+
+# 换乘方案的排序方式，值越小排名越靠前
+RANK_KEYS = {
+    'total': lambda first, second: (second.dest_time - first.from_time).total_seconds(),
+    'layover': lambda first, second: (second.from_time - first.dest_time).total_seconds(),
+    'depart': lambda first, second: first.from_time.timestamp(),
+}
+
+# 第一程按发车时间依次配对时，后面产出的组合排序值不会小于这个下界，据此可以提前输出结果
+# 只有按发车时间排序时才有这样的下界，其它排序方式要等全部组合产出后才能确定前 k 名
+STREAM_BOUNDS = {
+    'depart': lambda first: first.from_time.timestamp(),
+}
+
+
+class TopK:
+    """
+    用有界堆保留排序值最小的 k 个换乘方案，k 为 None 时保留全部
+    只保存车次组合本身，显示用的字符串等到真正输出时再生成
+    """
+
+    def __init__(self, k, rank='total'):
+        if k is not None and k < 1:
+            raise ValueError('保留的方案数应为正整数：%r' % k)
+        self.k = k
+        self.rank_key = RANK_KEYS[rank]
+        # 堆顶是当前保留的结果中排名最靠后的一个，排序值和序号都取负数
+        self._heap = []
+        self._seq = 0
+        # 第一次 release 之后，尚未产出的组合另外放在一个按排名的小顶堆里，每次只弹出已经确定的部分，不必重新排序
+        self._pending = None
+        # 已经进入 _pending、之后又被挤出前 k 名的组合的序号，弹出时跳过
+        self._evicted = set()
+
+    def __len__(self):
+        return len(self._heap)
+
+    def push(self, first, second):
+        key = self.rank_key(first, second)
+        self._seq += 1
+        entry = (-key, -self._seq, first, second)
+        if self.k is None or len(self._heap) < self.k:
+            heapq.heappush(self._heap, entry)
+        elif entry > self._heap[0]:
+            evicted = heapq.heapreplace(self._heap, entry)
+            if self._pending is not None:
+                self._evicted.add(-evicted[1])
+        else:
+            return
+        if self._pending is not None:
+            heapq.heappush(self._pending, (key, self._seq, first, second))
+
+    def release(self, bound=None):
+        """
+        按排名依次产出已经确定在前 k 名之内且尚未产出过的组合
+        bound - 之后再加入的组合排序值都不小于 bound，为 None 时表示已经没有新的组合
+        已经产出的组合排序值不大于 bound，之后加入的组合不会把它挤出前 k 名
+        """
+        if self._pending is None:
+            self._pending = [(-neg_key, -neg_seq, first, second) for neg_key, neg_seq, first, second in self._heap]
+            heapq.heapify(self._pending)
+        pending = self._pending
+        while pending and (bound is None or pending[0][0] <= bound):
+            _, seq, first, second = heapq.heappop(pending)
+            if seq in self._evicted:
+                self._evicted.discard(seq)
+                continue
+            yield first, second
@@ -0,0 +1,120 @@
+#!/usr/bin/env python3
+"""所有 12306 请求共用的 HTTP 传输层：连接池与 keep-alive、统一超时，以及 cookie 的获取和自动刷新"""
+
+import threading
+import time
+
+from instrument import Profiler
+
+
+class TransportError(Exception):
+    """接口返回了非 200 的状态码"""
+
+
+class ThrottledError(TransportError):
+    """接口返回了 HTML 错误页面而不是 JSON，通常是请求过快被限流或 cookie 失效"""
+
+
+class Transport:
+
+    DEFAULT_BASE_URL = 'https://kyfw.12306.cn'
+    COOKIE_PATH = '/otn/leftTicket/init?linktypeid=dc'
+
+    def __init__(self, base_url=DEFAULT_BASE_URL, pool_size=10, timeout=10, encoding='utf-8', profiler=None):
+        self.base_url = base_url.rstrip('/')
+        self.profiler = profiler or Profiler()
+        self.pool_size = pool_size
+        self.timeout = timeout
+        self.encoding = encoding
+        self._session = None
+        self._session_lock = threading.Lock()
+        self._cookie_lock = threading.Lock()
+        self._cookies_fetched_at = None
+
+    @property
+    def session(self):
+        """requests 导入较慢，第一次真正发请求时才导入并创建 Session"""
+        if self._session is None:
+            with self._session_lock:
+                if self._session is None:
+                    import requests
+                    from requests.adapters import HTTPAdapter
+
+                    # 同一个 Session 复用 TCP/TLS 连接，pool_size 是每个主机保持的连接数，应不小于并发线程数
+                    session = requests.Session()
+                    adapter = HTTPAdapter(pool_connections=4, pool_maxsize=self.pool_size)
+                    session.mount('http://', adapter)
+                    session.mount('https://', adapter)
+                    self._session = session
+        return self._session
+
+    def url(self, path):
+        return path if path.startswith(('http://', 'https://')) else self.base_url + path
+
+    @staticmethod
+    def endpoint(path):
+        """统计用的接口名，取路径的最后一段，例如 queryT"""
+        return path.split('?', 1)[0].rstrip('/').rsplit('/', 1)[-1]
+
+    def get(self, path, params=None, headers=None):
+        session = self.session
+        started = time.perf_counter()
+        try:
+            response = session.get(self.url(path), params=params, headers=headers, timeout=self.timeout)
+        except OSError:
+            self.profiler.count('http.error')
+            raise
+        finally:
+            self.profiler.observe_latency(self.endpoint(path), time.perf_counter() - started)
+        self.profiler.count('http.status.%d' % response.status_code)
+        response.encoding = self.encoding
+        return response
+
+    def ensure_cookies(self):
+        """第一次请求接口前先访问查询页面，拿到 12306 下发的 cookie，之后由 Session 自动携带"""
+        if self._cookies_fetched_at is not None:
+            return
+        # 多个线程同时发出第一个请求时只获取一次：拿到锁后再检查一遍，别的线程已经获取过就直接返回
+        with self._cookie_lock:
+            if self._cookies_fetched_at is None:
+                self._fetch_cookies()
+
+    def refresh_cookies(self, not_before=None):
+        """
+        重新获取 cookie，多个线程同时发现 cookie 失效时只刷新一次
+        not_before - 调用方发出失败请求的时间，这之后已经刷新过就不再重复刷新
+        """
+        with self._cookie_lock:
+            if not_before is not None and self._cookies_fetched_at is not None and self._cookies_fetched_at >= not_before:
+                return
+            self._fetch_cookies()
+
+    def _fetch_cookies(self):
+        """调用方需持有 self._cookie_lock"""
+        self.profiler.count('http.cookie_refresh')
+        self.session.cookies.clear()
+        self.get(self.COOKIE_PATH)
+        self._cookies_fetched_at = time.monotonic()
+
+    def get_json(self, path, params=None):
+        """
+        请求接口并解析 JSON
+        12306 在 cookie 失效或请求过快时会返回 HTML 错误页面，此时刷新一次 cookie 后重试，仍然失败则抛出 ThrottledError
+        """
+        self.ensure_cookies()
+        for attempt in range(2):
+            requested_at = time.monotonic()
+            response = self.get(path, params=params)
+            if (not response.ok) or response.status_code != 200:
+                raise TransportError('HTTP %s: %s' % (response.status_code, response.url))
+            try:
+                return response.json()
+            except ValueError:
+                self.profiler.count('http.html_page')
+                if attempt == 0:
+                    self.refresh_cookies(not_before=requested_at)
+        raise ThrottledError('接口返回的不是 JSON：%s' % response.url)
+
+    def close(self):
+        if self._session is not None:
+            self._session.close()
@@ -0,0 +1,238 @@
+#!/usr/bin/env python3
+"""
+监视模式：在同一个进程里反复轮询余票，只报告两次轮询之间的变化
+车站索引和 cookie 只在第一次轮询前准备一次；每次轮询只请求余票接口，不查询票价、不重新渲染表格；
+原始 | 分隔字符串没有变化的车次直接复用上一次的解析结果，只有变化的车次才重新解析
+轮询间隔随数据变化的频率和限流情况自适应调整
+输出格式为 ndjson 时每个变化输出一行 JSON，提示信息写到标准错误
+"""
+
+import random
+import time
+from datetime import datetime, timedelta
+
+import colortext
+from render import NdjsonRenderer, transfer_record
+from trainleg import (DEST_STATION, FROM_STATION, FROM_TIME, SEAT_FIELDS, SEAT_NAMES, TRAIN_NUMBER, TRAIN_UUID,
+                      TrainLeg, is_available, is_stopped)
+from transfer import join_transfers
+from transport import ThrottledError, TransportError
+
+
+class LegState:
+    """一个行程段 (出发电报码, 到达电报码, 乘车日期) 在两次轮询之间保留的状态"""
+
+    def __init__(self, from_station_en, dest_station_en, train_date, stations, train_filter=None):
+        self.key = (from_station_en, dest_station_en, train_date)
+        self.day = datetime.strptime(train_date, '%Y-%m-%d')
+        self.stations = stations
+        self.train_filter = train_filter
+        # 原始字符串 -> (字段列表, 有票时的 TrainLeg)，被车次类型过滤掉的车次字段列表为 None
+        self.records = {}
+        # 车次编号 -> 原始字符串
+        self.by_uuid = {}
+        self.legs = []
+
+    def update(self, train_list):
+        """
+        用新一次轮询的结果更新状态，返回变化列表 [(车次字段, 变化说明), ...]
+        与上次完全相同的字符串只做一次字典查找，不再 split
+        """
+        records = {}
+        by_uuid = {}
+        changes = []
+        for raw in train_list:
+            record = self.records.get(raw)
+            if record is None:
+                train_info = raw.split('|')
+                if self.train_filter and not self.train_filter(train_info[TRAIN_NUMBER]):
+                    record = (None, None)
+                else:
+                    leg = None if is_stopped(train_info) or not is_available(train_info) else \
+                        TrainLeg(raw, train_info, self.day, self.stations)
+                    record = (train_info, leg)
+                    previous = self.records.get(self.by_uuid.get(train_info[TRAIN_UUID]))
+                    change = self._diff(previous and previous[0], train_info)
+                    if change:
+                        changes.append((train_info, change))
+            records[raw] = record
+            if record[0] is not None:
+                by_uuid[record[0][TRAIN_UUID]] = raw
+        for train_uuid, raw in self.by_uuid.items():
+            if train_uuid not in by_uuid:
+                changes.append((self.records[raw][0], '已不在查询结果中'))
+        self.records = records
+        self.by_uuid = by_uuid
+        self.legs = [record[1] for record in records.values() if record[1] is not None]
+        return changes
+
+    @staticmethod
+    def _diff(old_info, new_info):
+        if old_info is None:
+            return '新增车次' + ('（有票）' if is_available(new_info) else '')
+        if is_stopped(new_info) != is_stopped(old_info):
+            return '已停运' if is_stopped(new_info) else '恢复运行'
+        seats = ['%s %s → %s' % (SEAT_NAMES[name], old_info[index] or '-', new_info[index] or '-')
+                 for name, index in SEAT_FIELDS if old_info[index] != new_info[index]]
+        return '，'.join(seats)
+
+
+class Watcher:
+    """
+    反复轮询一组行程段并报告变化
+    interval / max_interval - 轮询间隔的下限和上限（秒）；数据有变化时回到下限，连续没有变化时逐渐放慢，
+    被限流或请求失败时加倍退避
+    """
+
+    # 监视模式的输出没有尽头，json 数组和 csv 表头都无法确定，给程序读取时只能逐行输出 ndjson
+    FORMATS = ('table', 'stream', 'ndjson', 'jsonl')
+
+    def __init__(self, finder, interval=30, max_interval=None, train_filter=None):
+        self.finder = finder
+        self.renderer = NdjsonRenderer() if finder.output_format in ('ndjson', 'jsonl') else None
+        self.min_interval = interval
+        self.max_interval = max_interval or interval * 8
+        self.interval = interval
+        self.train_filter = train_filter
+        self.legs = {}
+        self.polls = 0
+
+    def _leg(self, from_station_en, dest_station_en, train_date):
+        key = (from_station_en, dest_station_en, train_date)
+        if key not in self.legs:
+            self.legs[key] = LegState(from_station_en, dest_station_en, train_date, self.finder.stations,
+                                      self.train_filter)
+        return self.legs[key]
+
+    def poll(self):
+        """
+        查询所有行程段一次，返回 ({行程段: 变化列表}, 是否被限流)
+        某个行程段请求失败时保留它上一次的状态
+        """
+        changes = {}
+        throttled = False
+        for key, leg in self.legs.items():
+            try:
+                train_list = self.finder._request_train_list(*key)
+            except (ThrottledError, TransportError, OSError) as error:
+                self.finder.profiler.count('watch.failed')
+                self.finder._info(colortext.light_red('[%s] 查询 %s→%s 失败：%s' % (
+                    time.strftime('%H:%M:%S'), key[0], key[1], error)))
+                throttled = True
+                continue
+            with self.finder.profiler.phase('watch.diff'):
+                leg_changes = leg.update(train_list or [])
+            if leg_changes:
+                changes[key] = leg_changes
+        self.polls += 1
+        self.finder.profiler.count('watch.poll')
+        return changes, throttled
+
+    def _adapt(self, changed, throttled):
+        if throttled:
+            self.interval = min(self.max_interval, self.interval * 2)
+        elif changed:
+            self.interval = self.min_interval
+        else:
+            self.interval = min(self.max_interval, self.interval * 1.5)
+        # 加一点随机抖动，避免多个监视进程同时发出请求
+        return self.interval * random.uniform(0.9, 1.1)
+
+    def run(self, report, iterations=None):
+        """
+        循环轮询直到 iterations 次（None 表示一直运行，Ctrl-C 结束）
+        report(changes, first) - 每次轮询后调用，first 为 True 时是第一次轮询得到的基准状态
+        """
+        self.finder.transport.ensure_cookies()
+        try:
+            while iterations is None or self.polls < iterations:
+                changes, throttled = self.poll()
+                report(changes, self.polls == 1)
+                if self.renderer:
+                    self.renderer.out.flush()
+                if iterations is not None and self.polls >= iterations:
+                    break
+                time.sleep(self._adapt(bool(changes) and self.polls > 1, throttled))
+        except KeyboardInterrupt:
+            pass
+
+    def _train_change(self, train_info, change):
+        """ndjson 输出的一条余票变化，change 为变化的说明，seats 为变化后的余票"""
+        stations = self.finder.stations
+        return {
+            'watched_at': datetime.now().isoformat(timespec='seconds'),
+            'train_number': train_info[TRAIN_NUMBER],
+            'train_uuid': train_info[TRAIN_UUID],
+            'from_station': stations.name_cn(train_info[FROM_STATION]),
+            'from_station_e': train_info[FROM_STATION],
+            'dest_station': stations.name_cn(train_info[DEST_STATION]),
+            'dest_station_e': train_info[DEST_STATION],
+            'from_time': train_info[FROM_TIME],
+            'change': change,
+            'seats': {name: train_info[index] for name, index in SEAT_FIELDS},
+        }
+
+    def watch_trains(self, from_station_en, dest_station_en, train_date, iterations=None):
+        """监视两站之间的余票，报告每趟车余票的变化"""
+        leg = self._leg(from_station_en, dest_station_en, train_date)
+
+        def report(changes, first):
+            now = time.strftime('%H:%M:%S')
+            if first:
+                self.finder._info(colortext.light_green('[%s] 开始监视 %s 的 %s 趟列车，其中 %s 趟有票' % (
+                    now, train_date, len(leg.by_uuid), len(leg.legs))))
+                return
+            for train_info, change in changes.get(leg.key, []):
+                if self.renderer:
+                    self.renderer.row(self._train_change(train_info, change))
+                    continue
+                print('[%s] %s %s→%s %s  %s' % (
+                    now, colortext.light_yellow(train_info[TRAIN_NUMBER]),
+                    self.finder.stations.name_cn(train_info[FROM_STATION]),
+                    self.finder.stations.name_cn(train_info[DEST_STATION]), train_info[FROM_TIME], change))
+
+        self.run(report, iterations)
+
+    def watch_transfers(self, source_en, hub_codes, destination_en, train_date, min_layover=timedelta(0),
+                        max_layover=None, same_inter=True, iterations=None):
+        """监视经 hub_codes 中转的换乘方案，只有行程段有变化时才重新配对，报告新出现和消失的方案"""
+        routes = [(self._leg(source_en, hub, train_date), self._leg(hub, destination_en, train_date))
+                  for hub in hub_codes]
+        pairs = {}
+
+        def current_pairs():
+            result = {}
+            with self.finder.profiler.phase('join'):
+                for first_leg, second_leg in routes:
+                    first_trains = sorted(first_leg.legs, key=lambda tr: tr.from_time)
+                    for first, second in join_transfers(first_trains, second_leg.legs, min_layover, max_layover,
+                                                        same_inter):
+                        result[(first.train_uuid, first.dest_station_e, second.train_uuid,
+                                second.from_station_e)] = (first, second)
+            return result
+
+        def report(changes, first):
+            now = time.strftime('%H:%M:%S')
+            if not first and not changes:
+                return
+            latest = current_pairs()
+            if first:
+                self.finder._info(colortext.light_green('[%s] 开始监视 %s 的换乘方案，当前共 %s 种' % (
+                    now, train_date, len(latest))))
+            else:
+                added = [latest[key] for key in latest if key not in pairs]
+                removed = [pairs[key] for key in pairs if key not in latest]
+                if self.renderer:
+                    watched_at = datetime.now().isoformat(timespec='seconds')
+                    for event, changed in (('added', added), ('removed', removed)):
+                        for pair in sorted(changed, key=lambda pair: pair[0].from_time):
+                            self.renderer.row(dict(event=event, watched_at=watched_at, **transfer_record(*pair)))
+                else:
+                    for pair in sorted(added, key=lambda pair: pair[0].from_time):
+                        print('[%s] 新增 %s' % (now, self.finder._transfer_result(*pair)['str']))
+                    if removed:
+                        print(colortext.light_red('[%s] %s 种方案已无票' % (now, len(removed))))
+            pairs.clear()
+            pairs.update(latest)
+
+        self.run(report, iterations)
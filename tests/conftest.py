@@ -0,0 +1,49 @@
+"""测试直接导入 src 下的模块，行程段数据用 benchmarks/standin.py 的替身数据构造"""
+
+import os
+import sys
+from datetime import datetime
+
+import pytest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+for path in (os.path.join(ROOT, 'src'), os.path.join(ROOT, 'benchmarks')):
+    if path not in sys.path:
+        sys.path.insert(0, path)
+
+from stationindex import StationIndex  # noqa: E402
+from standin import StandinServer, synthetic_stations, synthetic_train  # noqa: E402
+from trainleg import TrainLeg  # noqa: E402
+
+DAY = datetime(2030, 1, 16)
+SEATS = ('', '', '有', '', '', '8', '')
+
+
+@pytest.fixture(scope='session')
+def stations():
+    return StationIndex(synthetic_stations(20))
+
+
+@pytest.fixture
+def make_leg(stations):
+    """make_leg('G1', 'BJP', 'BTC', '08:00', 90) 构造一个行程段，day 为乘车日期当天零点"""
+    def make(train_number, from_station, dest_station, from_time, minutes, day=DAY):
+        raw = synthetic_train('ID' + train_number, train_number, from_station, dest_station, from_time, minutes,
+                              SEATS)
+        return TrainLeg(raw, raw.split('|'), day, stations)
+    return make
+
+
+@pytest.fixture
+def standin():
+    with StandinServer() as server:
+        yield server
+
+
+@pytest.fixture
+def finder(standin, tmp_path):
+    """连到替身服务、使用临时数据库的查询器，车站数据已经写入"""
+    from common import make_finder
+    finder = make_finder(str(tmp_path), standin.base_url)
+    yield finder
+    finder.db.connect.close()
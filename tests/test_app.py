@@ -0,0 +1,75 @@
+import pytest
+
+import app as app_module
+from standin import StandinServer
+
+TRAIN_DATE = '2030-01-16'
+
+
+def test_cookie_refreshed_on_error_page(finder, standin):
+    finder._load_train_list('BJP', 'BTC', TRAIN_DATE)
+    assert standin.counts['init'] == 1
+    # cookie 失效后接口返回 HTML 错误页面，刷新一次 cookie 后重试成功
+    finder.transport.session.cookies.clear()
+    assert finder._load_train_list('BJP', 'EEC', TRAIN_DATE)
+    assert standin.counts['init'] == 2
+    assert standin.counts['leftTicket'] == 3
+
+
+def test_throttled_query_retries_then_exits(tmp_path, monkeypatch, capsys):
+    from common import make_finder
+    monkeypatch.setattr(app_module.time, 'sleep', lambda seconds: None)
+    with StandinServer(throttle_every=1) as standin:
+        finder = make_finder(str(tmp_path), standin.base_url)
+        with pytest.raises(SystemExit) as exit_info:
+            finder._fetch_train_list('BJP', 'BTC', TRAIN_DATE)
+        finder.db.connect.close()
+    assert exit_info.value.code == 1
+    # 每次尝试都先刷新 cookie 重试一次
+    assert standin.counts['leftTicket'] == 2 * (finder.left_ticket_retries + 1)
+    assert '限流' in capsys.readouterr().out
+
+
+def test_station_sync_failure_exits(tmp_path):
+    # 替身服务已经关闭，连接被拒绝
+    with StandinServer() as standin:
+        base_url = standin.base_url
+    finder = app_module.TrainTicketsFinder(['bj', 'bt', '--db=%s' % (tmp_path / 'empty.sqlite3'),
+                                            '--base-url=%s' % base_url])
+    with pytest.raises(SystemExit) as exit_info:
+        finder.stations
+    finder.db.connect.close()
+    assert exit_info.value.code == 1
+
+
+@pytest.mark.parametrize('option', ['--days=2', '--stream', '--rank=pareto'])
+def test_offline_rejects_unsupported_options(tmp_path, option, capsys):
+    from common import seed_stations
+    db_path = str(tmp_path / 'offline.sqlite3')
+    seed_stations(db_path)
+    finder = app_module.TrainTicketsFinder(['bj', 'bt', 'eeds', '--db=%s' % db_path, '--base-url=http://127.0.0.1:9',
+                                            '--offline', option])
+    with pytest.raises(SystemExit) as exit_info:
+        app_module.main(finder)
+    finder.db.connect.close()
+    assert exit_info.value.code == 1
+    assert option.split('=')[0] in capsys.readouterr().err
+
+
+def test_date_window_covers_legs_arriving_two_days_later(standin, tmp_path, capsys):
+    from common import make_finder
+    from conftest import SEATS
+    from standin import synthetic_train
+    # 唯一的第一程历时 40 小时，第三天零点到达包头，只能接上第三天出发的第二程
+    standin.fixtures['leftTicket'] = {
+        '%s|BJP|BTC' % TRAIN_DATE: [synthetic_train('ID1', 'K1', 'BJP', 'BTC', '08:00', 40 * 60, SEATS)],
+        '2030-01-16|BTC|EEC': [],
+        '2030-01-17|BTC|EEC': [],
+        '2030-01-18|BTC|EEC': [synthetic_train('ID2', 'D2', 'BTC', 'EEC', '06:00', 60, SEATS)],
+    }
+    finder = make_finder(str(tmp_path), standin.base_url, '--format=ndjson')
+    finder.change_hubs('BJP', ['BTC'], 'EEC', TRAIN_DATE, days=1)
+    finder.db.connect.close()
+    records = [line for line in capsys.readouterr().out.splitlines() if line]
+    assert len(records) == 1
+    assert '"D2"' in records[0]
@@ -0,0 +1,25 @@
+import io
+import json
+
+from batch import BatchRunner, read_queries
+
+
+def test_read_queries_formats():
+    lines = ['# 注释', '', 'bj bt 2030-01-16', 'bj,eeds', '{"from": "bt", "to": "bj", "date": "2030-01-17"}', '{oops',
+             'bj']
+    assert list(read_queries(lines)) == [
+        (3, 'bj', 'bt', '2030-01-16'), (4, 'bj', 'eeds', None), (5, 'bt', 'bj', '2030-01-17'), (6, '{oops', None, None),
+        (7, 'bj', None, None)]
+
+
+def test_same_leg_is_requested_once(finder, standin):
+    output = io.StringIO()
+    runner = BatchRunner(finder, output=output)
+    # 北京和 bj 是同一个车站，三条查询只有两个行程段
+    lines = ['bj bt 2030-01-16', '北京 包头 2030-01-16', 'bj eeds 2030-01-16', 'bj nowhere 2030-01-16']
+    assert runner.run(lines) == (4, 2, 1)
+    assert standin.counts['leftTicket'] == 2
+    records = sorted((json.loads(line) for line in output.getvalue().splitlines()), key=lambda record: record['line'])
+    assert [record['line'] for record in records] == [1, 2, 3, 4]
+    assert records[0]['trains'] == records[1]['trains']
+    assert 'error' in records[3]
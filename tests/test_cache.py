@@ -0,0 +1,73 @@
+import pytest
+
+import cache as cache_module
+from cache import ResponseCache
+from mysqlite import Sqlite
+
+
+class Clock:
+    def __init__(self, now=1000000.0):
+        self.now = now
+
+    def __call__(self):
+        return self.now
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = Clock()
+    monkeypatch.setattr(cache_module.time, 'time', clock)
+    return clock
+
+
+@pytest.fixture
+def db(tmp_path):
+    db = Sqlite(str(tmp_path / 'cache.sqlite3'))
+    yield db
+    db.connect.close()
+
+
+def test_entries_expire_after_ttl(db, clock):
+    cache = ResponseCache(db, left_ticket_ttl=60)
+    cache.set_left_tickets('2030-01-16', 'BJP', 'BTC', ['a|b'])
+    clock.now += 59
+    assert cache.get_left_tickets('2030-01-16', 'BJP', 'BTC') == ['a|b']
+    clock.now += 1
+    assert cache.get_left_tickets('2030-01-16', 'BJP', 'BTC') is None
+
+
+def test_disabled_cache_stores_nothing(db, clock):
+    cache = ResponseCache(db, enabled=False)
+    cache.set('price|1', {'O': '¥1'}, 60)
+    assert cache.get('price|1') is None
+    assert ResponseCache(db).get('price|1') is None
+
+
+def test_trim_evicts_least_recently_accessed(db, clock):
+    cache = ResponseCache(db, max_entries=50, touch_interval=0)
+    for i in range(99):
+        clock.now += 1
+        cache.set('price|%d' % i, i, 3600)
+    # 最早写入的两条最近被读过，淘汰时应该保留
+    clock.now += 1
+    assert cache.get('price|0') == 0
+    with cache.batch():
+        assert cache.get('price|1') == 1
+    clock.now += 1
+    cache.set('price|99', 99, 3600)  # 第 100 次写入触发淘汰
+
+    kept = [i for i in range(100) if cache.get('price|%d' % i) is not None]
+    assert len(kept) == 50
+    assert kept[:2] == [0, 1]
+    assert kept[2:] == list(range(52, 100))
+
+
+def test_recent_hits_are_not_written_back(db, clock):
+    cache = ResponseCache(db, touch_interval=600)
+    cache.set('price|1', 1, 3600)
+    clock.now += 10
+    cache.get('price|1')
+    assert db.select_cache('price|1', clock.now)[1] == clock.now - 10
+    clock.now += 600
+    cache.get('price|1')
+    assert db.select_cache('price|1', clock.now)[1] == clock.now
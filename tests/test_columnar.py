@@ -0,0 +1,79 @@
+from datetime import timedelta
+
+import pytest
+
+from conftest import DAY, SEATS
+from standin import synthetic_train, synthetic_train_list
+from trainleg import SEAT_FIELDS, TrainLeg, is_available, is_stopped
+from transfer import join_transfers
+
+np = pytest.importorskip('numpy')
+columnar = pytest.importorskip('columnar')
+
+TRAIN_DATE = DAY.strftime('%Y-%m-%d')
+
+
+def legs(train_list, stations, day=DAY):
+    return [TrainLeg(raw, raw.split('|'), day, stations) for raw in train_list
+            if not is_stopped(raw.split('|')) and is_available(raw.split('|'))]
+
+
+@pytest.mark.parametrize('min_layover, max_layover, same_inter', [(0, None, True), (20, 180, True), (30, 90, False)])
+def test_join_matches_train_legs(stations, min_layover, max_layover, same_inter):
+    first_list = synthetic_train_list('BJP', 'BTC', TRAIN_DATE, 120)
+    # 第二程有一半从同城的另一个车站出发
+    second_list = synthetic_train_list('BTC', 'EEC', TRAIN_DATE, 120) + synthetic_train_list('NDC', 'EEC', TRAIN_DATE, 60)
+    first = columnar.LeftTicketColumns.from_list(first_list, TRAIN_DATE).filter()
+    second = columnar.LeftTicketColumns.from_list(second_list, TRAIN_DATE).filter()
+    first_index, second_index = columnar.join_transfers(first, second, min_layover, max_layover, same_inter)
+
+    expected = join_transfers(sorted(legs(first_list, stations), key=lambda train: train.from_time),
+                              legs(second_list, stations), timedelta(minutes=min_layover),
+                              max_layover and timedelta(minutes=max_layover), same_inter)
+    pairs = sorted(zip(first.train_uuid[first_index].tolist(), second.train_uuid[second_index].tolist()))
+    assert pairs == sorted((a.train_uuid, b.train_uuid) for a, b in expected)
+    assert pairs
+
+
+def test_join_across_days():
+    first = columnar.LeftTicketColumns.from_list(
+        [synthetic_train('Z1', 'Z1', 'BJP', 'BTC', '22:00', 180, SEATS)], TRAIN_DATE)
+    tomorrow = str((DAY + timedelta(days=1)).date())
+    second = columnar.LeftTicketColumns.from_batches([
+        (TRAIN_DATE, [synthetic_train('K1', 'K1', 'BTC', 'EEC', '23:30', 60, SEATS)]),
+        (tomorrow, [synthetic_train('K1', 'K1', 'BTC', 'EEC', '06:00', 60, SEATS)]),
+    ])
+    first_index, second_index = columnar.join_transfers(first, second, max_layover=360)
+    assert second_index.tolist() == [1]
+
+
+def test_decodes_fields_like_seat_code():
+    train_list = synthetic_train_list('BJP', 'BTC', TRAIN_DATE, 80)
+    columns = columnar.LeftTicketColumns.from_list(train_list, TRAIN_DATE)
+    for row, raw in enumerate(train_list):
+        train_info = raw.split('|')
+        assert columns.stopped[row] == (train_info[1] == '列车停运')
+        assert columns.train_number[row] == train_info[3]
+        for name, index in SEAT_FIELDS:
+            assert columns.seats[name][row] == columnar.seat_code(train_info[index])
+
+
+def test_rows_with_different_field_counts():
+    train_list = synthetic_train_list('BJP', 'BTC', TRAIN_DATE, 6)
+    # 一条多一个字段、一条少一个字段，分隔符总数与全部对齐时相同
+    train_list[1] += '|extra'
+    train_list[2] = train_list[2].rsplit('|', 1)[0]
+    columns = columnar.LeftTicketColumns.from_list(train_list, TRAIN_DATE)
+    assert columns.train_uuid.tolist() == [raw.split('|')[2] for raw in train_list]
+    assert columns.from_minutes.tolist() == [
+        int(raw.split('|')[8][:2]) * 60 + int(raw.split('|')[8][3:]) for raw in train_list]
+
+
+def test_available_mask_matches_is_available():
+    train_list = synthetic_train_list('BJP', 'BTC', TRAIN_DATE, 80)
+    # 张数为 0 的坐席不算有票，0 以外的张数、有 都算
+    for seats in (('0', '', '', '', '', '', ''), ('', '', '10', '', '', '', ''), ('', '*', '无', '', '0', '有', '')):
+        train_list.append(synthetic_train('S' + ''.join(seats), 'G1', 'BJP', 'BTC', '08:00', 60, seats))
+    columns = columnar.LeftTicketColumns.from_list(train_list, TRAIN_DATE)
+    assert columns.available_mask().tolist() == [is_available(raw.split('|')) for raw in train_list]
+    assert columns.available_mask()[-3:].tolist() == [False, True, True]
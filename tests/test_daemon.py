@@ -0,0 +1,34 @@
+import asyncio
+
+import pytest
+
+from daemon import QueryDaemon, RequestError
+
+TRAIN_DATE = '2030-01-16'
+
+
+def test_concurrent_legs_share_one_request(finder, standin):
+    daemon = QueryDaemon(finder)
+    key = ('BJP', 'BTC', TRAIN_DATE)
+
+    async def fetch_three():
+        return await asyncio.gather(*(daemon.leg(key) for _ in range(3)))
+
+    results = asyncio.run(fetch_three())
+    assert standin.counts['leftTicket'] == 1
+    assert daemon.profiler.counters['daemon.leg.fetch'] == 1
+    assert daemon.profiler.counters['daemon.leg.coalesced'] == 2
+    assert results[0] is results[1] is results[2]
+    assert not daemon._inflight
+    # 查询完成后再取同一个行程段直接用内存中的结果
+    asyncio.run(daemon.leg(key))
+    assert standin.counts['leftTicket'] == 1
+    assert daemon.profiler.counters['daemon.leg.memory'] == 1
+
+
+@pytest.mark.parametrize('top', ['0', '-1', 'abc'])
+def test_change_rejects_invalid_top(finder, standin, top):
+    daemon = QueryDaemon(finder)
+    with pytest.raises(RequestError):
+        asyncio.run(daemon.change({'from': 'bj', 'via': 'bt', 'to': 'eeds', 'date': TRAIN_DATE, 'top': top}))
+    assert 'leftTicket' not in standin.counts
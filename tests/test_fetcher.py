@@ -0,0 +1,50 @@
+import pytest
+
+import fetcher
+from fetcher import TokenBucket
+
+
+class Clock:
+    """替换 monotonic 和 sleep，sleep 只推进时间并记下等待的秒数"""
+
+    def __init__(self, now=1000.0):
+        self.now = now
+        self.sleeps = []
+
+    def monotonic(self):
+        return self.now
+
+    def sleep(self, seconds):
+        self.sleeps.append(seconds)
+        self.now += seconds
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = Clock()
+    monkeypatch.setattr(fetcher.time, 'monotonic', clock.monotonic)
+    monkeypatch.setattr(fetcher.time, 'sleep', clock.sleep)
+    return clock
+
+
+def test_bucket_allows_burst_then_limits_rate(clock):
+    bucket = TokenBucket(rate=4)
+    for _ in range(4):
+        bucket.acquire()
+    assert clock.sleeps == []
+    start = clock.now
+    for _ in range(4):
+        bucket.acquire()
+    # 桶空之后每个令牌要等 1/rate 秒
+    assert clock.now - start == pytest.approx(1.0)
+    assert all(seconds == pytest.approx(0.25) for seconds in clock.sleeps)
+
+
+def test_bucket_with_rate_below_one(clock):
+    # 容量至少为 1，否则桶里永远攒不够一个令牌
+    bucket = TokenBucket(rate=0.5)
+    assert bucket.capacity == 1.0
+    bucket.acquire()
+    start = clock.now
+    bucket.acquire()
+    assert clock.now - start == pytest.approx(2.0)
@@ -0,0 +1,53 @@
+import pytest
+
+from conftest import DAY, SEATS
+from hubs import HubFinder, city_name
+from mysqlite import Sqlite
+from standin import synthetic_train
+from timetable import Timetable
+from trainleg import END_STATION, FROM_STATION_NO, START_STATION, TO_STATION_NO
+
+TRAIN_DATE = DAY.strftime('%Y-%m-%d')
+
+
+def segment(train_number, start, end, from_station, dest_station, from_time, minutes, from_no, to_no):
+    train_info = synthetic_train('ID' + train_number, train_number, from_station, dest_station, from_time, minutes,
+                                 SEATS).split('|')
+    train_info[START_STATION], train_info[END_STATION] = start, end
+    train_info[FROM_STATION_NO], train_info[TO_STATION_NO] = from_no, to_no
+    return '|'.join(train_info)
+
+
+@pytest.fixture
+def hub_finder(tmp_path, stations):
+    db = Sqlite(str(tmp_path / 'hubs.sqlite3'))
+    timetable = Timetable(db)
+    # 北京到鄂尔多斯有一趟 5 小时的直达车；经包头两段各一趟车，共 3.5 小时；北京西到集宁南只有第一程
+    timetable.record('BJP', 'EEC', TRAIN_DATE, [segment('K1', 'BJP', 'EEC', 'BJP', 'EEC', '08:00', 300, '01', '05')])
+    timetable.record('BJP', 'BTC', TRAIN_DATE, [segment('G2', 'BJP', 'BTC', 'BJP', 'BTC', '08:00', 120, '01', '04')])
+    timetable.record('BTC', 'EEC', TRAIN_DATE, [segment('D3', 'BTC', 'EEC', 'BTC', 'EEC', '11:00', 90, '01', '02')])
+    timetable.record('BXP', 'JAC', TRAIN_DATE, [segment('G4', 'BXP', 'JAC', 'BXP', 'JAC', '09:00', 150, '01', '03')])
+    yield HubFinder(db, stations)
+    db.connect.close()
+
+
+def test_city_name():
+    assert city_name('北京西') == '北京'
+    assert city_name('集宁南') == '集宁'
+    assert city_name('济南') == '济南'
+
+
+def test_rank_prefers_hubs_with_trains_on_both_sides(hub_finder):
+    ranked = hub_finder.rank('BJP', 'EEC')
+    # 直达车不提供中转候选，同城的北京西也不算中转
+    assert [(candidate.name_en, candidate.first_trains, candidate.second_trains) for candidate in ranked] == [
+        ('BTC', 1, 1), ('JAC', 1, 0)]
+    assert ranked[0].minutes == 210
+    assert ranked[0].score == 1.0
+    assert len(hub_finder.rank('BJP', 'EEC', limit=1)) == 1
+
+
+def test_rank_within_pool(hub_finder):
+    # 只在给出的城市中挑选，本地没有记录的城市按给出的顺序排在最后
+    ranked = hub_finder.rank('BJP', 'EEC', pool=['NDC', 'JAC'])
+    assert [(candidate.name_en, candidate.first_trains) for candidate in ranked] == [('JAC', 1), ('NDC', 0)]
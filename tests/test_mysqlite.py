@@ -0,0 +1,16 @@
+from mysqlite import Sqlite
+
+STATIONS = [('北京', 'BJP', 'beijing', 'bj'), ('包头', 'BTC', 'baotou', 'bt'), ('鄂尔多斯', 'EEC', 'eerduosi', 'eeds')]
+
+
+def test_sync_stations_upserts_and_removes(tmp_path):
+    db = Sqlite(str(tmp_path / 'stations.sqlite3'))
+    assert db.sync_stations_data(STATIONS, station_version='1')
+    # 包头改了拼音，鄂尔多斯下线，新增集宁南
+    changed = [('包头', 'BTC', 'baotoushi', 'bts'), ('集宁南', 'JAC', 'jiningnan', 'jnn')]
+    assert db.sync_stations_data(changed, ['EEC'], station_version='2', station_etag=None)
+    assert db.select_all_stations() == [('北京', 'BJP', 'beijing', 'bj'), ('包头', 'BTC', 'baotoushi', 'bts'),
+                                        ('集宁南', 'JAC', 'jiningnan', 'jnn')]
+    assert db.get_meta('station_version') == '2'
+    assert db.get_meta('station_etag') is None
+    db.connect.close()
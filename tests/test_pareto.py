@@ -0,0 +1,24 @@
+from pareto import dominates, skyline
+
+
+def test_dominates():
+    assert dominates((1, 2), (1, 3))
+    assert not dominates((1, 2), (1, 2))
+    assert not dominates((1, 3), (2, 2))
+
+
+def test_skyline_splits_front_and_rest():
+    items = {'a': (1, 5), 'b': (2, 2), 'c': (5, 1), 'd': (3, 3), 'e': (2, 6), 'f': (2, 2)}
+    front, rest = skyline(items, items.get)
+    # 相同的向量互不支配，都在前沿上；前沿按各项之和排序
+    assert front == ['b', 'f', 'a', 'c']
+    assert sorted(rest) == ['d', 'e']
+    for item in rest:
+        assert any(dominates(items[other], items[item]) for other in front)
+
+
+def test_skyline_layers():
+    items = {'a': (1, 1), 'b': (2, 2), 'c': (3, 3)}
+    front, rest = skyline(items, items.get)
+    assert front == ['a']
+    assert skyline(rest, items.get)[0] == ['b']
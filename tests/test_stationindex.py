@@ -0,0 +1,26 @@
+from stationindex import StationIndex
+
+STATIONS = [('北京', 'BJP', 'beijing', 'bj'), ('北京西', 'BXP', 'beijingxi', 'bjx'), ('北京南', 'VNP', 'beijingnan', 'bjn'),
+            ('包头', 'BTC', 'baotou', 'bt'), ('包头东', 'BDC', 'baotoudong', 'btd')]
+
+
+def test_prefix_matches_chinese_and_pinyin():
+    index = StationIndex(STATIONS)
+    assert [station.name_en for station in index.prefix('北京')] == ['BJP', 'VNP', 'BXP']
+    assert [station.name_en for station in index.prefix('beijingx')] == ['BXP']
+    assert [station.name_en for station in index.prefix('bt')] == ['BTC', 'BDC']
+
+
+def test_prefix_dedupes_and_limits():
+    index = StationIndex(STATIONS)
+    # baotou 和 bt 都指向包头，只出现一次
+    assert [station.name_en for station in index.prefix('b')] == ['BTC', 'BDC', 'BJP', 'VNP', 'BXP']
+    assert len(index.prefix('b', limit=2)) == 2
+    assert index.prefix('上海') == []
+
+
+def test_prefix_sees_stations_loaded_later():
+    index = StationIndex(STATIONS)
+    index.prefix('北京')
+    index.load([('北京朝阳', 'IFP', 'beijingchaoyang', 'bjcy')])
+    assert 'IFP' in [station.name_en for station in index.prefix('北京')]
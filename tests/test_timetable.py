@@ -0,0 +1,31 @@
+from datetime import timedelta
+
+from conftest import DAY, SEATS
+from mysqlite import Sqlite
+from standin import synthetic_train
+from timetable import Timetable
+
+TRAIN_DATE = DAY.strftime('%Y-%m-%d')
+
+
+def test_record_and_legs_round_trip(tmp_path, stations):
+    db = Sqlite(str(tmp_path / 'timetable.sqlite3'))
+    timetable = Timetable(db, window_days=2)
+    train_list = [synthetic_train('ID1', 'G1', 'BJP', 'BTC', '08:00', 150, SEATS),
+                  synthetic_train('ID2', 'Z2', 'BXP', 'BTC', '22:30', 600, SEATS),
+                  synthetic_train('ID3', 'K3', 'BJP', 'BTC', '09:00', 60, SEATS, status='列车停运')]
+    timetable.record('BJP', 'BTC', TRAIN_DATE, train_list)
+
+    legs = sorted(timetable.legs('BJP', 'BTC', TRAIN_DATE, stations), key=lambda train: train.train_number)
+    # 停运的车次不记录，时刻和站点与余票数据一致，余票字段为空
+    assert [leg.train_number for leg in legs] == ['G1', 'Z2']
+    assert [(leg.from_station_e, leg.dest_station_e) for leg in legs] == [('BJP', 'BTC'), ('BXP', 'BTC')]
+    assert [leg.from_time for leg in legs] == [DAY + timedelta(hours=8), DAY + timedelta(hours=22, minutes=30)]
+    assert [leg.dest_time for leg in legs] == [DAY + timedelta(hours=10, minutes=30), DAY + timedelta(days=1, hours=8, minutes=30)]
+    assert [leg.seat_types for leg in legs] == ['OM9', 'OM9']
+    # 窗口内的其它日期沿用同样的时刻，窗口外没有记录
+    later = DAY + timedelta(days=2)
+    assert [leg.from_time for leg in timetable.legs('BJP', 'BTC', str(later.date()), stations)] == [
+        later + timedelta(hours=8), later + timedelta(hours=22, minutes=30)]
+    assert timetable.legs('BJP', 'BTC', str((DAY + timedelta(days=3)).date()), stations) == []
+    db.connect.close()
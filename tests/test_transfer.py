@@ -0,0 +1,104 @@
+from datetime import timedelta
+
+import pytest
+
+from conftest import DAY
+from transfer import STREAM_BOUNDS, TopK, join_transfers, merge_joins
+
+
+def numbers(pairs):
+    return [(first.train_number, second.train_number) for first, second in pairs]
+
+
+def test_join_respects_layover_bounds(make_leg):
+    first = [make_leg('G1', 'BJP', 'BTC', '08:00', 120)]  # 10:00 到达
+    second = [make_leg(number, 'BTC', 'EEC', from_time, 60)
+              for number, from_time in (('D1', '09:59'), ('D2', '10:00'), ('D3', '10:30'), ('D4', '11:00'),
+                                        ('D5', '11:01'))]
+    assert numbers(join_transfers(first, second)) == [('G1', 'D2'), ('G1', 'D3'), ('G1', 'D4'), ('G1', 'D5')]
+    # 两端的边界都是闭区间
+    assert numbers(join_transfers(first, second, timedelta(minutes=30), timedelta(minutes=60))) == [
+        ('G1', 'D3'), ('G1', 'D4')]
+
+
+def test_join_same_inter(make_leg):
+    # 北京和北京西同城不同站
+    first = [make_leg('G1', 'BJP', 'BXP', '08:00', 60)]
+    second = [make_leg('D1', 'BJP', 'EEC', '10:00', 60), make_leg('D2', 'BXP', 'EEC', '11:00', 60)]
+    assert numbers(join_transfers(first, second)) == [('G1', 'D2')]
+    assert numbers(join_transfers(first, second, same_inter=False)) == [('G1', 'D1'), ('G1', 'D2')]
+
+
+def test_join_overnight(make_leg):
+    # 22:00 出发的第一程次日 01:00 到达，只能接上次日出发的第二程
+    first = [make_leg('Z1', 'BJP', 'BTC', '22:00', 180)]
+    same_day = make_leg('K1', 'BTC', 'EEC', '23:30', 60)
+    next_day = make_leg('K1', 'BTC', 'EEC', '06:00', 60, day=DAY + timedelta(days=1))
+    pairs = list(join_transfers(first, [same_day, next_day], max_layover=timedelta(hours=6)))
+    assert len(pairs) == 1
+    assert pairs[0][1].day == DAY + timedelta(days=1)
+    assert pairs[0][1].from_time - pairs[0][0].dest_time == timedelta(hours=5)
+
+
+def test_merge_joins_dedupes_by_train_day_and_station(make_leg):
+    first = sorted([make_leg('G1', 'BJP', 'BTC', '08:00', 60), make_leg('G2', 'BJP', 'BTC', '07:00', 60)],
+                   key=lambda train: train.from_time)
+    second = [make_leg('D1', 'BTC', 'EEC', '12:00', 60)]
+    tomorrow = [make_leg('D1', 'BTC', 'EEC', '12:00', 60, day=DAY + timedelta(days=1))]
+    # 同一组合出现两次只保留一次，第二天同一车次的组合是不同的方案
+    merged = list(merge_joins([join_transfers(first, second), join_transfers(first, second),
+                               join_transfers(first, tomorrow)]))
+    assert numbers(merged) == [('G2', 'D1'), ('G2', 'D1'), ('G1', 'D1'), ('G1', 'D1')]
+    assert [second.day for _, second in merged[:2]] == [DAY, DAY + timedelta(days=1)]
+
+
+def test_topk_keeps_best_in_rank_order(make_leg):
+    second = make_leg('D1', 'BTC', 'EEC', '20:00', 60)
+    firsts = [make_leg('G%d' % hour, 'BJP', 'BTC', '%02d:00' % hour, 60) for hour in (9, 6, 12, 8, 10)]
+    ranking = TopK(3, 'total')
+    for first in firsts:
+        ranking.push(first, second)
+    assert len(ranking) == 3
+    # 总历时越短越靠前，也就是发车越晚越好
+    assert numbers(ranking.release()) == [('G12', 'D1'), ('G10', 'D1'), ('G9', 'D1')]
+
+    unbounded = TopK(None, 'depart')
+    for first in firsts:
+        unbounded.push(first, second)
+    assert [first.train_number for first, _ in unbounded.release()] == ['G6', 'G8', 'G9', 'G10', 'G12']
+
+
+def test_topk_stream_release_matches_final_ranking(make_leg):
+    second = make_leg('D1', 'BTC', 'EEC', '23:00', 30)
+    firsts = sorted((make_leg('G%d' % minute, 'BJP', 'BTC', '%02d:%02d' % divmod(300 + minute * 7, 60), 60)
+                     for minute in range(40)), key=lambda train: train.from_time)
+    bound = STREAM_BOUNDS['depart']
+    streamed = TopK(5, 'depart')
+    released = []
+    for first in firsts:
+        streamed.push(first, second)
+        released.extend(streamed.release(bound(first)))
+    released.extend(streamed.release())
+
+    batch = TopK(5, 'depart')
+    for first in firsts:
+        batch.push(first, second)
+    assert numbers(released) == numbers(batch.release())
+    assert len(released) == 5
+
+
+def test_topk_stream_skips_evicted(make_leg):
+    # 按总历时排序时后加入的组合会把已经进入待产出堆的组合挤出前 k 名
+    second = make_leg('D1', 'BTC', 'EEC', '20:00', 60)
+    ranking = TopK(2, 'total')
+    for hour in (6, 7):
+        ranking.push(make_leg('G%d' % hour, 'BJP', 'BTC', '%02d:00' % hour, 60), second)
+    assert list(ranking.release(0)) == []
+    for hour in (8, 9):
+        ranking.push(make_leg('G%d' % hour, 'BJP', 'BTC', '%02d:00' % hour, 60), second)
+    assert numbers(ranking.release()) == [('G9', 'D1'), ('G8', 'D1')]
+
+
+def test_topk_rejects_non_positive_k():
+    with pytest.raises(ValueError):
+        TopK(0)
@@ -0,0 +1,33 @@
+from conftest import DAY, SEATS
+from standin import synthetic_train
+from watch import LegState
+
+TRAIN_DATE = DAY.strftime('%Y-%m-%d')
+
+
+def train(number, seats=SEATS, status='预订'):
+    return synthetic_train('ID' + number, number, 'BJP', 'BTC', '08:00', 120, seats, status)
+
+
+def changes(state, train_list):
+    return [(train_info[3], change) for train_info, change in state.update(train_list)]
+
+
+def test_update_reports_only_changes(stations):
+    state = LegState('BJP', 'BTC', TRAIN_DATE, stations)
+    assert changes(state, [train('G1'), train('G2', ('', '', '无', '', '', '', ''))]) == [
+        ('G1', '新增车次（有票）'), ('G2', '新增车次')]
+    assert [leg.train_number for leg in state.legs] == ['G1']
+    # 没有变化时不报告
+    assert changes(state, [train('G1'), train('G2', ('', '', '无', '', '', '', ''))]) == []
+    # G2 二等座来票，G1 停运
+    assert changes(state, [train('G1', status='列车停运'), train('G2', ('', '', '5', '', '', '', ''))]) == [
+        ('G1', '已停运'), ('G2', '二等座 无 → 5')]
+    assert [leg.train_number for leg in state.legs] == ['G2']
+    assert changes(state, [train('G2', ('', '', '5', '', '', '', ''))]) == [('G1', '已不在查询结果中')]
+
+
+def test_update_skips_filtered_trains(stations):
+    state = LegState('BJP', 'BTC', TRAIN_DATE, stations, train_filter=lambda number: number.startswith('G'))
+    assert changes(state, [train('G1'), train('K2')]) == [('G1', '新增车次（有票）')]
+    assert changes(state, [train('G1')]) == []